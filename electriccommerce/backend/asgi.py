@@ -0,0 +1,461 @@
+"""
+asgi.py - Asyncio serving mode (Starlette + aiomysql)
+
+Handles:
+- The read routes that spend their time waiting on MySQL, served on
+  asyncio: a waiting request holds a coroutine, and holds an aiomysql
+  connection only while its query runs, not a thread for its whole life
+- Running a composite endpoint's independent queries concurrently (the
+  checkout summary reads profile, default card and cart at once)
+- Every other route (writes, payment methods, products, admin) through the
+  Flask app mounted underneath, so the API surface is the same in both
+  modes
+
+Query text and JSON shaping come from main.py, so the async routes return
+exactly what their WSGI versions do - including the ETags and 304s of
+the conditional GETs (see versions.py). Native responses are gzipped by
+Starlette's GZipMiddleware (same MIN_COMPRESS_SIZE and gzip level, no
+brotli); the mounted Flask app compresses its own (see compression.py).
+
+Native async routes:
+    GET /api/health
+    GET /api/account/me
+    GET /api/cart
+    GET /api/orders
+    GET /api/checkout/summary
+    GET /api/metrics/async     (async pool and in-flight request counters)
+
+Usage (run from backend/):
+    uvicorn asgi:app --workers 4 --port 8000
+
+Environment:
+    ASYNC_DB_POOL_MIN / ASYNC_DB_POOL_SIZE   aiomysql pool bounds per worker
+                                             (default 1 / 20)
+    ASYNC_DB_POOL_TIMEOUT                    Seconds to wait for a connection
+                                             (default DB_POOL_TIMEOUT or 5)
+    CART_WRITE_BEHIND_LOCK                   Lock file that keeps a second
+                                             worker from starting while
+                                             CART_WRITE_BEHIND=1
+
+CART_WRITE_BEHIND=1 keeps carts in worker memory, so it needs a single
+worker, as under gunicorn (see gunicorn.conf.py).
+"""
+
+import asyncio
+import fcntl
+import logging
+import os
+import tempfile
+import time
+from contextlib import asynccontextmanager
+
+import aiomysql
+import jwt
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Mount, Route
+
+try:
+    from a2wsgi import WSGIMiddleware
+except ImportError:  # optional dependency; Starlette's own works too
+    from starlette.middleware.wsgi import WSGIMiddleware
+
+import main
+import versions
+from cartstore import CART_WRITE_BEHIND
+from compression import COMPRESS_ENABLED, COMPRESS_GZIP_LEVEL
+from db import PoolTimeout
+from idempotency import REPLAYED_HEADER
+from jsonprovider import dumps_bytes
+from pagination import NEXT_CURSOR_HEADER, InvalidQuery, decode_cursor, encode_cursor, parse_limit
+from payloads import MIN_COMPRESS_SIZE
+
+ASYNC_DB_POOL_MIN = int(os.environ.get("ASYNC_DB_POOL_MIN", "1"))
+ASYNC_DB_POOL_SIZE = int(os.environ.get("ASYNC_DB_POOL_SIZE", "20"))
+# Seconds a query may wait for a free connection before the request gets 503
+ASYNC_DB_POOL_TIMEOUT = float(os.environ.get("ASYNC_DB_POOL_TIMEOUT", os.environ.get("DB_POOL_TIMEOUT", "5")))
+CART_WRITE_BEHIND_LOCK = os.environ.get(
+    "CART_WRITE_BEHIND_LOCK", os.path.join(tempfile.gettempdir(), "ebuy-cart-write-behind.lock")
+)
+
+# The write-behind cart keeps carts in process memory (see cartstore.py):
+# two workers would each hold a different copy of the same cart
+if CART_WRITE_BEHIND and int(os.environ.get("WEB_CONCURRENCY", "1")) > 1:
+    raise SystemExit("CART_WRITE_BEHIND=1 needs WEB_CONCURRENCY=1 (carts live in worker memory)")
+
+log = logging.getLogger(__name__)
+
+
+class APIResponse(JSONResponse):
+    """JSON response encoded like the Flask app's (see jsonprovider.py)."""
+
+    def render(self, content):
+        return dumps_bytes(content)
+
+
+def error(msg, status):
+    return APIResponse({"errors": [{"msg": msg}]}, status_code=status)
+
+
+class Unauthorized(Exception):
+    """Missing or invalid Bearer token."""
+
+
+# ---------- DATABASE ----------
+
+class AsyncDB:
+    """
+    aiomysql pool plus the counters the load test reads.
+
+    Connections are taken per query and given back as soon as its rows
+    are read, so a request holds one only while MySQL is working for it.
+    """
+
+    def __init__(self):
+        self.pool = None
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.queries = 0
+        self.wait_time_total = 0.0
+
+    async def open(self):
+        config = main.DB_CONFIG
+        self.pool = await aiomysql.create_pool(
+            host=config["host"],
+            port=config.get("port", 3306),
+            user=config["user"],
+            password=config["password"],
+            db=config["database"],
+            minsize=ASYNC_DB_POOL_MIN,
+            maxsize=ASYNC_DB_POOL_SIZE,
+            autocommit=True,
+            cursorclass=aiomysql.DictCursor,
+        )
+
+    async def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            await self.pool.wait_closed()
+            self.pool = None
+
+    async def _run(self, query, params, one):
+        started = time.monotonic()
+        try:
+            conn = await asyncio.wait_for(self.pool.acquire(), ASYNC_DB_POOL_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise PoolTimeout(f"No connection free within {ASYNC_DB_POOL_TIMEOUT}s")
+        self.wait_time_total += time.monotonic() - started
+        self.in_use += 1
+        self.peak_in_use = max(self.peak_in_use, self.in_use)
+        self.queries += 1
+        try:
+            async with conn.cursor() as cur:
+                await cur.execute(query, params)
+                return await (cur.fetchone() if one else cur.fetchall())
+        finally:
+            self.in_use -= 1
+            self.pool.release(conn)
+
+    async def fetchone(self, query, params):
+        return await self._run(query, params, one=True)
+
+    async def fetchall(self, query, params):
+        return await self._run(query, params, one=False)
+
+    def stats(self):
+        queries = self.queries or 1
+        return {
+            "size": self.pool.size if self.pool else 0,
+            "free": self.pool.freesize if self.pool else 0,
+            "maxSize": ASYNC_DB_POOL_SIZE,
+            "inUse": self.in_use,
+            "peakInUse": self.peak_in_use,
+            "queries": self.queries,
+            "waitMsAvg": round(self.wait_time_total / queries * 1000, 3),
+        }
+
+
+db = AsyncDB()
+in_flight = {"now": 0, "peak": 0}
+
+
+def user_id_from(request):
+    """User id of the request's Bearer token (same cache as the WSGI routes)."""
+    header = request.headers.get("Authorization", "")
+    if not header.startswith("Bearer "):
+        raise Unauthorized("Missing or invalid Authorization header")
+    try:
+        return main.auth.verify(header.split(" ", 1)[1]).get("id")
+    except jwt.InvalidTokenError:
+        raise Unauthorized("Invalid or expired token")
+
+
+async def resource_etag(resource, user_id, *parts):
+    """ETag of a per-user resource from its version row (see versions.py)."""
+    row = await db.fetchone(versions.VERSION_SQL, (user_id, resource))
+    return versions.make_etag(resource, user_id, versions.version_from(row), *parts)
+
+
+def not_modified(request, etag):
+    """304 if the client's copy is current, else None."""
+    if not versions.etag_matches(etag, request.headers.get("if-none-match")):
+        return None
+    return Response(
+        status_code=304, headers={"ETag": etag, "Cache-Control": versions.PRIVATE_CACHE_CONTROL}
+    )
+
+
+def stamp(response, etag):
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = versions.PRIVATE_CACHE_CONTROL
+    return response
+
+
+async def cart_items(user_id):
+    """Cart lines in the GET /api/cart shape: (items, subtotal)."""
+    if CART_WRITE_BEHIND:
+        cart = await run_in_threadpool(main.cart_store.get, user_id)
+        return cart["items"], cart["subtotal"]
+    rows = await db.fetchall(main.CART_LINES_SQL, (user_id,))
+    return main.cart_lines_json(rows)
+
+
+def claim_single_worker():
+    """
+    Refuse to start a second worker while CART_WRITE_BEHIND=1.
+
+    `uvicorn --workers N` doesn't tell its workers how many there are, so
+    each one takes an exclusive lock on CART_WRITE_BEHIND_LOCK as it
+    starts; the second to try fails.
+
+    Returns:
+        File holding the lock (keep it open for the worker's lifetime)
+
+    Raises:
+        RuntimeError: Another worker already holds the lock
+    """
+    lock = open(CART_WRITE_BEHIND_LOCK, "a")
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock.close()
+        raise RuntimeError(
+            "CART_WRITE_BEHIND=1 needs a single worker (carts live in worker memory); "
+            f"another worker holds {CART_WRITE_BEHIND_LOCK}"
+        )
+    return lock
+
+
+# ---------- ROUTES ----------
+
+async def health(request):
+    return APIResponse({"ok": True})
+
+
+async def async_metrics(request):
+    return APIResponse({"pool": db.stats(), "inFlight": in_flight})
+
+
+async def get_account(request):
+    """Async GET /api/account/me."""
+    user_id = user_id_from(request)
+    etag = await resource_etag(versions.ACCOUNT, user_id)
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+    row = await db.fetchone(main.PROFILE_SQL, (user_id,))
+    if not row:
+        return error("User not found", 404)
+    return stamp(APIResponse(row), etag)
+
+
+async def get_cart(request):
+    """Async GET /api/cart."""
+    user_id = user_id_from(request)
+    catalog_token = main.catalog.version_token()
+    if CART_WRITE_BEHIND:
+        version = await run_in_threadpool(main.cart_store.version, user_id)
+        etag = versions.make_etag(versions.CART, user_id, version, catalog_token)
+    else:
+        etag = await resource_etag(versions.CART, user_id, catalog_token)
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+    items, subtotal = await cart_items(user_id)
+    return stamp(APIResponse({"items": items, "subtotal": subtotal}), etag)
+
+
+async def list_orders(request):
+    """Async GET /api/orders (keyset-paginated, see main.list_orders)."""
+    user_id = user_id_from(request)
+    try:
+        limit = parse_limit(request.query_params.get("limit"))
+        after = request.query_params.get("after")
+        after_key = decode_cursor(after, 2) if after else None
+    except InvalidQuery as e:
+        return error(str(e), 400)
+
+    etag = await resource_etag(
+        versions.ORDERS, user_id, main.catalog.version_token(), request.url.query
+    )
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+
+    # The items query needs the page's ids, so these two run in sequence
+    orders = await db.fetchall(*main.orders_page_query(user_id, after_key, limit + 1))
+    has_more = len(orders) > limit
+    orders = orders[:limit]
+    items = []
+    if orders:
+        items = await db.fetchall(*main.order_items_query([order["id"] for order in orders]))
+
+    response = stamp(APIResponse(main.orders_json(orders, items)), etag)
+    if has_more:
+        last = orders[-1]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(last["created_at"], last["id"])
+    return response
+
+
+async def checkout_summary(request):
+    """
+    Async GET /api/checkout/summary.
+
+    The three reads don't depend on each other, so they run at the same
+    time on separate connections: the request takes as long as the
+    slowest one instead of the sum.
+    """
+    user_id = user_id_from(request)
+    profile, method, (items, _) = await asyncio.gather(
+        db.fetchone(main.PROFILE_SQL, (user_id,)),
+        db.fetchone(main.DEFAULT_PAYMENT_METHOD_SQL, (user_id,)),
+        cart_items(user_id),
+    )
+    if not profile:
+        return error("User not found", 404)
+    return APIResponse(main.checkout_summary_json(profile, method, items))
+
+
+# ---------- APP ----------
+
+async def unauthorized(request, exc):
+    return error(str(exc), 401)
+
+
+async def pool_timeout(request, exc):
+    """Same answer as the WSGI app's PoolTimeout handler."""
+    log.warning("Async connection pool saturated: %s", exc)
+    response = error("Server busy, please retry", 503)
+    response.headers["Retry-After"] = "1"
+    return response
+
+
+async def server_error(request, exc):
+    log.exception(exc)
+    return error("Server error", 500)
+
+
+class InFlight:
+    """ASGI middleware counting concurrent HTTP requests (for the load test)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        in_flight["now"] += 1
+        in_flight["peak"] = max(in_flight["peak"], in_flight["now"])
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            in_flight["now"] -= 1
+
+
+class NativeGZip:
+    """
+    ASGI middleware gzipping the native routes' responses.
+
+    Requests for other paths go to the mounted Flask app untouched: its
+    Compressor already picked gzip/brotli (or sent pre-encoded payloads),
+    and Starlette's GZipMiddleware would encode them a second time.
+    """
+
+    def __init__(self, app, paths):
+        self.app = app
+        self.paths = frozenset(paths)
+        self.gzip = GZipMiddleware(app, minimum_size=MIN_COMPRESS_SIZE, compresslevel=COMPRESS_GZIP_LEVEL)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] in self.paths:
+            return await self.gzip(scope, receive, send)
+        return await self.app(scope, receive, send)
+
+
+def create_asgi_app(config=None):
+    """
+    Build the asyncio app.
+
+    Args:
+        config: Passed to main.create_app() for the mounted Flask app
+
+    Returns:
+        Starlette: Native async routes first, the Flask app for the rest
+    """
+    flask_app = main.create_app({"BACKGROUND_WORKERS": False, **(config or {})})
+
+    @asynccontextmanager
+    async def lifespan(app):
+        # Runs in each server worker process, after any fork
+        lock = claim_single_worker() if CART_WRITE_BEHIND else None
+        await db.open()
+        main.start_background(flask_app)
+        try:
+            yield
+        finally:
+            main.stop_background()
+            await db.close()
+            if lock is not None:
+                lock.close()
+
+    routes = [
+        Route("/api/health", health),
+        Route("/api/metrics/async", async_metrics),
+        Route("/api/account/me", get_account, methods=["GET"]),
+        Route("/api/cart", get_cart, methods=["GET"]),
+        Route("/api/orders", list_orders, methods=["GET"]),
+        Route("/api/checkout/summary", checkout_summary, methods=["GET"]),
+        Mount("/", app=WSGIMiddleware(flask_app)),
+    ]
+
+    middleware = [
+        Middleware(InFlight),
+        Middleware(
+            CORSMiddleware,
+            allow_origins=["*"],
+            allow_methods=["*"],
+            allow_headers=["*"],
+            expose_headers=[NEXT_CURSOR_HEADER, REPLAYED_HEADER],
+        ),
+    ]
+    if COMPRESS_ENABLED:
+        native_paths = [route.path for route in routes if isinstance(route, Route)]
+        middleware.append(Middleware(NativeGZip, paths=native_paths))
+
+    return Starlette(
+        routes=routes,
+        middleware=middleware,
+        exception_handlers={
+            Unauthorized: unauthorized,
+            PoolTimeout: pool_timeout,
+            aiomysql.Error: server_error,
+        },
+        lifespan=lifespan,
+    )
+
+
+app = create_asgi_app()
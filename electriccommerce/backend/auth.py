@@ -0,0 +1,157 @@
+"""
+auth.py - JWT authentication shared by every route module
+
+Handles:
+- Reading the Bearer token from the Authorization header
+- Decoding it at most once per request (claims are kept on flask.g)
+- A bounded LRU of verified token digests -> claims, so repeat requests on
+  a hot session skip signature verification entirely
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import jwt
+from flask import abort, g, request
+
+TOKEN_CACHE_SIZE = int(os.environ.get("TOKEN_CACHE_SIZE", "4096"))
+
+
+class TokenCache:
+    """
+    Thread-safe LRU of sha256(token) -> verified claims.
+
+    Only tokens that passed signature verification are stored, keyed by
+    digest so raw tokens never sit in memory longer than the request.
+    Entries for tokens carrying `exp` are dropped once they expire.
+    """
+
+    def __init__(self, max_size=TOKEN_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _digest(token):
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token):
+        """Return cached claims for a token, or None on a miss."""
+        key = self._digest(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                claims, expires_at = entry
+                if expires_at is None or expires_at > time.time():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return claims
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, token, claims):
+        """Remember the claims of a token that just passed verification."""
+        expires_at = claims.get("exp")
+        key = self._digest(token)
+        with self._lock:
+            self._entries[key] = (claims, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "maxSize": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+class Authenticator:
+    """
+    Verifies Bearer tokens signed with one secret.
+
+    Use claims() / user_id() inside a request; the result is stored on
+    flask.g so a route (and anything it calls) decodes the token once.
+    """
+
+    def __init__(self, secret, cache_size=TOKEN_CACHE_SIZE, algorithms=("HS256",)):
+        self.secret = secret
+        self.algorithms = list(algorithms)
+        self.cache = TokenCache(cache_size)
+
+    def claims(self):
+        """
+        Verified claims of the current request's token.
+
+        Returns:
+            dict: Token payload
+
+        Raises:
+            401: If token is missing, invalid, or expired
+        """
+        claims = g.get("_auth_claims")
+        if claims is not None:
+            return claims
+
+        auth_header = request.headers.get("Authorization")
+        if not auth_header or not auth_header.startswith("Bearer "):
+            abort(401, "Missing or invalid Authorization header")
+
+        token = auth_header.split(" ", 1)[1]
+        try:
+            claims = self.verify(token)
+        except jwt.InvalidTokenError:
+            abort(401, "Invalid or expired token")
+
+        g._auth_claims = claims
+        return claims
+
+    def verify(self, token):
+        """
+        Claims of a raw token, from the cache or by verifying it.
+
+        Needs no request context (the async routes use it directly).
+
+        Raises:
+            jwt.InvalidTokenError: Bad signature, malformed or expired
+        """
+        claims = self.cache.get(token)
+        if claims is None:
+            claims = jwt.decode(token, self.secret, algorithms=self.algorithms)
+            self.cache.put(token, claims)
+        return claims
+
+    def user_id(self):
+        """User ID of the current request's token (see claims())."""
+        return self.claims().get("id")
+
+    def stats(self):
+        return self.cache.stats()
+
+
+_authenticators = {}
+_authenticators_lock = threading.Lock()
+
+
+def authenticator_for(secret):
+    """
+    Shared Authenticator for a secret, so main.py and paymentsystem.py
+    use the same token cache.
+    """
+    with _authenticators_lock:
+        auth = _authenticators.get(secret)
+        if auth is None:
+            auth = _authenticators[secret] = Authenticator(secret)
+        return auth
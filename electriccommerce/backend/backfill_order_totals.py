@@ -0,0 +1,225 @@
+"""
+backfill_order_totals.py - Store subtotal and tax on existing orders
+
+Orders placed before the subtotal/tax columns existed only stored
+`total`, and that total left out tax (order history and the
+confirmation email added it on top). This command:
+
+- Adds orders.subtotal and orders.tax if they are missing
+- Walks orders with no stored subtotal in primary-key batches, computes
+  subtotal and tax from their order_items with the same Decimal
+  arithmetic as checkout (pricing.order_amounts), and writes them in one
+  short transaction per batch
+- Makes the columns NOT NULL once no row is left without them
+
+`total` is left as it is by default: it is the amount the customer was
+charged. --rewrite-total also sets it to subtotal + tax (the amount the
+order history page showed); run it with --dry-run first to see which
+orders that changes and by how much. The command is safe to re-run: only
+rows whose subtotal is still NULL are touched.
+
+Orders without any order_items are skipped and listed: there is nothing
+to compute their amounts from (and the columns stay nullable until they
+are dealt with by hand).
+
+Run it before deploying the code that writes the new columns.
+
+Usage (run from backend/):
+    python backfill_order_totals.py --batch 1000
+    python backfill_order_totals.py --rewrite-total --dry-run
+"""
+
+import argparse
+import json
+import sys
+import time
+from decimal import Decimal
+
+from db import BlockingPool, db_config_from_env, run_transaction
+from pricing import order_amounts
+
+# Changed totals listed in the --rewrite-total report
+MAX_REPORTED_CHANGES = 100
+
+
+def missing_columns(cur):
+    """Which of orders.subtotal / orders.tax don't exist yet."""
+    cur.execute(
+        """
+        SELECT column_name AS name
+        FROM information_schema.columns
+        WHERE table_schema = DATABASE() AND table_name = 'orders'
+          AND column_name IN ('subtotal', 'tax')
+        """
+    )
+    existing = {row["name"].lower() for row in cur.fetchall()}
+    return [column for column in ("subtotal", "tax") if column not in existing]
+
+
+def ensure_columns(cur):
+    """Add orders.subtotal / orders.tax (nullable) if they don't exist yet."""
+    added = missing_columns(cur)
+    if "subtotal" in added:
+        cur.execute("ALTER TABLE orders ADD COLUMN subtotal DECIMAL(10,2) NULL AFTER user_id")
+    if "tax" in added:
+        cur.execute("ALTER TABLE orders ADD COLUMN tax DECIMAL(10,2) NULL AFTER subtotal")
+    return added
+
+
+def backfill_batch(cur, after_id, batch_size, rewrite_total=False, dry_run=False, pending_only=True):
+    """
+    Fill one batch of orders that have no stored subtotal.
+
+    Args:
+        cur: Dictionary cursor
+        after_id: Last order id of the previous batch
+        batch_size: Orders per batch
+        rewrite_total: Also set total = subtotal + tax
+        dry_run: Compute and report, write nothing
+        pending_only: Only orders whose subtotal is NULL (False when a dry
+                      run finds the columns don't exist yet)
+
+    Returns:
+        tuple: (orders updated, ids skipped for having no order_items,
+                [(id, old total, new total)] for totals that would change,
+                last id of the batch or None)
+    """
+    pending = "subtotal IS NULL AND" if pending_only else ""
+    cur.execute(
+        f"""
+        SELECT id, total FROM orders
+        WHERE {pending} id > %s
+        ORDER BY id
+        LIMIT %s
+        {"" if dry_run else "FOR UPDATE"}
+        """,
+        (after_id, batch_size),
+    )
+    totals = {row["id"]: row["total"] for row in cur.fetchall()}
+    if not totals:
+        return 0, [], [], None
+    ids = list(totals)
+
+    lines = {order_id: [] for order_id in ids}
+    placeholders = ", ".join(["%s"] * len(ids))
+    cur.execute(
+        f"SELECT order_id, unit_price, quantity FROM order_items WHERE order_id IN ({placeholders})",
+        ids,
+    )
+    for row in cur.fetchall():
+        lines[row["order_id"]].append((row["unit_price"], row["quantity"]))
+
+    skipped = [order_id for order_id, order_lines in lines.items() if not order_lines]
+    amounts = {
+        order_id: order_amounts(order_lines)
+        for order_id, order_lines in lines.items()
+        if order_lines
+    }
+    changes = [
+        (order_id, totals[order_id], total)
+        for order_id, (_, _, total) in amounts.items()
+        if rewrite_total and total != totals[order_id]
+    ]
+
+    if amounts and not dry_run:
+        if rewrite_total:
+            cur.executemany(
+                "UPDATE orders SET subtotal = %s, tax = %s, total = %s WHERE id = %s",
+                [(*amount, order_id) for order_id, amount in amounts.items()],
+            )
+        else:
+            cur.executemany(
+                "UPDATE orders SET subtotal = %s, tax = %s WHERE id = %s",
+                [(subtotal, tax, order_id) for order_id, (subtotal, tax, _) in amounts.items()],
+            )
+    return len(amounts), skipped, changes, ids[-1]
+
+
+def enforce_not_null(cur):
+    """Make the columns NOT NULL if every row has them; returns True if done."""
+    cur.execute("SELECT COUNT(*) AS n FROM orders WHERE subtotal IS NULL OR tax IS NULL")
+    if cur.fetchone()["n"]:
+        return False
+    cur.execute(
+        "ALTER TABLE orders MODIFY subtotal DECIMAL(10,2) NOT NULL, MODIFY tax DECIMAL(10,2) NOT NULL"
+    )
+    return True
+
+
+def backfill(args):
+    pool = BlockingPool(db_config_from_env(), size=1, name="backfill_order_totals")
+    started = time.monotonic()
+
+    if args.dry_run:
+        missing = run_transaction(pool, missing_columns)
+        if missing:
+            print(f"Would add columns: {', '.join(missing)}", file=sys.stderr)
+    else:
+        missing = []
+        added = run_transaction(pool, ensure_columns)
+        if added:
+            print(f"Added columns: {', '.join(added)}", file=sys.stderr)
+
+    updated = 0
+    skipped = []
+    changes = []
+    after_id = ""
+    while True:
+        count, batch_skipped, batch_changes, last_id = run_transaction(
+            pool,
+            lambda cur: backfill_batch(
+                cur, after_id, args.batch, args.rewrite_total, args.dry_run, not missing
+            ),
+        )
+        if last_id is None:
+            break
+        updated += count
+        skipped += batch_skipped
+        changes += batch_changes
+        after_id = last_id
+        verb = "to backfill" if args.dry_run else "backfilled"
+        print(f"  {updated:,} orders {verb}, {len(skipped):,} skipped (last id {last_id})",
+              file=sys.stderr)
+        if args.pause:
+            time.sleep(args.pause)
+
+    if skipped:
+        print(f"Skipped {len(skipped):,} orders with no order_items; subtotal/tax stay NULL",
+              file=sys.stderr)
+
+    enforced = False
+    if not (args.keep_nullable or args.dry_run):
+        enforced = run_transaction(pool, enforce_not_null)
+    report = {
+        "dryRun": args.dry_run,
+        "updated": updated,
+        "skippedNoItems": skipped,
+        "notNull": enforced,
+        "seconds": round(time.monotonic() - started, 3),
+    }
+    if args.rewrite_total:
+        report["totalsChanged"] = len(changes)
+        report["totalsDifference"] = str(sum((new - old for _, old, new in changes), Decimal("0.00")))
+        report["changes"] = [
+            {"id": order_id, "total": str(old), "newTotal": str(new)}
+            for order_id, old, new in changes[:MAX_REPORTED_CHANGES]
+        ]
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch", type=int, default=1000, help="orders per transaction")
+    parser.add_argument("--pause", type=float, default=0.0, help="seconds to sleep between batches")
+    parser.add_argument("--keep-nullable", action="store_true",
+                        help="don't make the columns NOT NULL at the end (old code still running)")
+    parser.add_argument("--rewrite-total", action="store_true",
+                        help="also set total = subtotal + tax (changes charged amounts)")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="report what would be written (and which totals change) without writing")
+    sys.exit(backfill(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""
+async_load.py - Side-by-side load test of the WSGI and asyncio serving modes
+
+Opens --clients keep-alive connections (default 1000) against each server in
+turn. Every client loops on one authenticated GET (default the checkout
+summary, which the async mode answers with three concurrent queries). The
+test reports requests/sec, latency percentiles and errors, and samples
+MySQL's Threads_connected / Threads_running every 250 ms to show how many
+connections each mode holds.
+
+Start both servers on the same database first, e.g. (from backend/):
+    WEB_CONCURRENCY=4 BIND=127.0.0.1:8000 gunicorn -c gunicorn.conf.py wsgi:app
+    uvicorn asgi:app --workers 4 --port 8001
+
+Usage (run from backend/):
+    python benchmarks/async_load.py --clients 1000 --duration 20
+    python benchmarks/async_load.py --path /orders --targets asgi
+"""
+
+import argparse
+import asyncio
+import resource
+import statistics
+import threading
+import time
+import urllib.parse
+
+import mysql.connector
+
+from checkout_concurrency import DB_CONFIG, fill_carts, login_users, seed_products
+
+
+def raise_fd_limit(needed):
+    """Let this process open `needed` sockets (up to the hard limit)."""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    want = min(hard, max(soft, needed + 256))
+    if want > soft:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (want, hard))
+    return want
+
+
+class MySQLSampler(threading.Thread):
+    """Polls Threads_connected / Threads_running while the load runs."""
+
+    def __init__(self, interval=0.25):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.samples = []
+        self._done = threading.Event()
+
+    def run(self):
+        conn = mysql.connector.connect(**DB_CONFIG)
+        cur = conn.cursor()
+        try:
+            while not self._done.wait(self.interval):
+                cur.execute(
+                    "SHOW GLOBAL STATUS WHERE Variable_name IN ('Threads_connected', 'Threads_running')"
+                )
+                status = {name: int(value) for name, value in cur.fetchall()}
+                self.samples.append((status["Threads_connected"], status["Threads_running"]))
+        finally:
+            cur.close()
+            conn.close()
+
+    def stop(self):
+        self._done.set()
+        self.join()
+        return self.samples
+
+
+async def read_response(reader):
+    """Read one HTTP/1.1 response; returns the status code."""
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("server closed the connection")
+    status = int(status_line.split()[1])
+    length = 0
+    chunked = False
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        name = name.strip().lower()
+        if name == "content-length":
+            length = int(value)
+        elif name == "transfer-encoding" and "chunked" in value.lower():
+            chunked = True
+    if chunked:
+        while True:
+            size = int((await reader.readline()).split(b";")[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    elif length:
+        await reader.readexactly(length)
+    return status
+
+
+async def client(host, port, request_bytes, deadline, latencies, errors):
+    """One keep-alive connection sending requests until the deadline."""
+    reader = writer = None
+    while time.monotonic() < deadline:
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+            started = time.monotonic()
+            writer.write(request_bytes)
+            status = await read_response(reader)
+            if status == 200:
+                latencies.append(time.monotonic() - started)
+            else:
+                errors[status] = errors.get(status, 0) + 1
+        except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError) as e:
+            errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+            if writer is not None:
+                writer.close()
+            reader = writer = None
+            await asyncio.sleep(0.05)
+    if writer is not None:
+        writer.close()
+
+
+async def run_load(base_url, path, tokens, clients, duration):
+    url = urllib.parse.urlsplit(base_url)
+    host, port = url.hostname, url.port or 80
+    requests = [
+        (f"GET {url.path}{path} HTTP/1.1\r\nHost: {url.netloc}\r\n"
+         f"Authorization: Bearer {token}\r\nConnection: keep-alive\r\n\r\n").encode()
+        for token in tokens
+    ]
+    latencies = []
+    errors = {}
+    deadline = time.monotonic() + duration
+    await asyncio.gather(*[
+        client(host, port, requests[i % len(requests)], deadline, latencies, errors)
+        for i in range(clients)
+    ])
+    return latencies, errors
+
+
+def percentile(values, pct):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--wsgi-url", default="http://127.0.0.1:8000/api")
+    parser.add_argument("--asgi-url", default="http://127.0.0.1:8001/api")
+    parser.add_argument("--targets", default="wsgi,asgi", type=lambda v: v.split(","))
+    parser.add_argument("--path", default="/checkout/summary", help="GET path under the API base URL")
+    parser.add_argument("--clients", type=int, default=1000, help="concurrent keep-alive connections")
+    parser.add_argument("--users", type=int, default=50, help="distinct logged-in users")
+    parser.add_argument("--lines", type=int, default=5, help="cart lines per user")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds per target")
+    args = parser.parse_args()
+
+    print(f"fd limit: {raise_fd_limit(args.clients)}")
+    urls = {"wsgi": args.wsgi_url, "asgi": args.asgi_url}
+
+    users = login_users(urls[args.targets[0]], args.users)
+    conn = mysql.connector.connect(**DB_CONFIG)
+    try:
+        seed_products(conn)
+        fill_carts(conn, [uid for uid, _ in users], args.lines)
+    finally:
+        conn.close()
+    tokens = [token for _, token in users]
+
+    print(f"{args.clients} clients, GET {args.path}, {args.duration:.0f}s per target\n")
+    print(f"{'target':>6} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7} "
+          f"{'conns max':>10} {'conns avg':>10} {'running max':>12}")
+    for target in args.targets:
+        sampler = MySQLSampler()
+        sampler.start()
+        started = time.monotonic()
+        latencies, errors = asyncio.run(run_load(urls[target], args.path, tokens, args.clients, args.duration))
+        elapsed = time.monotonic() - started
+        samples = sampler.stop() or [(0, 0)]
+
+        connected = [c for c, _ in samples]
+        running = [r for _, r in samples]
+        print(f"{target:>6} {len(latencies) / elapsed:>9.0f} "
+              f"{percentile(latencies, 50) * 1000:>8.1f} {percentile(latencies, 99) * 1000:>8.1f} "
+              f"{sum(errors.values()):>7} {max(connected):>10} {statistics.mean(connected):>10.1f} "
+              f"{max(running):>12}")
+        if errors:
+            print(f"        errors: {errors}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+"""
+checkout_concurrency.py - Concurrent checkout benchmark
+
+Seeds benchmark users, products and carts directly in MySQL, then fires
+checkouts at a running backend from many threads and reports throughput
+and per-purchase latency percentiles per cart size.
+
+Flows (--flow, default 'orders'):
+    orders     POST /api/orders only (order left pending)
+    two-step   POST /api/orders then POST /api/payments/mock
+    one-shot   POST /api/checkout (order, payment and cart clear in one transaction)
+    compare    two-step and one-shot, one after the other
+
+Usage (backend running on :8000, run from backend/):
+    python benchmarks/checkout_concurrency.py --lines 1,10,100 --users 20 --rounds 5
+    python benchmarks/checkout_concurrency.py --flow compare --users 1 --rounds 50
+
+With --same-user every thread checks out the SAME cart at once; exactly
+one checkout per round should succeed and the rest should see an empty
+cart (no double orders).
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import mysql.connector
+
+DB_CONFIG = {
+    "host": os.environ.get("DB_HOST", "localhost"),
+    "user": os.environ.get("DB_USER", "ebuy_user"),
+    "password": os.environ.get("DB_PASSWORD", "Software5432"),
+    "database": os.environ.get("DB_NAME", "ebuy_app"),
+}
+
+BENCH_PASSWORD = "bench_password_123"
+BENCH_SKU_COUNT = 100
+
+
+def http_json(method, url, body=None, token=None, headers=None):
+    """Send a JSON request and return (status, parsed body)."""
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(url, data=data, method=method)
+    req.add_header("Content-Type", "application/json")
+    if token:
+        req.add_header("Authorization", f"Bearer {token}")
+    for key, value in (headers or {}).items():
+        req.add_header(key, value)
+    try:
+        with urllib.request.urlopen(req) as res:
+            return res.status, json.loads(res.read() or b"null")
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read() or b"null")
+
+
+def seed_products(conn):
+    """Create the benchmark SKUs (enough for a 100-line cart)."""
+    cur = conn.cursor()
+    cur.executemany(
+        """
+        INSERT INTO products (id, name, price)
+        VALUES (%s, %s, %s)
+        ON DUPLICATE KEY UPDATE price = VALUES(price)
+        """,
+        [(f"bench-sku-{i:04d}", f"Bench SKU {i}", 10 + i % 50) for i in range(BENCH_SKU_COUNT)],
+    )
+    conn.commit()
+    cur.close()
+
+
+def login_users(base_url, count):
+    """Register (if needed) and log in the benchmark users."""
+    users = []
+    for i in range(count):
+        email = f"bench{i}@example.com"
+        http_json("POST", f"{base_url}/auth/register", {
+            "first_name": "Bench",
+            "last_name": f"User{i}",
+            "email": email,
+            "password": BENCH_PASSWORD,
+        })
+        status, body = http_json("POST", f"{base_url}/auth/login", {
+            "email": email,
+            "password": BENCH_PASSWORD,
+        })
+        if status != 200:
+            raise SystemExit(f"login failed for {email}: {status} {body}")
+        users.append((body["user"]["id"], body["token"]))
+    return users
+
+
+def fill_carts(conn, user_ids, lines):
+    """Put `lines` distinct products in each user's cart."""
+    cur = conn.cursor()
+    cur.executemany(
+        "DELETE FROM cart_items WHERE user_id = %s",
+        [(uid,) for uid in user_ids],
+    )
+    cur.executemany(
+        """
+        INSERT INTO cart_items (demo_token, user_id, product_id, quantity)
+        VALUES (%s, %s, %s, %s)
+        """,
+        [
+            (f"user_{uid}", uid, f"bench-sku-{i:04d}", 1 + i % 3)
+            for uid in user_ids
+            for i in range(lines)
+        ],
+    )
+    conn.commit()
+    cur.close()
+
+
+SHIPPING = {
+    "shippingName": "Bench User",
+    "shippingAddress": "1 Benchmark Way",
+}
+
+
+def purchase_orders(base_url, token):
+    status, _ = http_json("POST", f"{base_url}/orders", SHIPPING, token=token)
+    return status == 201
+
+
+def purchase_two_step(base_url, token):
+    status, order = http_json("POST", f"{base_url}/orders", SHIPPING, token=token)
+    if status != 201:
+        return False
+    status, _ = http_json("POST", f"{base_url}/payments/mock", {"orderId": order["id"]}, token=token)
+    return status == 200
+
+
+def purchase_one_shot(base_url, token):
+    status, _ = http_json("POST", f"{base_url}/checkout", SHIPPING, token=token)
+    return status == 201
+
+
+FLOWS = {
+    "orders": [("orders", purchase_orders)],
+    "two-step": [("two-step", purchase_two_step)],
+    "one-shot": [("one-shot", purchase_one_shot)],
+    "compare": [("two-step", purchase_two_step), ("one-shot", purchase_one_shot)],
+}
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run(args):
+    base_url = args.base_url.rstrip("/")
+    conn = mysql.connector.connect(**DB_CONFIG)
+    seed_products(conn)
+    users = login_users(base_url, 1 if args.same_user else args.users)
+
+    print(f"{'flow':>9} {'lines':>6} {'checkouts':>10} {'ok':>6} {'orders/s':>10} {'p50 ms':>8} {'p99 ms':>8}")
+    for lines in args.lines:
+        for flow_name, purchase in FLOWS[args.flow]:
+            run_flow(args, conn, base_url, users, lines, flow_name, purchase)
+
+    conn.close()
+
+
+def run_flow(args, conn, base_url, users, lines, flow_name, purchase):
+    """Run one flow for one cart size and print a result row."""
+    latencies = []
+    statuses = []
+    lock = threading.Lock()
+    elapsed = 0.0
+
+    def checkout(token):
+        start = time.perf_counter()
+        ok = purchase(base_url, token)
+        took = time.perf_counter() - start
+        with lock:
+            latencies.append(took)
+            statuses.append(ok)
+
+    for _ in range(args.rounds):
+        fill_carts(conn, [uid for uid, _ in users], lines)
+        tokens = [token for _, token in users]
+        if args.same_user:
+            tokens = tokens * args.users
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(tokens)) as executor:
+            list(executor.map(checkout, tokens))
+        elapsed += time.perf_counter() - started
+
+    ok = statuses.count(True)
+    print(
+        f"{flow_name:>9} {lines:>6} {len(statuses):>10} {ok:>6} {ok / elapsed:>10.1f} "
+        f"{percentile(latencies, 50) * 1000:>8.1f} {percentile(latencies, 99) * 1000:>8.1f}"
+    )
+    if args.same_user and ok != args.rounds:
+        print(f"  !! expected {args.rounds} orders from duplicate checkouts, got {ok}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000/api")
+    parser.add_argument("--lines", default="1,10,100",
+                        type=lambda v: [int(x) for x in v.split(",")])
+    parser.add_argument("--users", type=int, default=20, help="concurrent checkouts per round")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--flow", choices=sorted(FLOWS), default="orders")
+    parser.add_argument("--same-user", action="store_true",
+                        help="all threads check out the same user's cart")
+    args = parser.parse_args()
+    if max(args.lines) > BENCH_SKU_COUNT:
+        parser.error(f"--lines can be at most {BENCH_SKU_COUNT}")
+    run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+cipher_throughput.py - Plaintext throughput of the card vault cipher engines
+
+Measures plaintext MB/s and rows/s for:
+- the old per-byte XOR loop (simple_encrypt before vault.py)
+- vault.XorCipher, one row at a time and through CardVault.encrypt_many
+- vault.AesGcmCipher (when the cryptography package is installed)
+
+Usage (run from backend/):
+    python benchmarks/cipher_throughput.py --rows 10000 --size 16
+"""
+
+import argparse
+import base64
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import vault  # noqa: E402
+
+KEY = "dev_payment_key_change_in_production"
+
+
+def legacy_encrypt(data, key):
+    """The original per-byte loop, kept here as the baseline."""
+    key_bytes = key.encode()
+    data_bytes = data.encode()
+    encrypted = bytearray()
+    for i, byte in enumerate(data_bytes):
+        encrypted.append(byte ^ key_bytes[i % len(key_bytes)])
+    return base64.b64encode(encrypted).decode()
+
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def report(name, rows, size, seconds):
+    mb = rows * size / 1e6
+    print(f"{name:<34} {rows / seconds:>12,.0f} {mb / seconds:>10.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--size", type=int, default=16, help="plaintext bytes per row")
+    args = parser.parse_args()
+
+    plaintexts = [str(4000000000000000 + i).rjust(args.size, "0")[:args.size] for i in range(args.rows)]
+
+    print(f"{'engine':<34} {'rows/s':>12} {'MB/s':>10}")
+    report("legacy per-byte XOR", args.rows, args.size,
+           timed(lambda: [legacy_encrypt(p, KEY) for p in plaintexts]))
+
+    engines = [("xor", vault.XorCipher.scheme)]
+    if vault.AESGCM is not None:
+        engines.append(("aes-gcm", vault.AesGcmCipher.scheme))
+    else:
+        print("(aes-gcm skipped: cryptography is not installed)")
+
+    for label, scheme in engines:
+        card_vault = vault.CardVault(vault.make_engine(KEY, cipher=scheme))
+        encrypted = card_vault.encrypt_many(plaintexts)
+        assert card_vault.decrypt_many(encrypted) == plaintexts
+
+        report(f"{label} encrypt (per row)", args.rows, args.size,
+               timed(lambda: [card_vault.encrypt(p) for p in plaintexts]))
+        report(f"{label} encrypt_many", args.rows, args.size,
+               timed(lambda: card_vault.encrypt_many(plaintexts)))
+        report(f"{label} decrypt_many", args.rows, args.size,
+               timed(lambda: card_vault.decrypt_many(encrypted)))
+
+
+if __name__ == "__main__":
+    main()
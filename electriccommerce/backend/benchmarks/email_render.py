@@ -0,0 +1,106 @@
+"""
+email_render.py - Per-email render time and allocations for order confirmations
+
+Compares the precompiled templates in email_templates.py against the old
+approach (template text processed on every call, item rows built with
+`items_html +=`) for orders of 1 to 500 lines.
+
+Usage (run from backend/):
+    python benchmarks/email_render.py --lines 1,10,100,500 --repeat 200
+"""
+
+import argparse
+import os
+import re
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import email_templates  # noqa: E402
+
+_SLOT_RE = re.compile(r"\{\{(\w+)\}\}")
+
+
+def legacy_render(values, items):
+    """Old-style render: substitute on every call and concatenate rows."""
+    fmt = email_templates.format_currency
+    items_html = ""
+    for item in items:
+        line_total = item["price"] * item["qty"]
+        row_values = {
+            "product_name": item["productName"],
+            "qty": item["qty"],
+            "price": fmt(item["price"]),
+            "line_total": fmt(line_total),
+        }
+        items_html += _SLOT_RE.sub(
+            lambda m: str(row_values[m.group(1)]), email_templates.ORDER_ITEM_ROW_SOURCE
+        )
+    doc_values = dict(values, items=items_html)
+    return _SLOT_RE.sub(
+        lambda m: str(doc_values[m.group(1)]), email_templates.ORDER_CONFIRMATION_SOURCE
+    )
+
+
+def compiled_render(values, items, buf):
+    return email_templates.render_order_confirmation(values, items, buf=buf)
+
+
+def sample_order(lines):
+    values = {
+        "order_id": "a1b2c3d4e5f6",
+        "order_date": "January 02, 2026",
+        "delivery_date": "January 06, 2026",
+        "tracking_number": "9274899912345678901234",
+        "subtotal": "$0.00",
+        "tax": "$0.00",
+        "total": "$0.00",
+        "shipping_name": "Bench User",
+        "shipping_address": "1 Benchmark Way, Springfield",
+        "user_email": "bench@example.com",
+    }
+    items = [
+        {"productName": f"Product {i}", "qty": 1 + i % 3, "price": 10.0 + i}
+        for i in range(lines)
+    ]
+    return values, items
+
+
+def measure(render, repeat):
+    """Return (microseconds per email, peak KiB allocated while rendering one)."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        render()
+    per_call = (time.perf_counter() - start) / repeat
+
+    tracemalloc.start()
+    render()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return per_call * 1e6, peak / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", default="1,10,50,100,500",
+                        type=lambda v: [int(x) for x in v.split(",")])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'lines':>6} {'legacy us':>11} {'compiled us':>12} {'speedup':>8} "
+          f"{'legacy peak KiB':>16} {'compiled peak KiB':>18}")
+    buf = []
+    for lines in args.lines:
+        values, items = sample_order(lines)
+        assert legacy_render(values, items) == compiled_render(values, items, buf)
+
+        legacy_us, legacy_kib = measure(lambda: legacy_render(values, items), args.repeat)
+        compiled_us, compiled_kib = measure(lambda: compiled_render(values, items, buf), args.repeat)
+        print(f"{lines:>6} {legacy_us:>11.1f} {compiled_us:>12.1f} {legacy_us / compiled_us:>7.1f}x "
+              f"{legacy_kib:>16.1f} {compiled_kib:>18.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+json_encoding.py - Response building + JSON encoding time for list payloads
+
+Compares, for GET /api/orders and GET /api/payment-methods payloads of 10,
+100 and 1000 rows (orders carry 3 items each):
+
+    legacy   hand-built dicts with float()/isoformat() per value, then the
+             stdlib encoder configured like Flask's default provider
+             (sort_keys, ensure_ascii)
+    mapped   rows passed through RowMapper and encoded by
+             jsonprovider.dumps_bytes (orjson when installed)
+
+Rows are built the way mysql.connector's dictionary cursor returns them
+(Decimal amounts, datetime columns). No database or server needed.
+
+Usage (run from backend/):
+    python benchmarks/json_encoding.py --rows 10,100,1000 --repeat 50
+"""
+
+import argparse
+import datetime
+import json
+import os
+import sys
+import time
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import jsonprovider  # noqa: E402
+from paymentsystem import PAYMENT_METHOD_ROW  # noqa: E402
+from main import orders_json  # noqa: E402
+
+ITEMS_PER_ORDER = 3
+
+
+def flask_default_dumps(obj):
+    """Encode like Flask's DefaultJSONProvider in production mode."""
+    def default(value):
+        if isinstance(value, Decimal):
+            return str(value)
+        if isinstance(value, datetime.date):
+            return value.isoformat()
+        raise TypeError(type(value).__name__)
+    return json.dumps(obj, default=default, ensure_ascii=True, sort_keys=True,
+                      separators=(",", ":")).encode()
+
+
+def sample_orders(count):
+    now = datetime.datetime(2026, 1, 1, 12, 0, 0)
+    orders, items = [], []
+    for i in range(count):
+        order_id = f"ord{i:09d}"
+        orders.append({
+            "id": order_id, "subtotal": Decimal("59.97"), "tax": Decimal("4.80"),
+            "total": Decimal("64.77"), "status": "paid",
+            "created_at": now - datetime.timedelta(minutes=i), "paid_at": now,
+            "shipping_name": "Bench User", "shipping_email": "bench@example.com",
+            "shipping_phone": "555-0100", "shipping_address": "1 Bench St, Springfield",
+        })
+        for j in range(ITEMS_PER_ORDER):
+            items.append({
+                "order_id": order_id, "product_id": f"sku-{j}", "quantity": j + 1,
+                "unit_price": Decimal("19.99"), "product_name": f"Product {j}",
+            })
+    return orders, items
+
+
+def sample_payment_methods(count):
+    now = datetime.datetime(2026, 1, 1, 12, 0, 0)
+    return [
+        {
+            "id": i, "card_type": "Visa", "cardholder_name": "Bench User",
+            "last_four_digits": f"{i % 10000:04d}", "expiry_date": "12/29",
+            "billing_zip": "12345", "is_default": int(i == 0), "created_at": now,
+        }
+        for i in range(count)
+    ]
+
+
+def legacy_orders(orders, items):
+    items_by_order = {order["id"]: [] for order in orders}
+    for item in items:
+        items_by_order[item["order_id"]].append(item)
+    result = []
+    for order in orders:
+        result.append({
+            "id": order["id"],
+            "total": float(order["total"]),
+            "subtotal": float(order["subtotal"]),
+            "tax": float(order["tax"]),
+            "status": order["status"],
+            "createdAt": order["created_at"].isoformat() if order["created_at"] else None,
+            "paidAt": order["paid_at"].isoformat() if order["paid_at"] else None,
+            "shippingName": order.get("shipping_name"),
+            "shippingEmail": order.get("shipping_email"),
+            "shippingPhone": order.get("shipping_phone"),
+            "shippingAddress": order.get("shipping_address"),
+            "items": [
+                {
+                    "productId": item["product_id"],
+                    "productName": item["product_name"],
+                    "name": item["product_name"],
+                    "quantity": item["quantity"],
+                    "unitPrice": float(item["unit_price"]),
+                    "qty": item["quantity"],
+                    "price": float(item["unit_price"]),
+                }
+                for item in items_by_order[order["id"]]
+            ],
+        })
+    return flask_default_dumps(result)
+
+
+def legacy_payment_methods(methods):
+    result = []
+    for method in methods:
+        result.append({
+            "id": method["id"],
+            "cardType": method["card_type"],
+            "cardholderName": method["cardholder_name"],
+            "lastFourDigits": method["last_four_digits"],
+            "expiryDate": method["expiry_date"],
+            "billingZip": method["billing_zip"],
+            "isDefault": bool(method["is_default"]),
+            "createdAt": method["created_at"].isoformat() if method["created_at"] else None,
+        })
+    return flask_default_dumps(result)
+
+
+def measure(fn, repeat):
+    fn()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", default="10,100,1000", type=lambda v: [int(x) for x in v.split(",")])
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"encoder: {jsonprovider.encoder_name()}\n")
+    print(f"{'payload':>16} {'rows':>6} {'legacy us':>11} {'mapped us':>11} {'speedup':>8} {'bytes':>9}")
+    for rows in args.rows:
+        orders, items = sample_orders(rows)
+        methods = sample_payment_methods(rows)
+        cases = [
+            ("orders", lambda: legacy_orders(orders, items),
+             lambda: jsonprovider.dumps_bytes(orders_json(orders, items))),
+            ("payment-methods", lambda: legacy_payment_methods(methods),
+             lambda: jsonprovider.dumps_bytes(PAYMENT_METHOD_ROW.many(methods))),
+        ]
+        for name, legacy, mapped in cases:
+            assert json.loads(legacy()) == json.loads(mapped())
+            legacy_us = measure(legacy, args.repeat)
+            mapped_us = measure(mapped, args.repeat)
+            print(f"{name:>16} {rows:>6} {legacy_us:>11.1f} {mapped_us:>11.1f} "
+                  f"{legacy_us / mapped_us:>7.1f}x {len(mapped()):>9}")
+
+
+if __name__ == "__main__":
+    main()
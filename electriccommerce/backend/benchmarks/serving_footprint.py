@@ -0,0 +1,156 @@
+"""
+serving_footprint.py - Startup time and per-worker memory of the gunicorn setup
+
+Measures:
+- Cold import + create_app() time and peak RSS in a fresh interpreter
+  (no database needed: the pool opens on first use)
+- Time from launching gunicorn (gunicorn.conf.py) until /api/health answers
+- RSS and PSS (RSS with shared pages split between the processes sharing
+  them, from /proc/<pid>/smaps_rollup) of the master and each worker, with
+  and without preload_app
+
+Optionally sends --warm GET /api/products requests first, so the workers
+have opened their pools and loaded the catalog (needs the database).
+
+Linux only (reads /proc). Usage (run from backend/):
+    python benchmarks/serving_footprint.py --workers 4
+    python benchmarks/serving_footprint.py --workers 8 --warm 200
+"""
+
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_PROBE = """
+import resource, time
+started = time.perf_counter()
+import main
+main.create_app({"BACKGROUND_WORKERS": False})
+elapsed = time.perf_counter() - started
+print(elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+
+def measure_import():
+    """Seconds to import main and build the app, and peak RSS in KiB."""
+    out = subprocess.run(
+        [sys.executable, "-c", IMPORT_PROBE],
+        cwd=BACKEND_DIR, check=True, capture_output=True, text=True,
+    ).stdout.split()
+    return float(out[-2]), int(out[-1])
+
+
+def memory_kib(pid):
+    """(RSS, PSS) of a process in KiB (PSS is None if unavailable)."""
+    rss = pss = None
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                rss = int(line.split()[1])
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    pss = int(line.split()[1])
+    except OSError:
+        pass
+    return rss, pss
+
+
+def children(pid):
+    """Direct child pids of a process."""
+    found = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # comm may contain spaces; ppid is the 2nd field after ')'
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if ppid == pid:
+            found.append(int(entry))
+    return sorted(found)
+
+
+def get(url):
+    try:
+        with urllib.request.urlopen(url, timeout=5) as res:
+            res.read()
+            return res.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def run_server(workers, preload, port, warm, timeout):
+    """Start gunicorn, wait for it, measure, and stop it gracefully."""
+    env = {
+        **os.environ,
+        "BIND": f"127.0.0.1:{port}",
+        "WEB_CONCURRENCY": str(workers),
+        "PRELOAD_APP": "1" if preload else "0",
+    }
+    base_url = f"http://127.0.0.1:{port}"
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "wsgi:app"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while True:
+            if proc.poll() is not None:
+                raise SystemExit(f"gunicorn exited with {proc.returncode}")
+            if time.perf_counter() - started > timeout:
+                raise SystemExit("gunicorn did not answer /api/health in time")
+            try:
+                if get(base_url + "/api/health") == 200 and len(children(proc.pid)) >= workers:
+                    break
+            except OSError:
+                pass
+            time.sleep(0.05)
+        ready = time.perf_counter() - started
+
+        for _ in range(warm):
+            get(base_url + "/api/products")
+
+        master = memory_kib(proc.pid)
+        worker_memory = [memory_kib(pid) for pid in children(proc.pid)]
+        return ready, master, worker_memory
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        proc.wait(timeout=60)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--warm", type=int, default=0, help="GET /api/products requests before measuring")
+    parser.add_argument("--timeout", type=float, default=60.0, help="seconds to wait for startup")
+    args = parser.parse_args()
+
+    seconds, peak_kib = measure_import()
+    print(f"import main + create_app: {seconds * 1000:.1f} ms, peak RSS {peak_kib / 1024:.1f} MiB\n")
+
+    print(f"{'preload':>8} {'ready s':>8} {'master RSS':>11} {'worker RSS avg':>15} "
+          f"{'worker PSS avg':>15} {'total PSS':>10}  (MiB)")
+    for preload in (True, False):
+        ready, master, worker_memory = run_server(args.workers, preload, args.port, args.warm, args.timeout)
+        rss = [m[0] for m in worker_memory]
+        pss = [m[1] for m in worker_memory if m[1] is not None]
+        avg_pss = sum(pss) / len(pss) / 1024 if pss else float("nan")
+        total_pss = (sum(pss) + (master[1] or 0)) / 1024 if pss else float("nan")
+        print(f"{'yes' if preload else 'no':>8} {ready:>8.2f} {master[0] / 1024:>11.1f} "
+              f"{sum(rss) / len(rss) / 1024:>15.1f} {avg_pss:>15.1f} {total_pss:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
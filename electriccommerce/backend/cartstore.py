@@ -0,0 +1,600 @@
+"""
+cartstore.py - Optional write-behind cart engine
+
+Handles:
+- Keeping each active user's cart in memory, so cart reads and writes
+  don't touch MySQL (product checks and prices come from the catalog cache)
+- Flushing changed lines to cart_items from a background thread, coalesced
+  per line and batched across users: one multi-row upsert on
+  uniq_token_product and one multi-row delete per flush; lines created in
+  memory then take their database ids (the temporary negative id keeps
+  working until the cart is reloaded)
+- A forced, synchronous flush at checkout, holding the user's cart so the
+  order is built from exactly what the user saw
+- Dropping idle carts once they are clean
+- A version per in-memory cart for GET /api/cart's ETag, and the cart
+  version in user_resource_versions bumped with every flush
+- Parsing and applying batches of cart operations (POST /api/cart/batch),
+  for both this store and the plain cart_items path
+
+Enabled with CART_WRITE_BEHIND=1. The in-memory copy is per process, so
+only enable it with a single worker (or sticky sessions per user); a crash
+loses at most CART_FLUSH_INTERVAL seconds of cart changes.
+"""
+
+import contextlib
+import datetime
+import itertools
+import logging
+import os
+import threading
+import time
+import uuid
+
+import versions
+from db import run_transaction
+
+log = logging.getLogger(__name__)
+
+CART_WRITE_BEHIND = os.environ.get("CART_WRITE_BEHIND", "0") == "1"
+CART_FLUSH_INTERVAL = float(os.environ.get("CART_FLUSH_INTERVAL", "0.5"))
+CART_IDLE_TTL = float(os.environ.get("CART_IDLE_TTL", "900"))
+
+MAX_CART_OPS = 500
+CART_OPS = ("add", "set", "remove")
+
+
+class CartItemNotFound(Exception):
+    """No line with that id in the user's cart."""
+
+
+class InvalidProduct(Exception):
+    """The product is not in the catalog."""
+
+
+class InvalidCartOps(ValueError):
+    """A cart operation batch is malformed."""
+
+
+def parse_cart_ops(raw):
+    """
+    Validate a list of cart operations from a request body.
+
+    Each operation is {"op": "add"|"set"|"remove", "productId" or "id", "qty"}:
+    add increments (qty >= 1, default 1), set replaces (qty >= 0, 0 removes),
+    remove drops the line. Lines are named by productId, or by the cart line
+    id returned from GET /api/cart.
+
+    Returns:
+        list: (op, product id or None, line id or None, qty) tuples
+
+    Raises:
+        InvalidCartOps: On the first malformed operation
+    """
+    if not isinstance(raw, list) or not raw:
+        raise InvalidCartOps("ops must be a non-empty list")
+    if len(raw) > MAX_CART_OPS:
+        raise InvalidCartOps(f"At most {MAX_CART_OPS} operations per batch")
+
+    ops = []
+    for index, item in enumerate(raw):
+        if not isinstance(item, dict) or item.get("op") not in CART_OPS:
+            raise InvalidCartOps(f"ops[{index}]: op must be one of {', '.join(CART_OPS)}")
+        op = item["op"]
+        product_id = item.get("productId")
+        line_id = item.get("id")
+        if (product_id is None) == (line_id is None):
+            raise InvalidCartOps(f"ops[{index}]: give exactly one of productId or id")
+        try:
+            line_id = int(line_id) if line_id is not None else None
+            qty = int(item.get("qty", 1 if op == "add" else 0))
+        except (TypeError, ValueError):
+            raise InvalidCartOps(f"ops[{index}]: id and qty must be integers")
+        if op == "add" and qty < 1:
+            raise InvalidCartOps(f"ops[{index}]: Quantity must be at least 1")
+        if op == "set" and qty < 0:
+            raise InvalidCartOps(f"ops[{index}]: Quantity must not be negative")
+        ops.append((op, str(product_id) if product_id is not None else None, line_id, qty))
+    return ops
+
+
+def apply_cart_ops(quantities, ids, ops):
+    """
+    Work out a cart's final contents after a batch of operations.
+
+    Args:
+        quantities: Current product_id -> quantity (not modified)
+        ids: Cart line id -> product_id
+        ops: Output of parse_cart_ops
+
+    Returns:
+        dict: Final product_id -> quantity
+
+    Raises:
+        CartItemNotFound: An operation names a line id not in the cart
+    """
+    final = dict(quantities)
+    for op, product_id, line_id, qty in ops:
+        if product_id is None:
+            product_id = ids.get(line_id)
+            if product_id not in final:
+                raise CartItemNotFound(line_id)
+        if op == "add":
+            final[product_id] = final.get(product_id, 0) + qty
+        elif op == "set" and qty > 0:
+            final[product_id] = qty
+        else:
+            final.pop(product_id, None)
+    return final
+
+
+def referenced_products(ops):
+    """Product ids an add/set operation may create lines for."""
+    return {product_id for op, product_id, _, _ in ops if product_id is not None and op != "remove"}
+
+
+def demo_token_for(user_id):
+    """Value of cart_items.demo_token for a logged-in user's rows."""
+    return f"user_{user_id}"
+
+
+class _Cart:
+    """One user's cart. All fields are guarded by `lock`."""
+
+    __slots__ = ("user_id", "lines", "ids", "dirty", "lock", "touched_at", "detached", "version")
+
+    def __init__(self, user_id, version):
+        self.user_id = user_id
+        # product_id -> {"id", "product_id", "quantity", "added_at"}
+        self.lines = {}
+        # line id -> product_id (database ids, and negative ids for lines
+        # that were created in memory; those stay as aliases once the line
+        # has its database id)
+        self.ids = {}
+        # product ids whose row must be written (or deleted) on next flush
+        self.dirty = set()
+        self.lock = threading.RLock()
+        self.touched_at = time.monotonic()
+        # Set once the cart is dropped from the store; holders must reload
+        self.detached = False
+        # Changes on every write; never reused within a store
+        self.version = version
+
+
+class CartStore:
+    """
+    In-memory carts with write-behind to cart_items.
+
+    Lines store absolute quantities, so any number of changes to one line
+    between flushes collapse into a single upsert (or delete).
+    """
+
+    def __init__(self, pool, catalog, flush_interval=CART_FLUSH_INTERVAL, idle_ttl=CART_IDLE_TTL):
+        self.pool = pool
+        self.catalog = catalog
+        self.flush_interval = flush_interval
+        self.idle_ttl = idle_ttl
+        self._carts = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._temp_ids = itertools.count(-1, -1)
+        # Cart versions are unique per store: a reloaded cart never gets a
+        # version an earlier copy had, and the epoch tells processes apart
+        self._versions = itertools.count(1)
+        self.epoch = uuid.uuid4().hex[:8]
+        self._stop = threading.Event()
+        self._thread = None
+        self.loads = 0
+        self.flushes = 0
+        self.rows_upserted = 0
+        self.rows_deleted = 0
+        self.flush_errors = 0
+
+    # ---------- lifecycle ----------
+
+    def start(self):
+        """Start the background flusher (once)."""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="cart-flusher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        """Stop the flusher and write out everything still pending."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.flush()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush(wait=False)
+                self._evict_idle()
+            except Exception:
+                log.exception("Cart flush failed")
+
+    # ---------- loading ----------
+
+    def _cart(self, user_id):
+        """The user's cart, loaded from cart_items on first use."""
+        with self._lock:
+            cart = self._carts.get(user_id)
+            if cart is None:
+                cart = self._carts[user_id] = _Cart(user_id, next(self._versions))
+                cart.lock.acquire()
+            else:
+                cart.touched_at = time.monotonic()
+                return cart
+
+        # Load outside the store lock; the cart lock keeps other requests
+        # for this user waiting until the rows are in
+        try:
+            conn = self.pool.get_connection()
+            try:
+                cur = conn.cursor(dictionary=True)
+                cur.execute(
+                    "SELECT id, product_id, quantity, added_at FROM cart_items WHERE user_id = %s",
+                    (user_id,),
+                )
+                for row in cur:
+                    cart.lines[row["product_id"]] = row
+                    cart.ids[row["id"]] = row["product_id"]
+                cur.close()
+            finally:
+                conn.close()
+            self.loads += 1
+        except Exception:
+            self._detach(cart)
+            raise
+        finally:
+            cart.lock.release()
+        return cart
+
+    def _detach(self, cart):
+        with self._lock:
+            if self._carts.get(cart.user_id) is cart:
+                del self._carts[cart.user_id]
+        cart.detached = True
+
+    @contextlib.contextmanager
+    def _locked(self, user_id):
+        """Hold the user's live cart (never one dropped meanwhile)."""
+        while True:
+            cart = self._cart(user_id)
+            with cart.lock:
+                if not cart.detached:
+                    yield cart
+                    return
+
+    # ---------- reads ----------
+
+    def version(self, user_id):
+        """
+        Version of the user's cart, for GET /api/cart's ETag.
+
+        Returns:
+            tuple: (store epoch, cart version) - changes on every write
+        """
+        with self._locked(user_id) as cart:
+            return (self.epoch, cart.version)
+
+    def get(self, user_id):
+        """
+        The user's cart in the same shape as GET /api/cart.
+
+        Returns:
+            dict: {items, subtotal}
+        """
+        products = self.catalog.get().by_id
+        with self._locked(user_id) as cart:
+            lines = sorted(cart.lines.values(), key=lambda line: line["added_at"], reverse=True)
+
+        items = []
+        subtotal = 0
+        for line in lines:
+            product = products.get(line["product_id"])
+            if product is None:
+                continue  # removed from the catalog; the FK cascade drops the row
+            price = product["price"]
+            subtotal += price * line["quantity"]
+            items.append({
+                "id": line["id"],
+                "productId": line["product_id"],
+                "productName": product["name"],
+                "qty": line["quantity"],
+                "price": price,
+            })
+        return {"items": items, "subtotal": subtotal}
+
+    # ---------- writes ----------
+
+    def add(self, user_id, product_id, qty):
+        """
+        Add `qty` of a product (increments an existing line).
+
+        Raises:
+            InvalidProduct: Product not in the catalog
+        """
+        if product_id not in self.catalog.get().by_id:
+            raise InvalidProduct(product_id)
+        with self._locked(user_id) as cart:
+            line = cart.lines.get(product_id)
+            if line is None:
+                line_id = next(self._temp_ids)
+                cart.lines[product_id] = {
+                    "id": line_id,
+                    "product_id": product_id,
+                    "quantity": qty,
+                    "added_at": datetime.datetime.now(),
+                }
+                cart.ids[line_id] = product_id
+            else:
+                line["quantity"] += qty
+            cart.dirty.add(product_id)
+            cart.version = next(self._versions)
+
+    def set_quantity(self, user_id, item_id, qty):
+        """
+        Set the quantity of a cart line.
+
+        Raises:
+            CartItemNotFound: No such line in this user's cart
+        """
+        with self._locked(user_id) as cart:
+            product_id = cart.ids.get(item_id)
+            if product_id not in cart.lines:
+                raise CartItemNotFound(item_id)
+            cart.lines[product_id]["quantity"] = qty
+            cart.dirty.add(product_id)
+            cart.version = next(self._versions)
+
+    def remove(self, user_id, item_id):
+        """
+        Remove a cart line.
+
+        Raises:
+            CartItemNotFound: No such line in this user's cart
+        """
+        with self._locked(user_id) as cart:
+            product_id = cart.ids.get(item_id)
+            if product_id not in cart.lines:
+                raise CartItemNotFound(item_id)
+            line = cart.lines.pop(product_id)
+            cart.ids.pop(line["id"], None)
+            cart.dirty.add(product_id)
+            cart.version = next(self._versions)
+
+    def apply_batch(self, user_id, ops):
+        """
+        Apply parsed cart operations atomically (all or nothing).
+
+        Raises:
+            InvalidProduct: An add/set names a product not in the catalog
+            CartItemNotFound: An operation names a line not in the cart
+        """
+        products = self.catalog.get().by_id
+        for product_id in referenced_products(ops):
+            if product_id not in products:
+                raise InvalidProduct(product_id)
+
+        with self._locked(user_id) as cart:
+            current = {pid: line["quantity"] for pid, line in cart.lines.items()}
+            final = apply_cart_ops(current, cart.ids, ops)
+            if final != current:
+                cart.version = next(self._versions)
+            now = datetime.datetime.now()
+            for product_id in current.keys() - final.keys():
+                line = cart.lines.pop(product_id)
+                cart.ids.pop(line["id"], None)
+                cart.dirty.add(product_id)
+            for product_id, qty in final.items():
+                line = cart.lines.get(product_id)
+                if line is None:
+                    line_id = next(self._temp_ids)
+                    cart.lines[product_id] = {
+                        "id": line_id,
+                        "product_id": product_id,
+                        "quantity": qty,
+                        "added_at": now,
+                    }
+                    cart.ids[line_id] = product_id
+                elif line["quantity"] != qty:
+                    line["quantity"] = qty
+                else:
+                    continue
+                cart.dirty.add(product_id)
+
+    # ---------- flushing ----------
+
+    def _collect(self, cart, upserts, deletes, created):
+        """Move a cart's dirty lines into the pending statements (cart.lock held)."""
+        token = demo_token_for(cart.user_id)
+        for product_id in cart.dirty:
+            line = cart.lines.get(product_id)
+            if line is None:
+                deletes.append((token, product_id))
+            else:
+                upserts.append((token, cart.user_id, product_id, line["quantity"]))
+                if line["id"] < 0:
+                    created.append((token, product_id))
+        dirty = cart.dirty
+        cart.dirty = set()
+        return dirty
+
+    def _write(self, upserts, deletes, created, user_ids):
+        """
+        Run the flush statements in one transaction.
+
+        Returns:
+            dict: (demo_token, product_id) -> database id of the rows in
+                  `created` (lines that only had a temporary id)
+        """
+        def work(cur):
+            if upserts:
+                values = ", ".join(["(%s, %s, %s, %s)"] * len(upserts))
+                cur.execute(
+                    f"""
+                    INSERT INTO cart_items (demo_token, user_id, product_id, quantity)
+                    VALUES {values}
+                    ON DUPLICATE KEY UPDATE quantity = VALUES(quantity)
+                    """,
+                    [value for row in upserts for value in row],
+                )
+            if deletes:
+                pairs = ", ".join(["(%s, %s)"] * len(deletes))
+                cur.execute(
+                    f"DELETE FROM cart_items WHERE (demo_token, product_id) IN ({pairs})",
+                    [value for pair in deletes for value in pair],
+                )
+            # Keeps the stored version right for readers of cart_items
+            # (e.g. after a restart with the write-behind store off)
+            versions.bump_many(cur, user_ids, versions.CART)
+            if not created:
+                return {}
+            pairs = ", ".join(["(%s, %s)"] * len(created))
+            cur.execute(
+                f"SELECT id, demo_token, product_id FROM cart_items WHERE (demo_token, product_id) IN ({pairs})",
+                [value for pair in created for value in pair],
+            )
+            return {(row["demo_token"], row["product_id"]): row["id"] for row in cur.fetchall()}
+
+        row_ids = run_transaction(self.pool, work)
+        self.flushes += 1
+        self.rows_upserted += len(upserts)
+        self.rows_deleted += len(deletes)
+        return row_ids
+
+    def _adopt_ids(self, cart, row_ids):
+        """
+        Give lines created in memory their database ids (cart.lock held).
+
+        The temporary id stays in cart.ids as an alias, so a client still
+        holding it can update or remove the line; the version changes so
+        GET /api/cart hands out the real ids.
+        """
+        token = demo_token_for(cart.user_id)
+        adopted = False
+        for product_id, line in cart.lines.items():
+            row_id = row_ids.get((token, product_id))
+            if line["id"] < 0 and row_id is not None:
+                line["id"] = row_id
+                cart.ids[row_id] = product_id
+                adopted = True
+        if adopted:
+            cart.version = next(self._versions)
+
+    def _flush_carts(self, carts, wait=True):
+        """Write the carts' pending changes in one transaction (_flush_lock held)."""
+        upserts, deletes, created, taken = [], [], [], []
+        for cart in carts:
+            # The background flush skips carts busy in a request (e.g. a
+            # checkout); they are picked up on the next pass
+            if not cart.lock.acquire(blocking=wait):
+                continue
+            try:
+                if cart.dirty and not cart.detached:
+                    taken.append((cart, self._collect(cart, upserts, deletes, created)))
+            finally:
+                cart.lock.release()
+        if not taken:
+            return
+        try:
+            row_ids = self._write(upserts, deletes, created, [cart.user_id for cart, _ in taken])
+        except Exception:
+            self.flush_errors += 1
+            # Put the lines back; their current values go out next time
+            for cart, dirty in taken:
+                with cart.lock:
+                    cart.dirty |= dirty
+            raise
+        if row_ids:
+            for cart, _ in taken:
+                with cart.lock:
+                    self._adopt_ids(cart, row_ids)
+
+    def flush(self, wait=True):
+        """
+        Write every cart's pending changes in one transaction.
+
+        Args:
+            wait: False to skip carts that are locked right now
+        """
+        with self._flush_lock:
+            with self._lock:
+                carts = list(self._carts.values())
+            self._flush_carts(carts, wait)
+
+    def _evict_idle(self):
+        cutoff = time.monotonic() - self.idle_ttl
+        with self._lock:
+            idle = [cart for cart in self._carts.values() if cart.touched_at < cutoff]
+        for cart in idle:
+            if cart.lock.acquire(blocking=False):
+                try:
+                    if not cart.dirty:
+                        self._detach(cart)
+                finally:
+                    cart.lock.release()
+
+    @contextlib.contextmanager
+    def checkout(self, user_id):
+        """
+        Flush the user's cart and hold it while an order is built.
+
+        cart_items matches the in-memory cart for the whole block, and cart
+        reads and changes from the same user wait until it ends. On a clean
+        exit the in-memory cart is dropped so it is reloaded from the (now
+        cleared) table.
+
+        A user whose cart isn't loaded gets an empty placeholder, locked for
+        the block and always dropped after it: a concurrent get() waits on
+        it and then loads what the order left behind, instead of caching
+        the lines the order is about to delete.
+
+        Raises:
+            MySQLError: The forced flush failed
+        """
+        with self._lock:
+            cart = self._carts.get(user_id)
+            if cart is None:
+                placeholder = self._carts[user_id] = _Cart(user_id, next(self._versions))
+                placeholder.lock.acquire()
+        if cart is None:
+            try:
+                yield
+            finally:
+                self._detach(placeholder)
+                placeholder.lock.release()
+            return
+
+        # Lock order is always _flush_lock, then a cart lock. Holding the
+        # flush lock also waits out a background write of this cart that
+        # may already be in progress.
+        with self._flush_lock:
+            cart.lock.acquire()
+            try:
+                self._flush_carts([cart])
+            except Exception:
+                cart.lock.release()
+                raise
+        try:
+            yield
+            self._detach(cart)
+        finally:
+            cart.lock.release()
+
+    def stats(self):
+        with self._lock:
+            carts = len(self._carts)
+            dirty = sum(1 for cart in self._carts.values() if cart.dirty)
+        return {
+            "carts": carts,
+            "dirtyCarts": dirty,
+            "loads": self.loads,
+            "flushes": self.flushes,
+            "rowsUpserted": self.rows_upserted,
+            "rowsDeleted": self.rows_deleted,
+            "flushErrors": self.flush_errors,
+        }
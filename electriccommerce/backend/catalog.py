@@ -0,0 +1,201 @@
+"""
+catalog.py - In-process product catalog cache
+
+Handles:
+- Keeping the loaded product list and its encoded JSON body in memory
+- Invalidation through a catalog version counter bumped on product writes
+- TTL fallback so a missed bump can never pin a stale catalog forever
+- A pre-encoded payload per snapshot (ETag, gzip/brotli variants)
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows dev machines
+    fcntl = None
+
+from payloads import EncodedPayload
+
+
+CATALOG_CACHE_TTL = float(os.environ.get("CATALOG_CACHE_TTL", "300"))
+CATALOG_VERSION_FILE = os.environ.get(
+    "CATALOG_VERSION_FILE",
+    os.path.join(tempfile.gettempdir(), "ebuy_catalog.version"),
+)
+
+
+class CatalogVersion:
+    """
+    Catalog version counter shared by every worker process on the host.
+
+    The counter lives in a small file that is replaced atomically on every
+    bump, so readers only need a stat() call to notice a change - checking
+    the version never touches MySQL.
+    """
+
+    def __init__(self, path=CATALOG_VERSION_FILE):
+        self.path = path
+
+    def token(self):
+        """
+        Cheap change token for the current version.
+
+        Returns:
+            tuple: (inode, mtime_ns) of the version file, or None if the
+                   catalog has never been bumped
+        """
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns)
+
+    def read(self):
+        """Return the numeric catalog version (0 if never bumped)."""
+        try:
+            with open(self.path) as f:
+                return int(f.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def bump(self):
+        """
+        Increment the version. Safe across threads and processes.
+
+        Returns:
+            int: The new version number
+        """
+        lock_path = self.path + ".lock"
+        with open(lock_path, "a") as lock:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                version = self.read() + 1
+                tmp_path = f"{self.path}.{os.getpid()}.tmp"
+                with open(tmp_path, "w") as f:
+                    f.write(str(version))
+                # os.replace gives the file a new inode, which is what
+                # token() compares - readers never see a half-written file.
+                os.replace(tmp_path, self.path)
+                return version
+            finally:
+                if fcntl:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+class CatalogSnapshot:
+    """
+    One loaded copy of the catalog.
+
+    `products` is shared between requests and must be treated as read-only.
+    `body` is the ready-to-send JSON encoding of `products`.
+    `by_id` maps product id -> the same product dicts.
+    `payload` serves `body` with an ETag and compressed variants.
+    """
+
+    __slots__ = ("products", "body", "version", "loaded_at", "by_id", "payload")
+
+    def __init__(self, products, body, version, loaded_at):
+        self.products = products
+        self.body = body
+        self.version = version
+        self.loaded_at = loaded_at
+        self.by_id = {product["id"]: product for product in products}
+        self.payload = EncodedPayload(body)
+
+
+class CatalogCache:
+    """
+    Thread-safe cache of the product catalog.
+
+    A snapshot is reused until either the catalog version changes or the TTL
+    runs out. Only one thread reloads at a time; concurrent requests that
+    miss wait for that load instead of stampeding the database.
+    """
+
+    def __init__(self, loader, version=None, ttl=CATALOG_CACHE_TTL):
+        """
+        Args:
+            loader: Callable returning the product list (list of dicts)
+            version: CatalogVersion instance (defaults to the shared file)
+            ttl: Seconds a snapshot may be served without a version bump
+        """
+        self._loader = loader
+        self._version = version or CatalogVersion()
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self.hits = 0
+        self.misses = 0
+
+    def _is_fresh(self, snapshot, token):
+        return (
+            snapshot is not None
+            and snapshot.version == token
+            and time.monotonic() - snapshot.loaded_at < self._ttl
+        )
+
+    def get(self):
+        """
+        Return the current catalog snapshot, loading it if needed.
+
+        Returns:
+            CatalogSnapshot
+        """
+        token = self._version.token()
+        snapshot = self._snapshot
+        if self._is_fresh(snapshot, token):
+            self.hits += 1
+            return snapshot
+
+        with self._lock:
+            # Another thread may have reloaded while we waited for the lock
+            snapshot = self._snapshot
+            if self._is_fresh(snapshot, token):
+                self.hits += 1
+                return snapshot
+
+            # The token is read before loading: if a bump lands mid-load the
+            # snapshot is tagged with the old token and reloaded next time.
+            products = self._loader()
+            # Sorted keys, as jsonify() sends them
+            body = json.dumps(products, separators=(",", ":"), sort_keys=True).encode("utf-8")
+            snapshot = CatalogSnapshot(products, body, token, time.monotonic())
+            self._snapshot = snapshot
+            self.misses += 1
+            return snapshot
+
+    def version_token(self):
+        """Current shared version token (changes on every bump)."""
+        return self._version.token()
+
+    def invalidate(self):
+        """Drop the snapshot held by this process."""
+        self._snapshot = None
+
+    def bump(self):
+        """
+        Record a product write: bump the shared version and drop the local
+        snapshot. Call after the write has been committed.
+
+        Returns:
+            int: The new catalog version
+        """
+        version = self._version.bump()
+        self.invalidate()
+        return version
+
+    def stats(self):
+        """Hit/miss counters and the age of the current snapshot."""
+        snapshot = self._snapshot
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "version": self._version.read(),
+            "ageSeconds": round(time.monotonic() - snapshot.loaded_at, 3) if snapshot else None,
+        }
@@ -0,0 +1,263 @@
+"""
+compression.py - Negotiated gzip/brotli compression of API responses
+
+Handles:
+- Picking gzip or brotli (brotli package, optional) from Accept-Encoding
+  for JSON / NDJSON / text responses
+- Skipping bodies below MIN_COMPRESS_SIZE, statuses without a body, and
+  the pre-encoded payloads from payloads.py (they already picked their
+  variant and ETag, and go out as they are)
+- Compressing large bodies and streamed responses chunk by chunk, so a
+  big response never needs a second full-size buffer and a stream (e.g.
+  NDJSON progress) keeps flushing as it goes
+- Per-route settings with the @compress(...) decorator
+- Per-route counters (bytes in/out, CPU time spent compressing) for
+  /api/metrics
+"""
+
+import os
+import threading
+import time
+import zlib
+
+from flask import current_app, request
+
+from payloads import MIN_COMPRESS_SIZE, accepted_encodings, brotli
+
+COMPRESS_ENABLED = os.environ.get("COMPRESS_ENABLED", "1") == "1"
+# Dynamic responses trade a little ratio for speed (payloads.py uses 9 for
+# bodies compressed once and reused)
+COMPRESS_GZIP_LEVEL = int(os.environ.get("COMPRESS_GZIP_LEVEL", "6"))
+COMPRESS_BROTLI_QUALITY = int(os.environ.get("COMPRESS_BROTLI_QUALITY", "4"))
+# Bodies at least this big are compressed and sent in chunks
+COMPRESS_STREAM_SIZE = int(os.environ.get("COMPRESS_STREAM_SIZE", str(256 * 1024)))
+STREAM_CHUNK_SIZE = 64 * 1024
+
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "text/",
+)
+
+# Statuses that never carry a body
+_NO_BODY = {204, 304}
+
+
+class _Encoder:
+    """Incremental gzip or brotli encoder with a common interface."""
+
+    def __init__(self, encoding, level):
+        self.encoding = encoding
+        if encoding == "br":
+            self._br = brotli.Compressor(quality=level)
+        else:
+            self._gz = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        if self.encoding == "br":
+            return self._br.process(data)
+        return self._gz.compress(data)
+
+    def flush(self):
+        """Emit everything buffered so far (the stream stays open)."""
+        if self.encoding == "br":
+            return self._br.flush()
+        return self._gz.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        if self.encoding == "br":
+            return self._br.finish()
+        return self._gz.flush(zlib.Z_FINISH)
+
+
+class RouteStats:
+    """Counters for one endpoint (responses sent to clients accepting gzip/br)."""
+
+    __slots__ = ("responses", "compressed", "bytes_in", "bytes_out", "cpu_time")
+
+    def __init__(self):
+        self.responses = 0
+        self.compressed = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.cpu_time = 0.0
+
+
+def compress(enabled=True, min_size=None, level=None):
+    """
+    Per-route compression settings.
+
+    Args:
+        enabled: False to never compress this route's responses
+        min_size: Override MIN_COMPRESS_SIZE for this route
+        level: Override the gzip level / brotli quality for this route
+    """
+    def decorator(view):
+        view.compression = {"enabled": enabled, "min_size": min_size, "level": level}
+        return view
+    return decorator
+
+
+class Compressor:
+    """
+    after_request hook compressing responses for clients that accept it.
+
+    Routes opt out or tune thresholds with @compress(...); everything else
+    uses the module defaults.
+    """
+
+    def __init__(self, min_size=MIN_COMPRESS_SIZE, gzip_level=COMPRESS_GZIP_LEVEL,
+                 brotli_quality=COMPRESS_BROTLI_QUALITY, stream_size=COMPRESS_STREAM_SIZE):
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.stream_size = stream_size
+        self._routes = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        if COMPRESS_ENABLED:
+            app.after_request(self.after_request)
+
+    # ---------- decisions ----------
+
+    def _settings(self):
+        view = current_app.view_functions.get(request.endpoint)
+        return getattr(view, "compression", None) or {}
+
+    def _encoding(self):
+        accepted = accepted_encodings(request.headers.get("Accept-Encoding"))
+        if brotli is not None and "br" in accepted:
+            return "br"
+        if "gzip" in accepted:
+            return "gzip"
+        return None
+
+    @staticmethod
+    def _compressible(response):
+        if request.method == "HEAD" or response.status_code in _NO_BODY or response.status_code < 200:
+            return False
+        if getattr(response, "precompressed", False) or response.direct_passthrough:
+            return False
+        if "Content-Encoding" in response.headers:
+            return False
+        if "no-transform" in response.headers.get("Cache-Control", ""):
+            return False
+        mimetype = response.mimetype or ""
+        return mimetype.startswith(COMPRESSIBLE_TYPES)
+
+    # ---------- hook ----------
+
+    def after_request(self, response):
+        settings = self._settings()
+        if not settings.get("enabled", True) or not self._compressible(response):
+            return response
+
+        # Whether or not this client gets a compressed body, caches must
+        # key on Accept-Encoding
+        response.vary.add("Accept-Encoding")
+        encoding = self._encoding()
+        if encoding is None:
+            return response
+
+        level = settings.get("level")
+        if level is None:
+            level = self.brotli_quality if encoding == "br" else self.gzip_level
+        stats = self._stats(request.endpoint or "<unknown>")
+
+        if response.is_streamed:
+            response.response = self._stream(response.response, _Encoder(encoding, level), stats)
+        else:
+            body = response.get_data()
+            min_size = settings.get("min_size")
+            if len(body) < (self.min_size if min_size is None else min_size):
+                self._record(stats, len(body), len(body), 0.0, compressed=False)
+                return response
+            if len(body) >= self.stream_size:
+                response.response = self._stream(_chunks(body), _Encoder(encoding, level), stats)
+            else:
+                response.set_data(self._compress_all(body, _Encoder(encoding, level), stats))
+
+        response.headers["Content-Encoding"] = encoding
+        if response.is_streamed:
+            response.headers.pop("Content-Length", None)
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            # A compressed variant is a different representation (weak
+            # ETags compare equal across encodings and stay as they are)
+            response.set_etag(f"{etag}-{encoding}")
+        return response
+
+    # ---------- compression ----------
+
+    def _compress_all(self, body, encoder, stats):
+        started = time.thread_time()
+        data = encoder.compress(body) + encoder.finish()
+        self._record(stats, len(body), len(data), time.thread_time() - started)
+        return data
+
+    def _stream(self, chunks, encoder, stats):
+        bytes_in = bytes_out = 0
+        cpu = 0.0
+        try:
+            for chunk in chunks:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode()
+                if not chunk:
+                    continue
+                started = time.thread_time()
+                data = encoder.compress(chunk) + encoder.flush()
+                cpu += time.thread_time() - started
+                bytes_in += len(chunk)
+                bytes_out += len(data)
+                yield data
+            started = time.thread_time()
+            data = encoder.finish()
+            cpu += time.thread_time() - started
+            bytes_out += len(data)
+            yield data
+        finally:
+            close = getattr(chunks, "close", None)
+            if close is not None:
+                close()
+            self._record(stats, bytes_in, bytes_out, cpu)
+
+    # ---------- metrics ----------
+
+    def _stats(self, route):
+        with self._lock:
+            stats = self._routes.get(route)
+            if stats is None:
+                stats = self._routes[route] = RouteStats()
+            return stats
+
+    def _record(self, stats, bytes_in, bytes_out, cpu, compressed=True):
+        with self._lock:
+            stats.responses += 1
+            stats.compressed += compressed
+            stats.bytes_in += bytes_in
+            stats.bytes_out += bytes_out
+            stats.cpu_time += cpu
+
+    def stats(self):
+        """Per-route bytes in/out, bytes saved and compression CPU time."""
+        with self._lock:
+            return {
+                route: {
+                    "responses": s.responses,
+                    "compressed": s.compressed,
+                    "bytesIn": s.bytes_in,
+                    "bytesOut": s.bytes_out,
+                    "bytesSaved": s.bytes_in - s.bytes_out,
+                    "ratio": round(s.bytes_out / s.bytes_in, 3) if s.bytes_in else None,
+                    "cpuMs": round(s.cpu_time * 1000, 3),
+                }
+                for route, s in sorted(self._routes.items())
+            }
+
+
+def _chunks(body):
+    view = memoryview(body)
+    for start in range(0, len(view), STREAM_CHUNK_SIZE):
+        yield view[start:start + STREAM_CHUNK_SIZE]
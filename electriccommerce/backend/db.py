@@ -0,0 +1,358 @@
+"""
+db.py - Shared database helpers
+
+Handles:
+- The shared connection pool (blocking checkout, validation, metrics),
+  opened lazily in each process so forked workers never share sockets
+- Running a unit of work in a single transaction
+- Retrying transactions that lose a deadlock or time out waiting for a lock
+"""
+
+import os
+import random
+import threading
+import time
+
+from mysql.connector import pooling, Error as MySQLError
+
+# ER_LOCK_DEADLOCK, ER_LOCK_WAIT_TIMEOUT
+RETRYABLE_ERRNOS = {1213, 1205}
+
+TX_MAX_ATTEMPTS = 3
+TX_RETRY_BASE_DELAY = 0.02
+
+
+def is_retryable(error):
+    """True if the error means the transaction can simply be run again."""
+    return getattr(error, "errno", None) in RETRYABLE_ERRNOS
+
+
+def run_transaction(pool, work, attempts=TX_MAX_ATTEMPTS, base_delay=TX_RETRY_BASE_DELAY):
+    """
+    Run `work(cur)` in one transaction on a pooled connection.
+
+    The transaction is committed when `work` returns and rolled back if it
+    raises. Deadlocks and lock-wait timeouts roll back the whole transaction
+    and retry it from scratch with jittered exponential backoff, so `work`
+    must not commit and must be safe to run again.
+
+    Args:
+        pool: Connection pool
+        work: Callable taking a dictionary cursor
+        attempts: Maximum number of runs
+        base_delay: Backoff before the first retry, in seconds
+
+    Returns:
+        Whatever `work` returns
+
+    Raises:
+        MySQLError: Non-retryable errors, or the last retryable one
+    """
+    for attempt in range(1, attempts + 1):
+        conn = pool.get_connection()
+        cur = None
+        try:
+            cur = conn.cursor(dictionary=True)
+            result = work(cur)
+            conn.commit()
+            return result
+        except Exception as e:
+            try:
+                conn.rollback()
+            except MySQLError:
+                pass
+            if not is_retryable(e) or attempt == attempts:
+                raise
+            time.sleep(base_delay * (2 ** (attempt - 1)) * (1 + random.random()))
+        finally:
+            try:
+                if cur is not None:
+                    cur.close()
+                conn.close()
+            except Exception:
+                pass
+
+
+# ========== CONNECTION POOL ==========
+
+class PoolTimeout(Exception):
+    """
+    Raised when no connection frees up within the checkout timeout.
+
+    Deliberately not a MySQLError: routes only catch MySQLError, so this
+    propagates to the app-level handler and becomes a 503 instead of a 500.
+    """
+
+
+def db_config_from_env():
+    """Database connection settings, overridable from the environment."""
+    return {
+        "host": os.environ.get("DB_HOST", "localhost"),
+        "port": int(os.environ.get("DB_PORT", "3306")),
+        "user": os.environ.get("DB_USER", "ebuy_user"),
+        "password": os.environ.get("DB_PASSWORD", "Software5432"),
+        "database": os.environ.get("DB_NAME", "ebuy_app"),
+    }
+
+
+class _PoolConnection:
+    """
+    Connection handed out by BlockingPool.
+
+    Behaves like the underlying pooled connection; close() returns it to the
+    pool, records how long it was checked out and frees a slot for waiters.
+    """
+
+    def __init__(self, pool, conn, opened_at):
+        self._pool = pool
+        self._conn = conn
+        self._opened_at = opened_at
+        self._checked_out_at = time.monotonic()
+        self._closed = False
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._pool._remember(self._conn, self._opened_at)
+            self._conn.close()
+        finally:
+            self._pool._release(time.monotonic() - self._checked_out_at)
+
+
+class BlockingPool:
+    """
+    MySQL connection pool that queues callers instead of failing fast.
+
+    mysql.connector's pool raises PoolError the moment all connections are
+    busy. This wrapper puts a semaphore with one slot per connection in
+    front of it, so callers wait (up to `timeout` seconds) for a connection
+    to come back. Connections idle longer than `validate_idle` are pinged
+    before reuse and connections older than `recycle` are reconnected.
+    """
+
+    def __init__(self, db_config, size=5, timeout=5.0, recycle=1800.0,
+                 validate_idle=30.0, name="ebuy_pool"):
+        """
+        Args:
+            db_config: Connection settings passed to mysql.connector
+            size: Number of connections (mysql.connector allows at most 32)
+            timeout: Seconds a caller may wait for a free connection
+            recycle: Max connection age in seconds before reconnecting
+            validate_idle: Idle seconds after which a connection is pinged
+            name: Pool name
+        """
+        self.size = size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.validate_idle = validate_idle
+
+        self._pool = pooling.MySQLConnectionPool(pool_name=name, pool_size=size, **db_config)
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        # connection_id -> (opened_at, last_returned_at)
+        self._conn_meta = {}
+
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.checkouts = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.recycled = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+        self.checkout_time_total = 0.0
+        self.checkout_time_max = 0.0
+
+    def get_connection(self, timeout=None):
+        """
+        Check out a connection, waiting for one to free up if necessary.
+
+        Args:
+            timeout: Override for the pool's checkout timeout
+
+        Returns:
+            Connection whose close() returns it to the pool
+
+        Raises:
+            PoolTimeout: If no connection became available in time
+        """
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+
+        acquired = self._slots.acquire(blocking=False)
+        if not acquired:
+            with self._lock:
+                self.waits += 1
+            acquired = self._slots.acquire(timeout=timeout)
+
+        waited = time.monotonic() - start
+        with self._lock:
+            self.wait_time_total += waited
+            self.wait_time_max = max(self.wait_time_max, waited)
+            if not acquired:
+                self.timeouts += 1
+        if not acquired:
+            raise PoolTimeout(f"No database connection available after {timeout:.1f}s")
+
+        conn = None
+        try:
+            conn = self._pool.get_connection()
+            opened_at = self._validate(conn)
+        except BaseException:
+            if conn is not None:
+                self._discard(conn)
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self.checkouts += 1
+            self.in_use += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+        return _PoolConnection(self, conn, opened_at)
+
+    def _validate(self, conn):
+        """
+        Ping idle connections and reconnect ones past their max age.
+
+        Returns:
+            float: When the (possibly new) physical connection was opened
+        """
+        now = time.monotonic()
+        with self._lock:
+            opened_at, last_used = self._conn_meta.pop(conn.connection_id, (now, now))
+
+        if now - opened_at > self.recycle:
+            conn.reconnect(attempts=2, delay=0)
+            with self._lock:
+                self.recycled += 1
+            return now
+        if now - last_used > self.validate_idle:
+            conn.ping(reconnect=True, attempts=2, delay=0)
+        return opened_at
+
+    def _discard(self, conn):
+        """
+        Give a connection that failed validation back to mysql.connector's
+        pool (it reconnects it on next checkout) and forget its age.
+        """
+        try:
+            connection_id = conn.connection_id
+        except Exception:
+            connection_id = None
+        with self._lock:
+            self._conn_meta.pop(connection_id, None)
+        try:
+            conn.close()
+        except Exception:
+            # close() queues the connection before any reset error surfaces
+            pass
+
+    def _remember(self, conn, opened_at):
+        """Record age and last use of a connection going back to the pool."""
+        try:
+            connection_id = conn.connection_id
+        except Exception:
+            return
+        with self._lock:
+            self._conn_meta[connection_id] = (opened_at, time.monotonic())
+
+    def _release(self, checkout_time):
+        with self._lock:
+            self.in_use -= 1
+            self.checkout_time_total += checkout_time
+            self.checkout_time_max = max(self.checkout_time_max, checkout_time)
+        self._slots.release()
+
+    def stats(self):
+        """Wait time, checkout duration and saturation counters."""
+        with self._lock:
+            checkouts = self.checkouts or 1
+            return {
+                "size": self.size,
+                "inUse": self.in_use,
+                "peakInUse": self.peak_in_use,
+                "checkouts": self.checkouts,
+                "waits": self.waits,
+                "timeouts": self.timeouts,
+                "recycled": self.recycled,
+                "waitMsAvg": round(self.wait_time_total / checkouts * 1000, 3),
+                "waitMsMax": round(self.wait_time_max * 1000, 3),
+                "checkoutMsAvg": round(self.checkout_time_total / checkouts * 1000, 3),
+                "checkoutMsMax": round(self.checkout_time_max * 1000, 3),
+            }
+
+
+class LazyPool:
+    """
+    Stand-in for a BlockingPool that opens it on first use in each process.
+
+    Importing the app then needs no database, and a preforking server can
+    load the app once in its master: every worker opens its own pool the
+    first time it checks out a connection. A pool inherited across fork()
+    is dropped without being closed (closing would send COM_QUIT on sockets
+    the parent still owns).
+    """
+
+    def __init__(self, factory):
+        """
+        Args:
+            factory: Callable returning a new BlockingPool
+        """
+        self._factory = factory
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _current(self):
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    self._pool = self._factory()
+                    self._pid = pid
+        return self._pool
+
+    @property
+    def opened(self):
+        """True once this process has its own pool."""
+        return self._pid == os.getpid()
+
+    def get_connection(self, timeout=None):
+        return self._current().get_connection(timeout)
+
+    def stats(self):
+        """Pool counters, or {"open": False} before this process used it."""
+        if not self.opened:
+            return {"open": False}
+        return {"open": True, **self._pool.stats()}
+
+    def __getattr__(self, name):
+        return getattr(self._current(), name)
+
+
+def pool_from_env(db_config=None, lazy=False):
+    """
+    Build the shared BlockingPool from environment settings.
+
+    DB_POOL_SIZE, DB_POOL_TIMEOUT, DB_POOL_RECYCLE and DB_POOL_VALIDATE_IDLE
+    tune the pool; connection settings come from db_config_from_env().
+
+    Args:
+        db_config: Connection settings (default: db_config_from_env())
+        lazy: Return a LazyPool that reads the settings and connects on
+              first use in each process
+    """
+    if lazy:
+        return LazyPool(lambda: pool_from_env(db_config))
+    return BlockingPool(
+        db_config or db_config_from_env(),
+        size=int(os.environ.get("DB_POOL_SIZE", "5")),
+        timeout=float(os.environ.get("DB_POOL_TIMEOUT", "5")),
+        recycle=float(os.environ.get("DB_POOL_RECYCLE", "1800")),
+        validate_idle=float(os.environ.get("DB_POOL_VALIDATE_IDLE", "30")),
+    )
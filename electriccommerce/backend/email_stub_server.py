@@ -0,0 +1,58 @@
+"""
+email_stub_server.py - Local stand-in for the email provider
+
+Accepts the batches notifications.HttpTransport sends and prints them, so
+the outbox and dispatcher can be exercised without a Resend account.
+
+Usage:
+    python email_stub_server.py --port 8025 --latency 0.5 --fail-rate 0.1
+    EMAIL_TRANSPORT=http python main.py
+"""
+
+import argparse
+import json
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def make_handler(latency, fail_rate):
+    class StubHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            messages = json.loads(self.rfile.read(length) or b"{}").get("messages", [])
+
+            time.sleep(latency)
+            errors = []
+            for message in messages:
+                failed = random.random() < fail_rate
+                errors.append("stub: simulated failure" if failed else None)
+                print(f"{'FAIL' if failed else 'sent'}  {', '.join(message['to'])}  {message['subject']}")
+
+            body = json.dumps({"errors": errors}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return StubHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local email provider stub")
+    parser.add_argument("--port", type=int, default=8025)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per batch")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="fraction of messages to fail")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(args.latency, args.fail_rate))
+    print(f"Email stub listening on http://127.0.0.1:{args.port}/emails/batch")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,382 @@
+"""
+email_templates.py - Precompiled HTML email templates
+
+Handles:
+- Splitting each template into literal chunks and named slots once, at
+  import time, instead of re-running a ~200 line f-string per email
+- Caching the per-status variants of the delivery update email, with the
+  status colour, emoji and copy already filled in
+- Rendering into a caller-supplied list buffer that is joined once, so
+  item rows never go through quadratic string concatenation
+
+Templates use {{name}} slots. Values are inserted as-is (no escaping),
+matching the previous f-string behaviour.
+"""
+
+import functools
+import re
+
+_SLOT_RE = re.compile(r"\{\{(\w+)\}\}")
+
+
+class CompiledTemplate:
+    """
+    A template parsed into alternating literal chunks and slot names.
+
+    render() is a single pass over precomputed pieces followed by one join.
+    """
+
+    __slots__ = ("_literals", "_names")
+
+    def __init__(self, source=None, _pieces=None):
+        if _pieces is not None:
+            self._literals, self._names = _pieces
+            return
+        parts = _SLOT_RE.split(source)
+        self._literals = tuple(parts[0::2])
+        self._names = tuple(parts[1::2])
+
+    @property
+    def slots(self):
+        return frozenset(self._names)
+
+    def render_into(self, buf, values):
+        """
+        Append the rendered template to `buf` (a list of str).
+
+        Args:
+            buf: List to append chunks to; join it once when done
+            values: Mapping of slot name -> value (converted with str())
+        """
+        literals = self._literals
+        append = buf.append
+        for i, name in enumerate(self._names):
+            append(literals[i])
+            append(str(values[name]))
+        append(literals[-1])
+
+    def render(self, values):
+        """Render to a string."""
+        buf = []
+        self.render_into(buf, values)
+        return "".join(buf)
+
+    def partial(self, values):
+        """
+        Fill some slots now and return a template for the rest.
+
+        Args:
+            values: Mapping for the slots to fill; others stay open. A
+                    CompiledTemplate value is spliced in, so its own slots
+                    become slots of the result.
+
+        Returns:
+            CompiledTemplate
+        """
+        literals, names = [self._literals[0]], []
+        for i, name in enumerate(self._names):
+            if name not in values:
+                names.append(name)
+                literals.append(self._literals[i + 1])
+                continue
+            value = values[name]
+            if isinstance(value, CompiledTemplate):
+                literals[-1] += value._literals[0]
+                for j, inner in enumerate(value._names):
+                    names.append(inner)
+                    literals.append(value._literals[j + 1])
+            else:
+                literals[-1] += str(value)
+            literals[-1] += self._literals[i + 1]
+        return CompiledTemplate(_pieces=(tuple(literals), tuple(names)))
+
+
+def format_currency(amount):
+    """Format amount as USD currency"""
+    return f"${float(amount):.2f}"
+
+
+# ========== ORDER CONFIRMATION ==========
+
+ORDER_ITEM_ROW_SOURCE = """
+        <tr>
+            <td style="padding: 12px; border-bottom: 1px solid #e0e0e0; color: #333;">{{product_name}}</td>
+            <td style="padding: 12px; border-bottom: 1px solid #e0e0e0; text-align: center; color: #666;">{{qty}}</td>
+            <td style="padding: 12px; border-bottom: 1px solid #e0e0e0; text-align: right; color: #666;">{{price}}</td>
+            <td style="padding: 12px; border-bottom: 1px solid #e0e0e0; text-align: right; font-weight: 600; color: #333;">{{line_total}}</td>
+        </tr>
+        """
+ORDER_ITEM_ROW = CompiledTemplate(ORDER_ITEM_ROW_SOURCE)
+
+ORDER_CONFIRMATION_SOURCE = """
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <meta charset="UTF-8">
+        <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    </head>
+    <body style="margin: 0; padding: 0; font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, 'Helvetica Neue', Arial, sans-serif; background-color: #f5f5f5;">
+        <div style="max-width: 650px; margin: 30px auto; background-color: white; border-radius: 12px; overflow: hidden; box-shadow: 0 4px 6px rgba(0,0,0,0.1);">
+            
+            <!-- Header -->
+            <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 40px 30px; text-align: center;">
+                <div style="font-size: 48px; margin-bottom: 10px;">✓</div>
+                <h1 style="margin: 0; font-size: 32px; font-weight: 600; letter-spacing: -0.5px;">Order Confirmed!</h1>
+                <p style="margin: 15px 0 0 0; font-size: 18px; opacity: 0.95;">Thank you for shopping with eBuy</p>
+            </div>
+            
+            <!-- Order Summary Box -->
+            <div style="padding: 35px 30px;">
+                <div style="background: linear-gradient(135deg, #f5f7fa 0%, #c3cfe2 100%); padding: 25px; border-radius: 10px; margin-bottom: 35px;">
+                    <h2 style="margin: 0 0 20px 0; color: #333; font-size: 22px; font-weight: 600;">Order Details</h2>
+                    <table style="width: 100%; border-collapse: collapse;">
+                        <tr>
+                            <td style="padding: 10px 0; color: #555; font-size: 15px;">Order Number:</td>
+                            <td style="padding: 10px 0; text-align: right; font-weight: 600; font-size: 15px; color: #333;">#{{order_id}}</td>
+                        </tr>
+                        <tr>
+                            <td style="padding: 10px 0; color: #555; font-size: 15px;">Order Date:</td>
+                            <td style="padding: 10px 0; text-align: right; font-size: 15px; color: #333;">{{order_date}}</td>
+                        </tr>
+                        <tr>
+                            <td style="padding: 10px 0; color: #555; font-size: 15px;">Estimated Delivery:</td>
+                            <td style="padding: 10px 0; text-align: right; font-weight: 700; font-size: 16px; color: #667eea;">{{delivery_date}}</td>
+                        </tr>
+                        <tr style="border-top: 2px solid rgba(0,0,0,0.1);">
+                            <td style="padding: 15px 0 0 0; color: #555; font-size: 14px;">Tracking Number:</td>
+                            <td style="padding: 15px 0 0 0; text-align: right; font-family: 'Courier New', monospace; font-size: 13px; color: #333; font-weight: 600;">{{tracking_number}}</td>
+                        </tr>
+                        <tr>
+                            <td style="padding: 5px 0 0 0; color: #999; font-size: 12px;">Carrier:</td>
+                            <td style="padding: 5px 0 0 0; text-align: right; color: #666; font-size: 12px;">USPS</td>
+                        </tr>
+                    </table>
+                </div>
+                
+                <!-- Items Ordered -->
+                <h2 style="margin: 0 0 20px 0; color: #333; font-size: 22px; font-weight: 600;">Items Ordered</h2>
+                <div style="border: 1px solid #e0e0e0; border-radius: 8px; overflow: hidden; margin-bottom: 25px;">
+                    <table style="width: 100%; border-collapse: collapse;">
+                        <thead>
+                            <tr style="background-color: #f8f9fa;">
+                                <th style="padding: 15px 12px; text-align: left; font-weight: 600; color: #555; font-size: 14px;">Product</th>
+                                <th style="padding: 15px 12px; text-align: center; font-weight: 600; color: #555; font-size: 14px;">Qty</th>
+                                <th style="padding: 15px 12px; text-align: right; font-weight: 600; color: #555; font-size: 14px;">Price</th>
+                                <th style="padding: 15px 12px; text-align: right; font-weight: 600; color: #555; font-size: 14px;">Total</th>
+                            </tr>
+                        </thead>
+                        <tbody>
+                            {{items}}
+                        </tbody>
+                    </table>
+                </div>
+                
+                <!-- Price Breakdown -->
+                <div style="border-top: 2px solid #e0e0e0; padding-top: 20px;">
+                    <table style="width: 100%; border-collapse: collapse;">
+                        <tr>
+                            <td style="padding: 8px 0; color: #666; font-size: 15px;">Subtotal:</td>
+                            <td style="padding: 8px 0; text-align: right; font-size: 15px; color: #333;">{{subtotal}}</td>
+                        </tr>
+                        <tr>
+                            <td style="padding: 8px 0; color: #666; font-size: 15px;">Tax (8%):</td>
+                            <td style="padding: 8px 0; text-align: right; font-size: 15px; color: #333;">{{tax}}</td>
+                        </tr>
+                        <tr>
+                            <td style="padding: 8px 0; color: #666; font-size: 15px;">Shipping:</td>
+                            <td style="padding: 8px 0; text-align: right; font-size: 15px; color: #4CAF50; font-weight: 600;">FREE</td>
+                        </tr>
+                        <tr style="border-top: 2px solid #333;">
+                            <td style="padding: 15px 0 0 0; font-size: 20px; font-weight: 700; color: #333;">Total:</td>
+                            <td style="padding: 15px 0 0 0; text-align: right; font-size: 24px; font-weight: 700; color: #667eea;">{{total}}</td>
+                        </tr>
+                    </table>
+                </div>
+                
+                <!-- Shipping Address -->
+                <div style="margin-top: 35px; padding: 25px; background-color: #f8f9fa; border-radius: 10px; border-left: 4px solid #667eea;">
+                    <h3 style="margin: 0 0 12px 0; color: #333; font-size: 18px; font-weight: 600;">📦 Shipping Address</h3>
+                    <p style="margin: 0; color: #555; line-height: 1.8; font-size: 15px;">
+                        <strong style="color: #333;">{{shipping_name}}</strong><br>
+                        {{shipping_address}}
+                    </p>
+                </div>
+                
+                <!-- Track Order Button -->
+                <div style="text-align: center; margin-top: 40px;">
+                    <a href="http://127.0.0.1:5500/orderstatus.html?order={{order_id}}" 
+                       style="display: inline-block; padding: 16px 50px; background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; text-decoration: none; border-radius: 8px; font-weight: 600; font-size: 16px; box-shadow: 0 4px 15px rgba(102, 126, 234, 0.4); transition: transform 0.2s;">
+                        Track Your Order →
+                    </a>
+                </div>
+                
+                <!-- Help Section -->
+                <div style="margin-top: 40px; padding: 20px; background-color: #fff3cd; border-radius: 8px; border: 1px solid #ffeaa7;">
+                    <p style="margin: 0; color: #856404; font-size: 14px; line-height: 1.8;">
+                        <strong>📞 Need Help?</strong><br>
+                        Our support team is here for you!<br>
+                        Email: <a href="mailto:support@ebuy.com" style="color: #667eea; text-decoration: none; font-weight: 600;">support@ebuy.com</a><br>
+                        Phone: <strong>(555) 123-4567</strong>
+                    </p>
+                </div>
+            </div>
+            
+            <!-- Footer -->
+            <div style="background-color: #f8f9fa; padding: 25px 30px; text-align: center; border-top: 1px solid #e0e0e0;">
+                <p style="margin: 0 0 10px 0; color: #666; font-size: 14px;">
+                    This email was sent to <strong>{{user_email}}</strong>
+                </p>
+                <p style="margin: 10px 0 0 0; color: #999; font-size: 12px;">
+                    © 2024 eBuy E-Commerce Platform. All rights reserved.
+                </p>
+                <p style="margin: 5px 0 0 0; color: #999; font-size: 11px;">
+                    123 Commerce Street, New York, NY 10001
+                </p>
+            </div>
+            
+        </div>
+    </body>
+    </html>
+    """
+ORDER_CONFIRMATION = CompiledTemplate(ORDER_CONFIRMATION_SOURCE)
+
+
+def render_item_rows(buf, items):
+    """
+    Render order item rows into `buf`.
+
+    Args:
+        buf: List buffer to append to
+        items: List of {'productName', 'qty', 'price'}
+
+    Returns:
+        float: Subtotal of the rendered lines
+    """
+    subtotal = 0
+    values = {}
+    for item in items:
+        line_total = item['price'] * item['qty']
+        subtotal += line_total
+        values['product_name'] = item['productName']
+        values['qty'] = item['qty']
+        values['price'] = format_currency(item['price'])
+        values['line_total'] = format_currency(line_total)
+        ORDER_ITEM_ROW.render_into(buf, values)
+    return subtotal
+
+
+def render_order_confirmation(values, items, buf=None):
+    """
+    Render the order confirmation document.
+
+    Args:
+        values: Slot values except 'items' (see ORDER_CONFIRMATION.slots)
+        items: Order items, rendered into the 'items' slot
+        buf: Optional list buffer to reuse across a batch of emails;
+             it is cleared before use
+
+    Returns:
+        str: HTML document
+    """
+    if buf is None:
+        buf = []
+    else:
+        buf.clear()
+    render_item_rows(buf, items)
+    values = dict(values, items="".join(buf))
+    buf.clear()
+    ORDER_CONFIRMATION.render_into(buf, values)
+    return "".join(buf)
+
+
+# ========== DELIVERY UPDATE ==========
+
+DELIVERY_STATUS_INFO = {
+    'shipped': {
+        'emoji': '📦',
+        'title': 'Your Order Has Shipped!',
+        'message': 'Your order is on its way!',
+        'color': '#3498db'
+    },
+    'out_for_delivery': {
+        'emoji': '🚚',
+        'title': 'Out for Delivery!',
+        'message': 'Your order is arriving today!',
+        'color': '#f39c12'
+    },
+    'delivered': {
+        'emoji': '✅',
+        'title': 'Order Delivered!',
+        'message': 'Your order has arrived!',
+        'color': '#27ae60'
+    }
+}
+
+DELIVERY_STATUS_DEFAULT = {
+    'emoji': '📬',
+    'title': 'Order Update',
+    'message': 'Status updated',
+    'color': '#95a5a6'
+}
+
+TRACK_BUTTON = CompiledTemplate(
+    '<a href="{{tracking_url}}" style="display: inline-block; padding: 15px 40px; '
+    'background-color: {{color}}; color: white; text-decoration: none; '
+    'border-radius: 6px; font-weight: bold;">Track Package</a>'
+)
+
+DELIVERY_UPDATE_SOURCE = """
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <meta charset="UTF-8">
+        <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    </head>
+    <body style="margin: 0; padding: 0; font-family: Arial, sans-serif; background-color: #f5f5f5;">
+        <div style="max-width: 600px; margin: 20px auto; background-color: white; border-radius: 10px; overflow: hidden; box-shadow: 0 2px 4px rgba(0,0,0,0.1);">
+            <div style="background-color: {{color}}; color: white; padding: 30px; text-align: center;">
+                <div style="font-size: 48px; margin-bottom: 10px;">{{emoji}}</div>
+                <h1 style="margin: 0; font-size: 28px;">{{title}}</h1>
+                <p style="margin: 10px 0 0 0; font-size: 16px;">{{message}}</p>
+            </div>
+            <div style="padding: 30px; text-align: center;">
+                <p style="font-size: 16px; color: #666; margin: 0 0 20px 0;">
+                    Order <strong>#{{order_id}}</strong>
+                </p>
+                {{track_button}}
+            </div>
+        </div>
+    </body>
+    </html>
+    """
+DELIVERY_UPDATE = CompiledTemplate(DELIVERY_UPDATE_SOURCE)
+
+
+def delivery_status_info(status):
+    """Emoji, title, message and colour for a delivery status."""
+    return DELIVERY_STATUS_INFO.get(status, DELIVERY_STATUS_DEFAULT)
+
+
+@functools.lru_cache(maxsize=None)
+def delivery_update_variant(status, with_tracking):
+    """
+    Delivery update template with the status-specific parts filled in.
+
+    Cached per (status, with_tracking); only 'order_id' (and
+    'tracking_url' when with_tracking) remain to be filled.
+    """
+    info = delivery_status_info(status)
+    values = dict(info)
+    if with_tracking:
+        values['track_button'] = TRACK_BUTTON.partial({'color': info['color']})
+    else:
+        values['track_button'] = ''
+    return DELIVERY_UPDATE.partial(values)
+
+
+def render_delivery_update(status, order_id, tracking_url=None):
+    """Render the delivery update document for one order."""
+    if status not in DELIVERY_STATUS_INFO:
+        status = None  # all unknown statuses share the default variant
+    template = delivery_update_variant(status, bool(tracking_url))
+    return template.render({'order_id': order_id, 'tracking_url': tracking_url})
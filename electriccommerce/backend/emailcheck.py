@@ -0,0 +1,101 @@
+"""
+emailcheck.py - Email validation that never blocks login on DNS
+
+Handles:
+- Syntax-only validation (login): pure CPU, no network
+- Deliverability validation (registration, email changes): the DNS lookup
+  result is cached per domain, positive and negative, with a TTL
+"""
+
+import os
+import threading
+import time
+
+from email_validator import validate_email, EmailNotValidError, EmailUndeliverableError
+
+EMAIL_DOMAIN_TTL = float(os.environ.get("EMAIL_DOMAIN_TTL", "3600"))
+EMAIL_DOMAIN_NEGATIVE_TTL = float(os.environ.get("EMAIL_DOMAIN_NEGATIVE_TTL", "300"))
+EMAIL_DOMAIN_CACHE_SIZE = int(os.environ.get("EMAIL_DOMAIN_CACHE_SIZE", "10000"))
+
+
+def validate_email_syntax(email):
+    """
+    Check that an address is well formed, without any DNS lookups.
+
+    Raises:
+        EmailNotValidError: If the address is malformed
+    """
+    validate_email(email, check_deliverability=False)
+
+
+class DomainDeliverabilityCache:
+    """
+    Per-domain cache of deliverability lookups.
+
+    A domain that resolved is trusted for `ttl` seconds; one that did not
+    is rejected from cache for `negative_ttl` seconds. Either way the DNS
+    cost is paid at most once per domain per TTL.
+    """
+
+    def __init__(self, ttl=EMAIL_DOMAIN_TTL, negative_ttl=EMAIL_DOMAIN_NEGATIVE_TTL,
+                 max_size=EMAIL_DOMAIN_CACHE_SIZE):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_size = max_size
+        # domain -> (error message or None, expires_at)
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def validate(self, email):
+        """
+        Check syntax, then deliverability of the address's domain.
+
+        Raises:
+            EmailNotValidError: If the address is malformed or its domain
+                                cannot receive mail
+        """
+        validate_email_syntax(email)
+        domain = email.rsplit("@", 1)[1].lower()
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(domain)
+            if entry is not None and entry[1] > now:
+                self.hits += 1
+                if entry[0] is not None:
+                    raise EmailUndeliverableError(entry[0])
+                return
+            self.misses += 1
+
+        # The lookup runs outside the lock so one slow domain doesn't hold
+        # up validation of every other domain
+        try:
+            validate_email(email, check_deliverability=True)
+        except EmailUndeliverableError as e:
+            self._store(domain, str(e), self.negative_ttl)
+            raise
+        self._store(domain, None, self.ttl)
+
+    def _store(self, domain, error, ttl):
+        with self._lock:
+            if len(self._entries) >= self.max_size:
+                now = time.monotonic()
+                self._entries = {d: e for d, e in self._entries.items() if e[1] > now}
+                if len(self._entries) >= self.max_size:
+                    self._entries.clear()
+            self._entries[domain] = (error, time.monotonic() + ttl)
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+domain_cache = DomainDeliverabilityCache()
+
+
+def validate_email_deliverable(email):
+    """Syntax check plus cached per-domain deliverability check."""
+    domain_cache.validate(email)
+
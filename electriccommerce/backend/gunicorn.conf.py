@@ -0,0 +1,92 @@
+"""
+gunicorn.conf.py - Multi-worker production serving
+
+Usage (run from backend/):
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Handles:
+- Preloading the app in the master, so workers fork with the code (and
+  precompiled templates, catalog helpers, ...) already imported and share
+  those pages copy-on-write
+- Sizing each worker's DB pool from one total connection budget, so adding
+  workers never pushes MySQL past max_connections
+- Starting each worker's background threads after the fork, and flushing
+  write-behind carts / finishing in-flight emails when a worker exits
+- Graceful restarts: workers are recycled after MAX_REQUESTS (with jitter),
+  and get GRACEFUL_TIMEOUT seconds to finish requests on HUP / TERM
+
+Environment:
+    BIND                  Address to listen on (default 0.0.0.0:8000)
+    WEB_CONCURRENCY       Worker processes (default 2 x CPUs + 1)
+    GUNICORN_THREADS      Request threads per worker (default 4)
+    DB_CONNECTION_BUDGET  Total MySQL connections for all workers (default
+                          workers x DB_POOL_SIZE); each worker gets an
+                          equal share, capped at 32 (mysql.connector's max)
+    MAX_REQUESTS          Requests before a worker is replaced (default 5000)
+    GRACEFUL_TIMEOUT      Seconds to drain on restart/shutdown (default 30)
+    PRELOAD_APP           0 imports the app in every worker instead (default 1)
+
+Restarts:
+    kill -HUP <master>    New workers with re-read config; the preloaded code
+                          is NOT reloaded
+    kill -USR2 <master>   Start a new master with fresh code next to the old
+                          one; then kill -QUIT the old master
+"""
+
+import multiprocessing
+import os
+
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", "4"))
+preload_app = os.environ.get("PRELOAD_APP", "1") == "1"
+
+timeout = 30
+graceful_timeout = int(os.environ.get("GRACEFUL_TIMEOUT", "30"))
+keepalive = 5
+max_requests = int(os.environ.get("MAX_REQUESTS", "5000"))
+max_requests_jitter = max_requests // 10
+
+# ---------- DB connection budget ----------
+
+MAX_POOL_SIZE = 32
+
+_budget = os.environ.get("DB_CONNECTION_BUDGET")
+if _budget:
+    per_worker = int(_budget) // workers
+    if per_worker < 1:
+        raise SystemExit(
+            f"DB_CONNECTION_BUDGET={_budget} is less than one connection per worker ({workers} workers)"
+        )
+    # Read by db.pool_from_env() when each worker opens its pool
+    os.environ["DB_POOL_SIZE"] = str(min(per_worker, MAX_POOL_SIZE))
+
+# The write-behind cart keeps carts in process memory (see cartstore.py):
+# two workers would each hold a different copy of the same cart.
+# Idempotency-Key records are in MySQL (see idempotency.py), so they work
+# across any number of workers.
+if os.environ.get("CART_WRITE_BEHIND", "0") == "1" and workers > 1:
+    raise SystemExit("CART_WRITE_BEHIND=1 needs WEB_CONCURRENCY=1 (carts live in worker memory)")
+
+
+# ---------- hooks ----------
+
+def when_ready(server):
+    server.log.info(
+        "%d workers x %d threads, DB pool %s per worker",
+        workers, threads, os.environ.get("DB_POOL_SIZE", "5"),
+    )
+
+
+def post_fork(server, worker):
+    # Threads started in the master would not exist in the child, so the
+    # background work starts here, once per worker
+    import main
+    import wsgi
+    main.start_background(wsgi.app)
+
+
+def worker_exit(server, worker):
+    import main
+    main.stop_background()
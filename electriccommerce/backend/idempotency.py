@@ -0,0 +1,328 @@
+"""
+idempotency.py - Idempotency-Key support for POST routes that create things
+
+Handles:
+- Remembering the response to each (user, route, Idempotency-Key) in the
+  idempotency_keys table for a TTL, so a client retry gets the original
+  response back instead of a second order or payment - whichever worker
+  or process the retry lands on
+- Recording the key and the response inside the same transaction as the
+  order or payment (record_key, record_response), so a committed write
+  always has its response stored next to it
+- Coalescing duplicates that arrive while the first request is still
+  running: their insert waits on the first one's row in the unique index,
+  then they replay its response
+- Rejecting a key that is reused with a different request body
+
+A request that fails before its transaction commits leaves no key behind,
+so the client can retry for real.
+"""
+
+import functools
+import hashlib
+import json
+import os
+import threading
+
+from flask import current_app, g, jsonify, request
+from mysql.connector import Error as MySQLError
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+IDEMPOTENCY_TTL = int(os.environ.get("IDEMPOTENCY_TTL", "86400"))
+# Expired keys are deleted after every this many stored responses
+IDEMPOTENCY_PURGE_EVERY = int(os.environ.get("IDEMPOTENCY_PURGE_EVERY", "500"))
+
+MAX_KEY_LENGTH = 255
+
+# ER_DUP_ENTRY
+_DUPLICATE_KEY = 1062
+
+
+class KeyInUse(Exception):
+    """
+    Another request already committed this key.
+
+    Deliberately not a MySQLError: routes only catch MySQLError, so this
+    propagates through the view to idempotent(), which replays the other
+    request's response.
+    """
+
+
+class _Claim:
+    """This request's key, waiting to be recorded by the view's transaction."""
+
+    __slots__ = ("store", "scoped", "fingerprint", "recorded", "responded")
+
+    def __init__(self, store, scoped, fingerprint):
+        self.store = store
+        self.scoped = scoped
+        self.fingerprint = fingerprint
+        self.recorded = False
+        self.responded = False
+
+
+class IdempotencyStore:
+    """
+    Idempotency keys and their stored responses, in MySQL.
+
+    One row per (user_id, route, idem_key), unique. The row is inserted by
+    the request's own transaction and gets its response in that same
+    transaction, so no committed row is ever without one. Rows older than
+    the TTL are ignored and purged.
+    """
+
+    def __init__(self, pool, ttl=IDEMPOTENCY_TTL, purge_every=IDEMPOTENCY_PURGE_EVERY):
+        self.pool = pool
+        self.ttl = ttl
+        self.purge_every = purge_every
+        self._lock = threading.Lock()
+        self.executions = 0
+        self.replays = 0
+        self.coalesced = 0
+        self.mismatches = 0
+        self.purged = 0
+        self._saves = 0
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def lookup(self, scoped):
+        """
+        The live row for a key, or None.
+
+        Returns:
+            dict: fingerprint, status_code, response_headers, response_body
+        """
+        conn = self.pool.get_connection()
+        try:
+            cur = conn.cursor(dictionary=True)
+            cur.execute(
+                """
+                SELECT fingerprint, status_code, response_headers, response_body
+                FROM idempotency_keys
+                WHERE user_id = %s AND route = %s AND idem_key = %s
+                  AND created_at > UTC_TIMESTAMP() - INTERVAL %s SECOND
+                """,
+                (*scoped, self.ttl),
+            )
+            row = cur.fetchone()
+            cur.close()
+            return row
+        finally:
+            conn.close()
+
+    def insert(self, cur, scoped, fingerprint):
+        """
+        Record a key in the caller's transaction.
+
+        Raises:
+            KeyInUse: The key is already recorded (a concurrent insert
+                      waits for the other transaction to finish first)
+        """
+        # An expired row for the same key would block the unique index
+        cur.execute(
+            """
+            DELETE FROM idempotency_keys
+            WHERE user_id = %s AND route = %s AND idem_key = %s
+              AND created_at <= UTC_TIMESTAMP() - INTERVAL %s SECOND
+            """,
+            (*scoped, self.ttl),
+        )
+        try:
+            cur.execute(
+                """
+                INSERT INTO idempotency_keys (user_id, route, idem_key, fingerprint, created_at)
+                VALUES (%s, %s, %s, %s, UTC_TIMESTAMP())
+                """,
+                (*scoped, fingerprint),
+            )
+        except MySQLError as e:
+            if getattr(e, "errno", None) == _DUPLICATE_KEY:
+                raise KeyInUse(scoped[2])
+            raise
+
+    def store_response(self, cur, scoped, response):
+        """Store the response on the key row, in the caller's transaction."""
+        cur.execute(
+            """
+            UPDATE idempotency_keys
+            SET status_code = %s, response_headers = %s, response_body = %s
+            WHERE user_id = %s AND route = %s AND idem_key = %s
+            """,
+            (response.status_code, json.dumps(list(response.headers.items())),
+             response.get_data(), *scoped),
+        )
+
+    def committed(self):
+        """Count a stored response; purges expired keys every purge_every."""
+        with self._lock:
+            self._saves += 1
+            due = self._saves % self.purge_every == 0
+        if due:
+            self.purge()
+
+    def purge(self, limit=1000):
+        """Delete up to `limit` expired keys."""
+        conn = self.pool.get_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute(
+                """
+                DELETE FROM idempotency_keys
+                WHERE created_at <= UTC_TIMESTAMP() - INTERVAL %s SECOND
+                LIMIT %s
+                """,
+                (self.ttl, limit),
+            )
+            conn.commit()
+            with self._lock:
+                self.purged += cur.rowcount
+            cur.close()
+        finally:
+            conn.close()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "ttl": self.ttl,
+                "executions": self.executions,
+                "replays": self.replays,
+                "coalesced": self.coalesced,
+                "mismatches": self.mismatches,
+                "purged": self.purged,
+            }
+
+
+def record_key(cur):
+    """
+    Record this request's Idempotency-Key in the caller's transaction.
+
+    Call it first thing in the transaction that creates the order or
+    payment, and record_response() last. Does nothing for requests sent
+    without a key.
+
+    Raises:
+        KeyInUse: Another request with the same key already committed
+    """
+    claim = g.get("idempotency_claim")
+    if claim is None:
+        return
+    claim.store.insert(cur, claim.scoped, claim.fingerprint)
+    claim.recorded = True
+
+
+def record_response(cur, rv):
+    """
+    Store the view's response with its key, in the caller's transaction.
+
+    Call it at the end of the transaction that called record_key(), with
+    whatever the view is going to return; a retry then gets exactly this
+    response back, even if the worker dies right after the commit.
+
+    Args:
+        cur: Cursor inside the write's open transaction
+        rv: Anything a Flask view may return
+
+    Returns:
+        Response: The response to return from the view
+    """
+    response = current_app.make_response(rv)
+    claim = g.get("idempotency_claim")
+    if claim is not None and claim.recorded:
+        claim.store.store_response(cur, claim.scoped, response)
+        claim.responded = True
+    return response
+
+
+def _replay(row):
+    headers = json.loads(row["response_headers"])
+    res = current_app.response_class(
+        bytes(row["response_body"] or b""), status=row["status_code"], headers=headers
+    )
+    res.headers[REPLAYED_HEADER] = "true"
+    return res
+
+
+def _answer_duplicate(store, fingerprint, row, counter="replays"):
+    """
+    Response for a request whose key is already recorded: replay the
+    stored response.
+
+    Committed rows always carry their response (record_response runs in
+    the same transaction), so there is nothing to wait for. A row can
+    only be missing if it expired between the insert conflict and this
+    lookup.
+    """
+    if row is None or row["status_code"] is None:
+        return jsonify({"errors": [{
+            "msg": f"{IDEMPOTENCY_HEADER} has no stored response; retry with the same key"
+        }]}), 409
+    if bytes(row["fingerprint"]) != fingerprint:
+        store._count("mismatches")
+        return jsonify({"errors": [{
+            "msg": f"{IDEMPOTENCY_HEADER} was already used for a different request"
+        }]}), 422
+    store._count(counter)
+    return _replay(row)
+
+
+def idempotent(store, scope):
+    """
+    Honor the Idempotency-Key header on a route.
+
+    Requests without the header run normally. Keys are scoped by
+    `scope()` (the caller's user id) and the route path, so two users or
+    two routes never share a key. The view must call record_key(cur) at
+    the start of the transaction that makes its change and
+    record_response(cur, ...) at its end.
+
+    Args:
+        store: IdempotencyStore
+        scope: Callable returning the caller's identity; it runs before
+               the view, so it should also do the auth check
+
+    Returns:
+        Decorator for a Flask view
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            key = request.headers.get(IDEMPOTENCY_HEADER)
+            if not key:
+                return view(*args, **kwargs)
+            if len(key) > MAX_KEY_LENGTH:
+                return jsonify({"errors": [{"msg": f"{IDEMPOTENCY_HEADER} is too long"}]}), 400
+
+            scoped = (scope(), request.path, key)
+            fingerprint = hashlib.sha256(request.get_data()).digest()
+
+            row = store.lookup(scoped)
+            if row is not None:
+                return _answer_duplicate(store, fingerprint, row)
+
+            claim = g.idempotency_claim = _Claim(store, scoped, fingerprint)
+            store._count("executions")
+            try:
+                res = current_app.make_response(view(*args, **kwargs))
+            except KeyInUse:
+                # A concurrent request with this key committed first
+                return _answer_duplicate(store, fingerprint, store.lookup(scoped), "coalesced")
+            finally:
+                g.pop("idempotency_claim", None)
+
+            # Without a recorded key nothing was written (e.g. a validation
+            # error), so a retry may simply run again
+            if claim.responded:
+                store.committed()
+            elif claim.recorded and 200 <= res.status_code < 300:
+                current_app.logger.error(
+                    "%s recorded an idempotency key without record_response()", request.endpoint
+                )
+            return res
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,154 @@
+"""
+jsonprovider.py - Fast JSON encoding for the API
+
+Handles:
+- Encoding Decimal (as a JSON number), datetime and date (ISO 8601)
+  natively, so routes can hand DB values to jsonify() as they come
+- Using orjson when it is installed (optional dependency) and the stdlib
+  encoder otherwise - the output is the same JSON either way, with keys
+  sorted like Flask's default provider (so key order and ETags of
+  responses don't depend on the encoder)
+- A Flask JSON provider built on that encoder (install with
+  FastJSONProvider.install(app) or app.json_provider_class)
+- RowMapper: declarative row -> response dict mapping, so routes stop
+  rebuilding camelCase dicts by hand
+"""
+
+import datetime
+import json
+from decimal import Decimal
+from operator import itemgetter
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+
+def _default(value):
+    """Encode the DB types the encoders don't know."""
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+    _ORJSON_OPTIONS = {
+        True: orjson.OPT_NON_STR_KEYS | orjson.OPT_SORT_KEYS,
+        False: orjson.OPT_NON_STR_KEYS,
+    }
+
+    def dumps_bytes(obj, sort_keys=True):
+        """Encode `obj` as compact UTF-8 JSON bytes (keys sorted by default)."""
+        return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS[bool(sort_keys)])
+else:
+    _ENCODERS = {
+        sort_keys: json.JSONEncoder(
+            default=_default, separators=(",", ":"), ensure_ascii=False, sort_keys=sort_keys
+        )
+        for sort_keys in (True, False)
+    }
+
+    def dumps_bytes(obj, sort_keys=True):
+        """Encode `obj` as compact UTF-8 JSON bytes (keys sorted by default)."""
+        return _ENCODERS[bool(sort_keys)].encode(obj).encode()
+
+
+def encoder_name():
+    return "orjson" if orjson is not None else "json"
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    Flask JSON provider using dumps_bytes().
+
+    jsonify() responses are encoded straight to bytes in one call, with
+    keys sorted as long as `sort_keys` is left True (Flask's default), so
+    responses are byte-for-byte what the default provider sends. Calls
+    that pass encoder options (indent, ...) and pretty-printed debug
+    responses go through Flask's default provider, with the same handling
+    of Decimal and dates.
+    """
+
+    default = staticmethod(_default)
+
+    @classmethod
+    def install(cls, app):
+        app.json_provider_class = cls
+        app.json = cls(app)
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return dumps_bytes(obj, self.sort_keys).decode()
+
+    def response(self, *args, **kwargs):
+        if self._app.debug and self.compact is None:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps_bytes(obj, self.sort_keys), mimetype=self.mimetype)
+
+
+class RowMapper:
+    """
+    Maps cursor rows to response dicts from a declarative field spec.
+
+        PAYMENT_METHOD = RowMapper({
+            "id": "id",
+            "cardType": "card_type",
+            "isDefault": ("is_default", bool),
+        })
+        PAYMENT_METHOD.many(cur.fetchall())
+
+    Each output key names a row column, or (column, converter) when the
+    value needs one. Values are passed through untouched otherwise -
+    Decimal and dates are left for the JSON provider to encode.
+    """
+
+    def __init__(self, fields):
+        """
+        Args:
+            fields: Dict of output key -> column name or (column, converter)
+        """
+        self.keys = tuple(fields)
+        columns = []
+        self._converters = []
+        for key, spec in fields.items():
+            if isinstance(spec, tuple):
+                column, converter = spec
+                self._converters.append((key, converter))
+            else:
+                column = spec
+            columns.append(column)
+        self.columns = tuple(columns)
+        getter = itemgetter(*self.columns)
+        # itemgetter returns a bare value for a single column
+        self._get = getter if len(self.columns) > 1 else (lambda row: (getter(row),))
+
+    def _convert(self, mapped):
+        for key, converter in self._converters:
+            for item in mapped:
+                value = item[key]
+                if value is not None:
+                    item[key] = converter(value)
+        return mapped
+
+    def one(self, row):
+        """Map one row (None stays None)."""
+        if row is None:
+            return None
+        return self.many((row,))[0]
+
+    def many(self, rows):
+        """Map a sequence of rows (one converter pass per converted field)."""
+        keys, get = self.keys, self._get
+        mapped = [dict(zip(keys, get(row))) for row in rows]
+        if self._converters:
+            self._convert(mapped)
+        return mapped
@@ -1,35 +1,99 @@
+import contextlib
+import hmac
+import io
 import re
+import threading
 import uuid
 import datetime
+import json
 import os
+from decimal import Decimal, InvalidOperation
 
-from flask import Flask, request, jsonify, abort
+from flask import Blueprint, Flask, current_app, request, jsonify, abort, stream_with_context
 from flask_cors import CORS
 
 import jwt
-from mysql.connector import pooling, Error as MySQLError
-from email_validator import validate_email, EmailNotValidError
-
-from paymentsystem import register_payment_routes
+from mysql.connector import Error as MySQLError
+
+from paymentsystem import DEFAULT_PAYMENT_METHOD_ROW, register_payment_routes
+from jsonprovider import FastJSONProvider, RowMapper
+from auth import authenticator_for
+from catalog import CATALOG_CACHE_TTL, CatalogCache
+from compression import Compressor, compress
+from payloads import EncodedPayload, PayloadCache, send_payload
+from search import CURSOR_TYPES as SEARCH_CURSOR_TYPES, SearchIndex
+from cartstore import (
+    CART_WRITE_BEHIND,
+    CartItemNotFound,
+    CartStore,
+    InvalidCartOps,
+    InvalidProduct,
+    apply_cart_ops,
+    demo_token_for,
+    parse_cart_ops,
+    referenced_products,
+)
+from confirmation import calculate_delivery_date, generate_tracking_number
+from pricing import order_amounts, to_cents
+from emailcheck import (
+    EmailNotValidError,
+    domain_cache,
+    validate_email_deliverable,
+    validate_email_syntax,
+)
+from db import PoolTimeout, db_config_from_env, pool_from_env, run_transaction
+from notifications import (
+    NOTIFICATIONS_ENABLED,
+    NotificationDispatcher,
+    enqueue_email,
+    order_confirmation_payload,
+)
+from vault import vault_from_env
+import versions
+from idempotency import REPLAYED_HEADER, IdempotencyStore, idempotent, record_key, record_response
+from product_import import (
+    FEED_ERRORS,
+    FORMATS as IMPORT_FORMATS,
+    IMPORT_CHUNK_SIZE,
+    format_for,
+    progress_line,
+    run_import,
+)
+from pagination import (
+    NEXT_CURSOR_HEADER,
+    InvalidCursor,
+    InvalidQuery,
+    decode_cursor,
+    encode_cursor,
+    parse_limit,
+)
 
-app = Flask(__name__)
-CORS(app)
+# Every route lives on this blueprint; create_app() builds the Flask app
+api = Blueprint("api", __name__)
 
 JWT_SECRET = "dev_secret"
-PAYMENT_ENCRYPTION_KEY = os.environ.get('PAYMENT_KEY', 'dev_payment_key_change_in_production')
+auth = authenticator_for(JWT_SECRET)
 
-DB_CONFIG = {
-    "host": "localhost",
-    "user": "ebuy_user",
-    "password": "Software5432",
-    "database": "ebuy_app",
-}
+# Card vault keyring (PAYMENT_KEY, PAYMENT_PREVIOUS_KEYS, ... - see vault.py)
+PAYMENT_VAULT = vault_from_env()
 
-pool = pooling.MySQLConnectionPool(
-    pool_name="ebuy_pool",
-    pool_size=5,
-    **DB_CONFIG,
-)
+DB_CONFIG = db_config_from_env()
+
+# Blocking, instrumented pool shared with the payment routes.
+# Sized and tuned through DB_POOL_* environment variables (see db.py).
+# Opened on first use in each process, so importing this module needs no
+# database and every forked worker gets its own connections.
+pool = pool_from_env(DB_CONFIG, lazy=True)
+
+# Shared secret for /api/admin/* (sent as X-Admin-Token); unset disables them
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+
+# Responses to POSTs sent with an Idempotency-Key, kept in MySQL so every
+# worker sees them (see idempotency.py)
+idempotency = IdempotencyStore(pool)
+
+# gzip/brotli for dynamic responses; per-route settings with @compress(...)
+compressor = Compressor()
 
 NAME_RE = re.compile(r"^.{2,}$")
 
@@ -57,6 +121,7 @@ def issue_token(user):
 def get_user_id_from_token():
     """
     Extract and validate user ID from JWT token.
+    Decoded once per request and cached across requests (see auth.py).
     
     Returns:
         int: User ID from token
@@ -64,28 +129,44 @@ def get_user_id_from_token():
     Raises:
         401: If token is missing, invalid, or expired
     """
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or not auth_header.startswith("Bearer "):
-        abort(401, "Missing or invalid Authorization header")
+    return auth.user_id()
 
-    token = auth_header.split(" ", 1)[1]
-    try:
-        payload = jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
-    except jwt.InvalidTokenError:
-        abort(401, "Invalid token")
 
-    return payload.get("id")
+@api.app_errorhandler(PoolTimeout)
+def pool_timeout(e):
+    """All DB connections stayed busy past the checkout timeout."""
+    current_app.logger.warning("Connection pool saturated: %s", e)
+    response = jsonify({"errors": [{"msg": "Server busy, please retry"}]})
+    response.headers["Retry-After"] = "1"
+    return response, 503
 
 
-@app.get("/api/health")
+@api.get("/api/health")
 def health():
     """Health check endpoint."""
     return jsonify({"ok": True})
 
 
+@api.get("/api/metrics")
+def metrics():
+    """Connection pool and cache counters for monitoring."""
+    return jsonify({
+        "pool": pool.stats(),
+        "catalog": catalog.stats(),
+        "productPages": product_pages.stats(),
+        "auth": auth.stats(),
+        "emailDomains": domain_cache.stats(),
+        "notifications": notifier.stats(),
+        "idempotency": idempotency.stats(),
+        "cart": cart_store.stats() if CART_WRITE_BEHIND else None,
+        "search": search_index.stats(),
+        "compression": compressor.stats(),
+    })
+
+
 # ---------- AUTH ROUTES ----------
 
-@app.post("/api/auth/register")
+@api.post("/api/auth/register")
 def register():
     """
     Register a new user account.
@@ -107,7 +188,7 @@ def register():
     address = (data.get("address") or "").strip() or None
 
     try:
-        validate_email(email)
+        validate_email_deliverable(email)
     except EmailNotValidError:
         return jsonify({"errors": [{"msg": "Invalid email"}]}), 400
 
@@ -135,7 +216,7 @@ def register():
     except MySQLError as e:
         if getattr(e, "errno", None) == 1062:
             return jsonify({"errors": [{"msg": "Email already registered"}]}), 409
-        app.logger.exception(e)
+        current_app.logger.exception(e)
         return jsonify({"errors": [{"msg": "Server error"}]}), 500
     finally:
         try:
@@ -145,7 +226,7 @@ def register():
             pass
 
 
-@app.post("/api/auth/login")
+@api.post("/api/auth/login")
 def login():
     """
     Authenticate user and return JWT token.
@@ -162,8 +243,9 @@ def login():
     email = (data.get("email") or "").strip().lower()
     password = data.get("password") or ""
 
+    # Syntax only - login must never wait on a DNS lookup
     try:
-        validate_email(email)
+        validate_email_syntax(email)
     except EmailNotValidError:
         return jsonify({"errors": [{"msg": "Invalid email"}]}), 400
 
@@ -191,7 +273,7 @@ def login():
         token = issue_token(row)
         return jsonify({"token": token, "user": row})
     except MySQLError as e:
-        app.logger.exception(e)
+        current_app.logger.exception(e)
         return jsonify({"errors": [{"msg": "Server error"}]}), 500
     finally:
         try:
@@ -203,14 +285,29 @@ def login():
 
 # ---------- ACCOUNT ROUTES (PROFILE / ADDRESS / LOGIN INFO) ----------
 
-@app.get("/api/account/me")
+# Profile and shipping fields returned by /api/account/me
+PROFILE_SQL = """
+    SELECT id, first_name, last_name, email, address,
+           shipping_street, shipping_city, shipping_state,
+           shipping_zip, shipping_phone
+    FROM users
+    WHERE id = %s
+    LIMIT 1
+"""
+
+
+@api.get("/api/account/me")
 def get_account():
     """
     Get current user's account information.
     Requires authentication.
     
+    Conditional: answers If-None-Match from the account version alone
+    (see versions.py), without reading the profile.
+    
     Returns:
-        200: User profile data
+        200: User profile data (ETag, Cache-Control: private, no-cache)
+        304: Client's copy is current
         401: Not authenticated
         404: User not found
         500: Server error
@@ -220,24 +317,23 @@ def get_account():
     try:
         conn = pool.get_connection()
         cur = conn.cursor(dictionary=True)
+        
+        etag = versions.etag_for(cur, versions.ACCOUNT, user_id)
+        cached = versions.not_modified(etag)
+        if cached:
+            return cached
+        
         cur.execute(
-            """
-            SELECT id, first_name, last_name, email, address,
-                   shipping_street, shipping_city, shipping_state,
-                   shipping_zip, shipping_phone
-            FROM users
-            WHERE id = %s
-            LIMIT 1
-            """,
+            PROFILE_SQL,
             (user_id,),
         )
         row = cur.fetchone()
         if not row:
             abort(404, "User not found")
 
-        return jsonify(row)
+        return versions.stamp(jsonify(row), etag)
     except MySQLError as e:
-        app.logger.exception(e)
+        current_app.logger.exception(e)
         return jsonify({"errors": [{"msg": "Server error"}]}), 500
     finally:
         try:
@@ -247,7 +343,7 @@ def get_account():
             pass
 
 
-@app.put("/api/account/me")
+@api.put("/api/account/me")
 def update_account():
     """
     Update current user's account information.
@@ -290,7 +386,7 @@ def update_account():
     if "email" in data:
         email = (data.get("email") or "").strip().lower()
         try:
-            validate_email(email)
+            validate_email_deliverable(email)
         except EmailNotValidError:
             return jsonify({"errors": [{"msg": "Invalid email"}]}), 400
         updates.append("email = %s")
@@ -342,6 +438,7 @@ def update_account():
         params.append(user_id)
 
         cur.execute(query, params)
+        versions.bump(cur, user_id, versions.ACCOUNT)
         conn.commit()
 
         return jsonify({"ok": True})
@@ -349,7 +446,7 @@ def update_account():
         # Handle duplicate email
         if getattr(e, "errno", None) == 1062:
             return jsonify({"errors": [{"msg": "Email already registered"}]}), 409
-        app.logger.exception(e)
+        current_app.logger.exception(e)
         return jsonify({"errors": [{"msg": "Server error"}]}), 500
     finally:
         try:
@@ -361,97 +458,384 @@ def update_account():
 
 # ---------- PRODUCTS / CART / ORDERS ----------
 
-@app.get("/api/products")
-def list_products():
+def load_products():
     """
-    Get all products from database.
-    No authentication required.
+    Load the full product catalog from the database.
+    Used by the catalog cache on a miss.
     
     Returns:
-        200: List of products with id, name, and price
-        500: Server error
+        list: Products with id, name, price, description, image_url
     """
+    conn = pool.get_connection()
     try:
-        conn = pool.get_connection()
         cur = conn.cursor(dictionary=True)
         cur.execute("SELECT id, name, price, description, image_url FROM products ORDER BY name")
         products = cur.fetchall()
+        cur.close()
+    finally:
+        conn.close()
+
+    # Convert Decimal to float for JSON serialization
+    for product in products:
+        product['price'] = float(product['price'])
+
+    return products
+
+
+catalog = CatalogCache(load_products)
+
+# Encoded product listing pages, valid until the catalog version changes
+product_pages = PayloadCache(ttl=CATALOG_CACHE_TTL)
+
+# Optional write-behind cart engine (CART_WRITE_BEHIND=1, see cartstore.py).
+# When enabled, the cart routes below work on it instead of cart_items.
+cart_store = CartStore(pool, catalog)
+
+
+def cart_checkout(user_id):
+    """Context for building an order: flushes and holds a write-behind cart."""
+    if CART_WRITE_BEHIND:
+        return cart_store.checkout(user_id)
+    return contextlib.nullcontext()
+
+
+# Columns a product listing may project with ?fields=
+PRODUCT_FIELDS = ("id", "name", "price", "description", "image_url")
+
+# ?sort= value -> (column, direction); each is backed by a (column, id) index
+PRODUCT_SORTS = {
+    "name": ("name", "ASC"),
+    "price": ("price", "ASC"),
+    "-price": ("price", "DESC"),
+}
+
+PRODUCT_PAGE_PARAMS = ("fields", "limit", "after", "sort", "min_price", "max_price")
+
+
+def parse_price(raw, name):
+    """Parse a price query param (None if absent)."""
+    if raw in (None, ""):
+        return None
+    try:
+        value = Decimal(raw)
+    except (InvalidOperation, TypeError, ValueError):
+        raise InvalidQuery(f"{name} must be a number")
+    if not value.is_finite() or value < 0:
+        raise InvalidQuery(f"{name} must be a non-negative number")
+    return value
+
+
+@api.get("/api/products")
+def list_products():
+    """
+    Get products.
+    No authentication required.
+    
+    Without query params the whole catalog is served from the in-process
+    catalog cache; only a cache miss hits MySQL.
+    
+    With any of the params below, one keyset page is read straight from
+    MySQL using idx_products_name / idx_products_price, so the cost and
+    size of a response follow the page, not the catalog. Pages are kept
+    encoded until the catalog version changes.
+    
+    Responses are pre-encoded bytes with a strong ETag (304 on a matching
+    If-None-Match) and gzip/brotli variants built once per version.
+    
+    Query params:
+        fields: Comma-separated subset of id,name,price,description,image_url
+                (id is always included)
+        limit: Page size (default 50, max 200)
+        after: Cursor from the previous page's X-Next-Cursor header
+        sort: name (default), price or -price
+        min_price / max_price: Inclusive price range
+    
+    Returns:
+        200: List of products (X-Next-Cursor set if more pages)
+        304: Client copy is current
+        400: Invalid params or cursor
+        500: Server error
+    """
+    if not any(param in request.args for param in PRODUCT_PAGE_PARAMS):
+        try:
+            snapshot = catalog.get()
+        except MySQLError as e:
+            current_app.logger.exception(e)
+            return jsonify({"errors": [{"msg": "Server error"}]}), 500
         
-        # Convert Decimal to float for JSON serialization
-        for product in products:
-            product['price'] = float(product['price'])
+        return send_payload(snapshot.payload)
+    
+    try:
+        fields = [f for f in (request.args.get("fields") or "").split(",") if f] or list(PRODUCT_FIELDS)
+        unknown = set(fields) - set(PRODUCT_FIELDS)
+        if unknown:
+            raise InvalidQuery(f"Unknown fields: {', '.join(sorted(unknown))}")
+        if "id" not in fields:
+            fields.insert(0, "id")
         
-        return jsonify(products)
-    except MySQLError as e:
-        app.logger.exception(e)
-        return jsonify({"errors": [{"msg": "Server error"}]}), 500
-    finally:
+        sort = request.args.get("sort") or "name"
+        if sort not in PRODUCT_SORTS:
+            raise InvalidQuery(f"sort must be one of {', '.join(PRODUCT_SORTS)}")
+        sort_col, direction = PRODUCT_SORTS[sort]
+        
+        limit = parse_limit(request.args.get("limit"))
+        min_price = parse_price(request.args.get("min_price"), "min_price")
+        max_price = parse_price(request.args.get("max_price"), "max_price")
+        after = request.args.get("after")
+        after_key = decode_cursor(after, 2) if after else None
+        if after_key and sort_col == "price":
+            try:
+                after_key = [parse_price(after_key[0], "cursor"), after_key[1]]
+            except InvalidQuery:
+                raise InvalidCursor("Invalid cursor")
+    except InvalidQuery as e:
+        return jsonify({"errors": [{"msg": str(e)}]}), 400
+    
+    # Columns come from the whitelists above, never from the request as-is
+    columns = list(dict.fromkeys(fields + [sort_col]))
+    where = []
+    params = []
+    if min_price is not None:
+        where.append("price >= %s")
+        params.append(min_price)
+    if max_price is not None:
+        where.append("price <= %s")
+        params.append(max_price)
+    if after_key:
+        op = ">" if direction == "ASC" else "<"
+        where.append(f"({sort_col} {op} %s OR ({sort_col} = %s AND id {op} %s))")
+        params.extend([after_key[0], after_key[0], after_key[1]])
+    
+    query = f"SELECT {', '.join(columns)} FROM products"
+    if where:
+        query += " WHERE " + " AND ".join(where)
+    query += f" ORDER BY {sort_col} {direction}, id {direction} LIMIT %s"
+    params.append(limit + 1)
+    
+    def build_page():
+        conn = pool.get_connection()
         try:
+            cur = conn.cursor(dictionary=True)
+            cur.execute(query, params)
+            rows = cur.fetchall()
             cur.close()
+        finally:
             conn.close()
-        except Exception:
-            pass
+        
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        
+        products = []
+        for row in rows:
+            product = {field: row[field] for field in fields}
+            if "price" in product:
+                product["price"] = float(product["price"])
+            products.append(product)
+        
+        headers = {}
+        if has_more:
+            last = rows[-1]
+            sort_value = str(last[sort_col]) if sort_col == "price" else last[sort_col]
+            headers[NEXT_CURSOR_HEADER] = encode_cursor(sort_value, last["id"])
+        
+        body = json.dumps(products, separators=(",", ":"), sort_keys=True).encode("utf-8")
+        return EncodedPayload(body, headers=headers), True
+    
+    try:
+        payload = product_pages.get(request.query_string, catalog.version_token(), build_page)
+    except MySQLError as e:
+        current_app.logger.exception(e)
+        return jsonify({"errors": [{"msg": "Server error"}]}), 500
+    
+    return send_payload(payload)
+
+
+# Token/prefix index over product names and descriptions (see search.py).
+# Kept in step with the catalog cache: each request re-syncs it, which only
+# does work when the catalog snapshot has changed.
+search_index = SearchIndex()
+
+SUGGEST_LIMIT = 10
+
+
+def synced_search_index():
+    """The search index, updated to the current catalog snapshot."""
+    search_index.sync(catalog.get())
+    return search_index
+
+
+@api.get("/api/products/search")
+def search_products():
+    """
+    Search products by name and description.
+    No authentication required.
+    
+    Every word must match; the last word also matches as a prefix. Results
+    are ranked (name matches first) and keyset-paginated.
+    
+    Query params:
+        q: Search text
+        limit: Page size (default 50, max 200)
+        after: Cursor from the previous page's X-Next-Cursor header
+    
+    Returns:
+        200: Ranked list of products (X-Next-Cursor set if more pages)
+        400: Missing query, invalid limit or cursor
+        500: Server error
+    """
+    query = (request.args.get("q") or "").strip()
+    if not query:
+        return jsonify({"errors": [{"msg": "Query parameter q is required"}]}), 400
+    
+    try:
+        limit = parse_limit(request.args.get("limit"))
+        after = request.args.get("after")
+        after_key = decode_cursor(after, 3, SEARCH_CURSOR_TYPES) if after else None
+    except InvalidQuery as e:
+        return jsonify({"errors": [{"msg": str(e)}]}), 400
+    
+    try:
+        index = synced_search_index()
+    except MySQLError as e:
+        current_app.logger.exception(e)
+        return jsonify({"errors": [{"msg": "Server error"}]}), 500
+    
+    results, next_key = index.search(query, limit, after_key)
+    response = jsonify([dict(product, score=score) for score, product in results])
+    if next_key:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(*next_key)
+    return response
 
 
-@app.get("/api/cart")
+@api.get("/api/products/suggest")
+def suggest_products():
+    """
+    Autocomplete for the search box.
+    No authentication required.
+    
+    Query params:
+        prefix: What the user has typed so far
+        limit: Maximum suggestions (default 10, max 50)
+    
+    Returns:
+        200: {suggestions: [completed queries], products: [{id, name}]}
+        400: Invalid limit
+        500: Server error
+    """
+    prefix = request.args.get("prefix") or ""
+    try:
+        limit = parse_limit(request.args.get("limit"), default=SUGGEST_LIMIT, maximum=50)
+    except InvalidQuery as e:
+        return jsonify({"errors": [{"msg": str(e)}]}), 400
+    
+    try:
+        index = synced_search_index()
+    except MySQLError as e:
+        current_app.logger.exception(e)
+        return jsonify({"errors": [{"msg": "Server error"}]}), 500
+    
+    suggestions, products = index.suggest(prefix, limit)
+    return jsonify({
+        "suggestions": suggestions,
+        "products": [{"id": p["id"], "name": p["name"]} for p in products],
+    })
+
+
+CART_LINES_SQL = """
+    SELECT 
+        c.id as cart_item_id,
+        c.product_id,
+        c.quantity,
+        p.name as product_name,
+        p.price
+    FROM cart_items c
+    JOIN products p ON c.product_id = p.id
+    WHERE c.user_id = %s
+    ORDER BY c.added_at DESC
+"""
+
+
+def cart_lines(cur, user_id):
+    """
+    Read a user's cart lines with product details.
+    
+    Returns:
+        tuple: (items in the GET /api/cart shape, newest first; subtotal)
+    """
+    cur.execute(CART_LINES_SQL, (user_id,))
+    return cart_lines_json(cur.fetchall())
+
+
+def cart_lines_json(rows):
+    """Shape CART_LINES_SQL rows for the API: (items, subtotal)."""
+    subtotal = 0
+    items = []
+    for item in rows:
+        price = float(item['price'])
+        qty = item['quantity']
+        subtotal += price * qty
+        
+        items.append({
+            'id': item['cart_item_id'],
+            'productId': item['product_id'],
+            'productName': item['product_name'],
+            'qty': qty,
+            'price': price
+        })
+    
+    return items, subtotal
+
+
+@api.get("/api/cart")
 def get_cart():
     """
     Get current user's cart items.
     Requires authentication.
     
+    Conditional: the ETag combines the cart version and the catalog
+    version (names and prices come from products), so If-None-Match is
+    answered without reading the cart.
+    
     Returns:
-        200: Cart items with subtotal
+        200: Cart items with subtotal (ETag, Cache-Control: private, no-cache)
+        304: Client's copy is current
         401: Not authenticated
         500: Server error
     """
     user_id = get_user_id_from_token()
     
+    if CART_WRITE_BEHIND:
+        try:
+            # The live cart is the in-memory one; so is its version
+            etag = versions.make_etag(
+                versions.CART, user_id, cart_store.version(user_id), catalog.version_token()
+            )
+            cached = versions.not_modified(etag)
+            if cached:
+                return cached
+            return versions.stamp(jsonify(cart_store.get(user_id)), etag)
+        except MySQLError as e:
+            current_app.logger.exception(e)
+            return jsonify({"errors": [{"msg": "Server error"}]}), 500
+    
     try:
         conn = pool.get_connection()
         cur = conn.cursor(dictionary=True)
         
-        # Get cart items with product details
-        cur.execute(
-            """
-            SELECT 
-                c.id as cart_item_id,
-                c.product_id,
-                c.quantity,
-                p.name as product_name,
-                p.price
-            FROM cart_items c
-            JOIN products p ON c.product_id = p.id
-            WHERE c.user_id = %s
-            ORDER BY c.added_at DESC
-            """,
-            (user_id,),
-        )
+        etag = versions.etag_for(cur, versions.CART, user_id, catalog.version_token())
+        cached = versions.not_modified(etag)
+        if cached:
+            return cached
         
-        items = cur.fetchall()
+        items, subtotal = cart_lines(cur, user_id)
         
-        # Calculate subtotal and format response
-        subtotal = 0
-        formatted_items = []
-        for item in items:
-            price = float(item['price'])
-            qty = item['quantity']
-            subtotal += price * qty
-            
-            formatted_items.append({
-                'id': item['cart_item_id'],
-                'productId': item['product_id'],
-                'productName': item['product_name'],
-                'qty': qty,
-                'price': price
-            })
-        
-        return jsonify({
-            'items': formatted_items,
+        return versions.stamp(jsonify({
+            'items': items,
             'subtotal': subtotal
-        })
+        }), etag)
         
     except MySQLError as e:
-        app.logger.exception(e)
+        current_app.logger.exception(e)
         return jsonify({"errors": [{"msg": "Server error"}]}), 500
     finally:
         try:
@@ -461,7 +845,7 @@ def get_cart():
             pass
 
 
-@app.post("/api/cart/items")
+@api.post("/api/cart/items")
 def add_item():
     """
     Add item to current user's cart.
@@ -484,6 +868,16 @@ def add_item():
     if qty < 1:
         return jsonify({"errors": [{"msg": "Quantity must be at least 1"}]}), 400
     
+    if CART_WRITE_BEHIND:
+        try:
+            cart_store.add(user_id, product_id, qty)
+            return jsonify({"ok": True})
+        except InvalidProduct:
+            return jsonify({"errors": [{"msg": "Invalid product"}]}), 400
+        except MySQLError as e:
+            current_app.logger.exception(e)
+            return jsonify({"errors": [{"msg": "Server error"}]}), 500
+    
     try:
         conn = pool.get_connection()
         cur = conn.cursor(dictionary=True)
@@ -524,11 +918,12 @@ def add_item():
                 (demo_token, user_id, product_id, qty),
             )
         
+        versions.bump(cur, user_id, versions.CART)
         conn.commit()
         return jsonify({"ok": True})
         
     except MySQLError as e:
-        app.logger.exception(e)
+        current_app.logger.exception(e)
         return jsonify({"errors": [{"msg": "Server error"}]}), 500
     finally:
         try:
@@ -538,7 +933,9 @@ def add_item():
             pass
 
 
-@app.patch("/api/cart/items/<int:cart_item_id>")
+# signed=True: the write-behind cart names lines added since the last flush
+# with negative ids (see cartstore.py)
+@api.patch("/api/cart/items/<int(signed=True):cart_item_id>")
 def update_item(cart_item_id):
     """
     Update quantity of item in current user's cart.
@@ -561,6 +958,16 @@ def update_item(cart_item_id):
     if qty < 1:
         return jsonify({"errors": [{"msg": "Quantity must be at least 1"}]}), 400
     
+    if CART_WRITE_BEHIND:
+        try:
+            cart_store.set_quantity(user_id, cart_item_id, qty)
+            return jsonify({"ok": True})
+        except CartItemNotFound:
+            return jsonify({"errors": [{"msg": "Item not found in your cart"}]}), 404
+        except MySQLError as e:
+            current_app.logger.exception(e)
+            return jsonify({"errors": [{"msg": "Server error"}]}), 500
+    
     try:
         conn = pool.get_connection()
         cur = conn.cursor()
@@ -578,11 +985,12 @@ def update_item(cart_item_id):
         if cur.rowcount == 0:
             return jsonify({"errors": [{"msg": "Item not found in your cart"}]}), 404
         
+        versions.bump(cur, user_id, versions.CART)
         conn.commit()
         return jsonify({"ok": True})
         
     except MySQLError as e:
-        app.logger.exception(e)
+        current_app.logger.exception(e)
         return jsonify({"errors": [{"msg": "Server error"}]}), 500
     finally:
         try:
@@ -592,7 +1000,7 @@ def update_item(cart_item_id):
             pass
 
 
-@app.delete("/api/cart/items/<int:cart_item_id>")
+@api.delete("/api/cart/items/<int(signed=True):cart_item_id>")
 def remove_item(cart_item_id):
     """
     Remove item from current user's cart.
@@ -606,6 +1014,16 @@ def remove_item(cart_item_id):
     """
     user_id = get_user_id_from_token()
     
+    if CART_WRITE_BEHIND:
+        try:
+            cart_store.remove(user_id, cart_item_id)
+            return jsonify({"ok": True})
+        except CartItemNotFound:
+            return jsonify({"errors": [{"msg": "Item not found in your cart"}]}), 404
+        except MySQLError as e:
+            current_app.logger.exception(e)
+            return jsonify({"errors": [{"msg": "Server error"}]}), 500
+    
     try:
         conn = pool.get_connection()
         cur = conn.cursor()
@@ -619,11 +1037,12 @@ def remove_item(cart_item_id):
         if cur.rowcount == 0:
             return jsonify({"errors": [{"msg": "Item not found in your cart"}]}), 404
         
+        versions.bump(cur, user_id, versions.CART)
         conn.commit()
         return jsonify({"ok": True})
         
     except MySQLError as e:
-        app.logger.exception(e)
+        current_app.logger.exception(e)
         return jsonify({"errors": [{"msg": "Server error"}]}), 500
     finally:
         try:
@@ -633,210 +1052,465 @@ def remove_item(cart_item_id):
             pass
 
 
-@app.post("/api/orders")
-def create_order():
+@api.post("/api/cart/batch")
+def batch_cart():
     """
-    Create order from current user's cart.
+    Apply many cart operations at once and return the resulting cart.
     Requires authentication.
     
-    Optional fields: shippingName, shippingEmail, shippingPhone, shippingAddress
+    Body: {"ops": [{"op": "add"|"set"|"remove", "productId" or "id", "qty"}]}
+    (see cartstore.parse_cart_ops). The batch is all or nothing and runs in
+    one transaction: one IN (...) query validates every product, the cart
+    rows are locked and read once, then a single
+    INSERT ... ON DUPLICATE KEY UPDATE on uniq_token_product and a single
+    DELETE write the final quantities.
     
     Returns:
-        201: Order created successfully
-        400: Cart is empty
+        200: Resulting cart (same shape as GET /api/cart)
+        400: Malformed operations or invalid product
         401: Not authenticated
+        404: An operation names a line not in the cart
         500: Server error
     """
     user_id = get_user_id_from_token()
     
-    # Read shipping info from request body
-    body = request.get_json(silent=True) or {}
-    shipping_name = body.get("shippingName")
-    shipping_email = body.get("shippingEmail")
-    shipping_phone = body.get("shippingPhone")
-    shipping_address = body.get("shippingAddress")
-    
+    data = request.get_json(silent=True) or {}
     try:
-        conn = pool.get_connection()
-        cur = conn.cursor(dictionary=True)
+        ops = parse_cart_ops(data.get("ops"))
+    except InvalidCartOps as e:
+        return jsonify({"errors": [{"msg": str(e)}]}), 400
+    
+    def apply_ops(cur):
+        # Validate every product the batch may add in one query
+        wanted = referenced_products(ops)
+        if wanted:
+            placeholders = ", ".join(["%s"] * len(wanted))
+            cur.execute(f"SELECT id FROM products WHERE id IN ({placeholders})", list(wanted))
+            missing = wanted - {row['id'] for row in cur.fetchall()}
+            if missing:
+                raise InvalidProduct(sorted(missing)[0])
         
-        # Get cart items
+        # Lock and read the current cart once
         cur.execute(
-            """
-            SELECT c.product_id, c.quantity, p.price
-            FROM cart_items c
-            JOIN products p ON c.product_id = p.id
-            WHERE c.user_id = %s
-            """,
+            "SELECT id, product_id, quantity FROM cart_items WHERE user_id = %s FOR UPDATE",
             (user_id,),
         )
+        rows = cur.fetchall()
+        current = {row['product_id']: row['quantity'] for row in rows}
+        final = apply_cart_ops(current, {row['id']: row['product_id'] for row in rows}, ops)
         
-        cart_items = cur.fetchall()
-        
-        if not cart_items:
-            return jsonify({"errors": [{"msg": "Cart is empty"}]}), 400
-        
-        # Calculate total
-        order_total = sum(float(item['price']) * item['quantity'] for item in cart_items)
-        
-        # Generate order ID and timestamp
-        order_id = uuid.uuid4().hex[:12]
-        created_at = datetime.datetime.utcnow()
-        demo_token = f"user_{user_id}"
-        
-        # Insert order
-        cur.execute(
-            """
-            INSERT INTO orders (
-                id, demo_token, user_id, total, status, created_at,
-                shipping_name, shipping_email, shipping_phone, shipping_address
-            )
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """,
-            (
-                order_id,
-                demo_token,
-                user_id,
-                order_total,
-                "pending",
-                created_at,
-                shipping_name,
-                shipping_email,
-                shipping_phone,
-                shipping_address,
-            ),
-        )
+        demo_token = demo_token_for(user_id)
+        changed = [(pid, qty) for pid, qty in final.items() if current.get(pid) != qty]
+        removed = list(current.keys() - final.keys())
         
-        # Insert order items
-        for item in cart_items:
-            price = float(item['price'])
-            qty = item['quantity']
-            line_total = price * qty
-            
+        if changed:
+            values = ", ".join(["(%s, %s, %s, %s)"] * len(changed))
             cur.execute(
-                """
-                INSERT INTO order_items
-                    (order_id, product_id, quantity, unit_price, line_total)
-                VALUES (%s, %s, %s, %s, %s)
+                f"""
+                INSERT INTO cart_items (demo_token, user_id, product_id, quantity)
+                VALUES {values}
+                ON DUPLICATE KEY UPDATE quantity = VALUES(quantity)
                 """,
-                (order_id, item['product_id'], qty, price, line_total),
+                [v for pid, qty in changed for v in (demo_token, user_id, pid, qty)],
             )
+        if removed:
+            placeholders = ", ".join(["%s"] * len(removed))
+            cur.execute(
+                f"DELETE FROM cart_items WHERE demo_token = %s AND product_id IN ({placeholders})",
+                [demo_token, *removed],
+            )
+        if changed or removed:
+            versions.bump(cur, user_id, versions.CART)
         
-        # Clear user's cart
-        cur.execute("DELETE FROM cart_items WHERE user_id = %s", (user_id,))
-        
-        conn.commit()
-        
-        # Build response
-        order_obj = {
-            "id": order_id,
-            "userId": user_id,
-            "items": [
-                {
-                    "productId": item['product_id'],
-                    "qty": item['quantity'],
-                    "price": float(item['price'])
-                }
-                for item in cart_items
-            ],
-            "total": order_total,
-            "status": "pending",
-            "createdAt": created_at.isoformat(),
+        return cart_lines(cur, user_id)
+    
+    try:
+        if CART_WRITE_BEHIND:
+            cart_store.apply_batch(user_id, ops)
+            return jsonify(cart_store.get(user_id))
+        items, subtotal = run_transaction(pool, apply_ops)
+        return jsonify({'items': items, 'subtotal': subtotal})
+    except InvalidProduct as e:
+        return jsonify({"errors": [{"msg": f"Invalid product: {e}"}]}), 400
+    except CartItemNotFound as e:
+        return jsonify({"errors": [{"msg": f"Item {e} not found in your cart"}]}), 404
+    except MySQLError as e:
+        current_app.logger.exception(e)
+        return jsonify({"errors": [{"msg": "Server error"}]}), 500
+
+
+def place_order_from_cart(cur, user_id, shipping, outcome=None):
+    """
+    Turn the user's cart into an order inside the caller's transaction.
+    
+    The cart rows are locked with SELECT ... FOR UPDATE so concurrent
+    checkouts from the same user cannot both turn the same cart into an
+    order, all order lines go in with a single multi-row insert, and the
+    cart is cleared. The user's cart and orders versions are bumped in
+    the same transaction.
+    
+    Args:
+        cur: Dictionary cursor inside an open transaction
+        user_id: Owner of the cart
+        shipping: Dict with name, email, phone, address (values may be None)
+        outcome: None to leave the order pending, or 'success' / 'failure'
+                 to record the payment result with the same insert
+    
+    Subtotal, tax and total are computed here once, in Decimal cents
+    (see pricing.py), and stored on the order so later reads never redo
+    the arithmetic.
+    
+    Returns:
+        dict: The order as written (same fields as the orders row, plus
+              items with product_id, product_name, quantity, unit_price),
+              or None if the cart is empty
+    """
+    # Get and lock the cart lines (OF c: product rows stay unlocked so
+    # checkouts of the same product by other users don't serialize)
+    cur.execute(
+        """
+        SELECT c.product_id, c.quantity, p.price, p.name as product_name
+        FROM cart_items c
+        JOIN products p ON c.product_id = p.id
+        WHERE c.user_id = %s
+        FOR UPDATE OF c
+        """,
+        (user_id,),
+    )
+    
+    cart_items = cur.fetchall()
+    
+    if not cart_items:
+        return None
+    
+    items = [
+        {
+            'product_id': item['product_id'],
+            'product_name': item['product_name'],
+            'quantity': item['quantity'],
+            'unit_price': float(item['price']),
         }
-        
-        return jsonify(order_obj), 201
-        
+        for item in cart_items
+    ]
+    subtotal, tax, total = order_amounts((item['price'], item['quantity']) for item in cart_items)
+    
+    order = {
+        'id': uuid.uuid4().hex[:12],
+        'user_id': user_id,
+        'subtotal': float(subtotal),
+        'tax': float(tax),
+        'total': float(total),
+        'status': 'pending',
+        'created_at': datetime.datetime.utcnow(),
+        'paid_at': None,
+        'tracking_number': None,
+        'estimated_delivery_date': None,
+        'shipping_name': shipping.get('name'),
+        'shipping_email': shipping.get('email'),
+        'shipping_phone': shipping.get('phone'),
+        'shipping_address': shipping.get('address'),
+        'items': items,
+    }
+    
+    if outcome == "success":
+        order['status'] = 'paid'
+        order['paid_at'] = order['created_at']
+        order['tracking_number'] = generate_tracking_number()
+        order['estimated_delivery_date'] = calculate_delivery_date(order['paid_at'])
+    elif outcome is not None:
+        order['status'] = 'failed'
+    
+    # Insert order
+    cur.execute(
+        """
+        INSERT INTO orders (
+            id, demo_token, user_id, subtotal, tax, total, status, created_at,
+            paid_at, tracking_number, estimated_delivery_date,
+            shipping_name, shipping_email, shipping_phone, shipping_address
+        )
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        """,
+        (
+            order['id'],
+            f"user_{user_id}",
+            user_id,
+            subtotal,
+            tax,
+            total,
+            order['status'],
+            order['created_at'],
+            order['paid_at'],
+            order['tracking_number'],
+            order['estimated_delivery_date'],
+            order['shipping_name'],
+            order['shipping_email'],
+            order['shipping_phone'],
+            order['shipping_address'],
+        ),
+    )
+    
+    # Insert all order items in one multi-row statement
+    cur.executemany(
+        """
+        INSERT INTO order_items
+            (order_id, product_id, quantity, unit_price, line_total)
+        VALUES (%s, %s, %s, %s, %s)
+        """,
+        [
+            (
+                order['id'],
+                item['product_id'],
+                item['quantity'],
+                item['price'],
+                to_cents(item['price']) * item['quantity'],
+            )
+            for item in cart_items
+        ],
+    )
+    
+    # Clear user's cart
+    cur.execute("DELETE FROM cart_items WHERE user_id = %s", (user_id,))
+    versions.bump(cur, user_id, versions.CART, versions.ORDERS)
+    
+    return order
+
+
+def shipping_from_body(body):
+    """Shipping fields from a checkout request body."""
+    return {
+        'name': body.get("shippingName"),
+        'email': body.get("shippingEmail"),
+        'phone': body.get("shippingPhone"),
+        'address': body.get("shippingAddress"),
+    }
+
+
+@api.post("/api/orders")
+@idempotent(idempotency, get_user_id_from_token)
+def create_order():
+    """
+    Create order from current user's cart.
+    Requires authentication.
+    
+    Runs as one transaction (see place_order_from_cart), retried if it
+    loses a deadlock or times out waiting for a lock. With the write-behind
+    cart enabled, the user's cart is flushed to cart_items first.
+    
+    Optional fields: shippingName, shippingEmail, shippingPhone, shippingAddress
+    
+    Send an Idempotency-Key header to make retries safe: a repeat with the
+    same key returns the original response without creating another order.
+    The key and the response are recorded in the order's transaction (see
+    idempotency.py).
+    
+    Returns:
+        201: Order created successfully
+        400: Cart is empty
+        401: Not authenticated
+        500: Server error
+    """
+    user_id = get_user_id_from_token()
+    
+    # Read shipping info from request body
+    shipping = shipping_from_body(request.get_json(silent=True) or {})
+    
+    def place(cur):
+        record_key(cur)
+        order = place_order_from_cart(cur, user_id, shipping)
+        if order is None:
+            return record_response(cur, (jsonify({"errors": [{"msg": "Cart is empty"}]}), 400))
+        return record_response(cur, (created_order_json(order, user_id), 201))
+    
+    try:
+        with cart_checkout(user_id):
+            return run_transaction(pool, place)
     except MySQLError as e:
-        app.logger.exception(e)
+        current_app.logger.exception(e)
         return jsonify({"errors": [{"msg": "Server error"}]}), 500
-    finally:
-        try:
-            cur.close()
-            conn.close()
-        except Exception:
-            pass
 
 
-@app.get("/api/orders")
+def created_order_json(order, user_id):
+    """Response body of POST /api/orders for a just-placed order."""
+    return jsonify({
+        "id": order['id'],
+        "userId": user_id,
+        "items": [
+            {
+                "productId": item['product_id'],
+                "qty": item['quantity'],
+                "price": item['unit_price']
+            }
+            for item in order['items']
+        ],
+        "subtotal": order['subtotal'],
+        "tax": order['tax'],
+        "total": order['total'],
+        "status": order['status'],
+        "createdAt": order['created_at'].isoformat(),
+    })
+
+
+def orders_page_query(user_id, after_key, limit):
+    """
+    SQL for one page of a user's orders, newest first.
+    
+    Args:
+        user_id: Owner of the orders
+        after_key: (created_at, id) of the previous page's last order, or None
+        limit: Rows to fetch
+    
+    Returns:
+        tuple: (query, params)
+    """
+    query = """
+        SELECT id, subtotal, tax, total, status, created_at, paid_at,
+               shipping_name, shipping_email, shipping_phone, shipping_address
+        FROM orders
+        WHERE user_id = %s
+    """
+    params = [user_id]
+    if after_key:
+        after_created, after_id = after_key
+        query += " AND (created_at < %s OR (created_at = %s AND id < %s))"
+        params.extend([after_created, after_created, after_id])
+    query += " ORDER BY created_at DESC, id DESC LIMIT %s"
+    params.append(limit)
+    return query, params
+
+
+def order_items_query(order_ids):
+    """SQL for the items of several orders at once: (query, params)."""
+    placeholders = ", ".join(["%s"] * len(order_ids))
+    query = f"""
+        SELECT oi.order_id, oi.product_id, oi.quantity, oi.unit_price,
+               p.name as product_name
+        FROM order_items oi
+        JOIN products p ON oi.product_id = p.id
+        WHERE oi.order_id IN ({placeholders})
+        ORDER BY oi.id
+    """
+    return query, list(order_ids)
+
+
+# Row -> response shapes for GET /api/orders. Decimal amounts and dates
+# are encoded by the JSON provider, so rows map through unconverted.
+ORDER_ROW = RowMapper({
+    'id': 'id',
+    'total': 'total',
+    'subtotal': 'subtotal',
+    'tax': 'tax',
+    'status': 'status',
+    'createdAt': 'created_at',
+    'paidAt': 'paid_at',
+    'shippingName': 'shipping_name',
+    'shippingEmail': 'shipping_email',
+    'shippingPhone': 'shipping_phone',
+    'shippingAddress': 'shipping_address',
+})
+
+ORDER_ITEM_ROW = RowMapper({
+    'productId': 'product_id',
+    'productName': 'product_name',
+    'name': 'product_name',       # ✅ Added for compatibility
+    'quantity': 'quantity',       # ✅ Added for compatibility
+    'unitPrice': 'unit_price',    # ✅ Added for compatibility
+    'qty': 'quantity',
+    'price': 'unit_price',
+})
+
+
+def orders_json(orders, items):
+    """
+    Shape order rows and their item rows for GET /api/orders.
+    
+    Args:
+        orders: Rows from orders_page_query
+        items: Rows from order_items_query
+    
+    Returns:
+        list: Orders in the API shape, in the order given
+    """
+    result = ORDER_ROW.many(orders)
+    by_id = {}
+    for order in result:
+        order['items'] = by_id[order['id']] = []
+    for row, item in zip(items, ORDER_ITEM_ROW.many(items)):
+        by_id[row['order_id']].append(item)
+    return result
+
+
+@api.get("/api/orders")
 def list_orders():
     """
     ✅ FIXED: Get current user's order history FROM DATABASE
     Returns properly formatted data for frontend with subtotal and tax
+    (stored on the order when it was placed; nothing is recomputed here)
+    
+    Keyset-paginated on (created_at, id), newest first, using
+    idx_orders_user_created. Items for the whole page are fetched with a
+    single batched IN (...) query, so a page costs two queries no matter
+    how long the user's history is.
+    
+    Conditional: the ETag covers the orders version, the catalog version
+    (item names come from products) and the page's query string, so
+    If-None-Match is answered without running the page queries.
+    
+    Query params:
+        limit: Page size (default 50, max 200)
+        after: Cursor from the previous page's X-Next-Cursor header
     
     Returns:
-        200: List of orders with items
+        200: List of orders with items (X-Next-Cursor set if more pages;
+             ETag, Cache-Control: private, no-cache)
+        304: Client's copy of this page is current
+        400: Invalid limit or cursor
         401: Not authenticated
         500: Server error
     """
     user_id = get_user_id_from_token()
     
+    try:
+        limit = parse_limit(request.args.get("limit"))
+        after = request.args.get("after")
+        after_key = decode_cursor(after, 2) if after else None
+    except InvalidQuery as e:
+        return jsonify({"errors": [{"msg": str(e)}]}), 400
+    
     try:
         conn = pool.get_connection()
         cur = conn.cursor(dictionary=True)
         
-        # Get orders for this user
-        cur.execute(
-            """
-            SELECT id, total, status, created_at, paid_at,
-                   shipping_name, shipping_email, shipping_phone, shipping_address
-            FROM orders
-            WHERE user_id = %s
-            ORDER BY created_at DESC
-            """,
-            (user_id,),
+        etag = versions.etag_for(
+            cur, versions.ORDERS, user_id, catalog.version_token(), request.query_string.decode()
         )
+        cached = versions.not_modified(etag)
+        if cached:
+            return cached
         
+        # Get one page of orders for this user (one extra row tells us
+        # whether another page exists)
+        cur.execute(*orders_page_query(user_id, after_key, limit + 1))
         orders = cur.fetchall()
         
-        # Get items for each order
-        result = []
-        for order in orders:
-            cur.execute(
-                """
-                SELECT oi.product_id, oi.quantity, oi.unit_price, p.name as product_name
-                FROM order_items oi
-                JOIN products p ON oi.product_id = p.id
-                WHERE oi.order_id = %s
-                """,
-                (order['id'],),
-            )
-            
+        has_more = len(orders) > limit
+        orders = orders[:limit]
+        
+        # Get items for every order on the page in one round trip
+        items = []
+        if orders:
+            cur.execute(*order_items_query([order['id'] for order in orders]))
             items = cur.fetchall()
-            
-            # ✅ Calculate subtotal and tax
-            subtotal = sum(float(item['unit_price']) * item['quantity'] for item in items)
-            tax = subtotal * 0.08
-            
-            result.append({
-                'id': order['id'],
-                'total': float(order['total']),
-                'subtotal': round(subtotal, 2),  # ✅ Added
-                'tax': round(tax, 2),            # ✅ Added
-                'status': order['status'],
-                'createdAt': order['created_at'].isoformat() if order['created_at'] else None,
-                'paidAt': order['paid_at'].isoformat() if order['paid_at'] else None,
-                'shippingName': order.get('shipping_name'),
-                'shippingEmail': order.get('shipping_email'),
-                'shippingPhone': order.get('shipping_phone'),
-                'shippingAddress': order.get('shipping_address'),
-                'items': [
-                    {
-                        'productId': item['product_id'],
-                        'productName': item['product_name'],
-                        'name': item['product_name'],          # ✅ Added for compatibility
-                        'quantity': item['quantity'],          # ✅ Added for compatibility
-                        'unitPrice': float(item['unit_price']),  # ✅ Added for compatibility
-                        'qty': item['quantity'],
-                        'price': float(item['unit_price'])
-                    }
-                    for item in items
-                ]
-            })
-        
-        return jsonify(result)
+        
+        result = orders_json(orders, items)
+        
+        response = versions.stamp(jsonify(result), etag)
+        if has_more:
+            last = orders[-1]
+            response.headers[NEXT_CURSOR_HEADER] = encode_cursor(last['created_at'], last['id'])
+        return response
         
     except MySQLError as e:
-        app.logger.exception(e)
+        current_app.logger.exception(e)
         return jsonify({"errors": [{"msg": "Server error"}]}), 500
     finally:
         try:
@@ -846,18 +1520,25 @@ def list_orders():
             pass
 
 
-@app.post("/api/payments/mock")
+@api.post("/api/payments/mock")
+@idempotent(idempotency, get_user_id_from_token)
 def pay():
     """
     Mock payment processing for an order.
     Requires authentication.
     
     Required fields: orderId, outcome (success/failure)
+    Honors the Idempotency-Key header (see create_order).
+    
+    Only a pending order can be paid; the status update is conditional on
+    it still being pending, so two concurrent payments can't both succeed
+    (and send two confirmation emails).
     
     Returns:
         200: Payment processed
         401: Not authenticated
         404: Order not found or doesn't belong to user
+        409: Order is not pending (already paid, failed or cancelled)
         500: Server error
     """
     user_id = get_user_id_from_token()
@@ -874,33 +1555,31 @@ def pay():
         
         # Verify order belongs to user
         cur.execute(
-            "SELECT id, total, status FROM orders WHERE id = %s AND user_id = %s",
+            """
+            SELECT o.id, o.subtotal, o.tax, o.total, o.status, o.created_at,
+                   o.shipping_name, o.shipping_email, o.shipping_address, u.email
+            FROM orders o
+            JOIN users u ON o.user_id = u.id
+            WHERE o.id = %s AND o.user_id = %s
+            """,
             (order_id, user_id),
         )
         
         order = cur.fetchone()
         if not order:
             return jsonify({"errors": [{"msg": "Order not found"}]}), 404
+        if order['status'] != 'pending':
+            return jsonify({"errors": [{"msg": f"Order is already {order['status']}"}]}), 409
         
-        # Update order status
-        if new_status == "paid":
-            cur.execute(
-                "UPDATE orders SET status = %s, paid_at = %s WHERE id = %s",
-                (new_status, datetime.datetime.utcnow(), order_id),
-            )
-        else:
-            cur.execute(
-                "UPDATE orders SET status = %s WHERE id = %s",
-                (new_status, order_id),
-            )
-        
-        conn.commit()
+        # Idempotency-Key commits (or rolls back) with the payment
+        record_key(cur)
         
-        # Get updated order with items
+        # Get order items
         cur.execute(
             """
-            SELECT oi.product_id, oi.quantity, oi.unit_price
+            SELECT oi.product_id, oi.quantity, oi.unit_price, p.name as product_name
             FROM order_items oi
+            JOIN products p ON oi.product_id = p.id
             WHERE oi.order_id = %s
             """,
             (order_id,),
@@ -908,7 +1587,43 @@ def pay():
         
         items = cur.fetchall()
         
-        return jsonify({
+        # Update order status
+        if new_status == "paid":
+            paid_at = datetime.datetime.utcnow()
+            tracking_number = generate_tracking_number()
+            delivery_date = calculate_delivery_date(paid_at)
+            cur.execute(
+                """
+                UPDATE orders
+                SET status = %s, paid_at = %s, tracking_number = %s, estimated_delivery_date = %s
+                WHERE id = %s AND status = 'pending'
+                """,
+                (new_status, paid_at, tracking_number, delivery_date, order_id),
+            )
+            if cur.rowcount == 0:
+                # Another payment for this order committed first
+                conn.rollback()
+                return jsonify({"errors": [{"msg": "Order is no longer pending"}]}), 409
+            
+            # Confirmation email goes into the outbox in this same
+            # transaction; the dispatcher sends it after we commit
+            enqueue_email(
+                cur,
+                "order_confirmation",
+                order['shipping_email'] or order['email'],
+                order_confirmation_payload(order, items, tracking_number, delivery_date),
+            )
+        else:
+            cur.execute(
+                "UPDATE orders SET status = %s WHERE id = %s AND status = 'pending'",
+                (new_status, order_id),
+            )
+            if cur.rowcount == 0:
+                conn.rollback()
+                return jsonify({"errors": [{"msg": "Order is no longer pending"}]}), 409
+        
+        versions.bump(cur, user_id, versions.ORDERS)
+        response = record_response(cur, jsonify({
             "id": order_id,
             "status": new_status,
             "total": float(order['total']),
@@ -920,10 +1635,14 @@ def pay():
                 }
                 for item in items
             ]
-        })
+        }))
+        conn.commit()
+        notifier.wake()
+        
+        return response
         
     except MySQLError as e:
-        app.logger.exception(e)
+        current_app.logger.exception(e)
         return jsonify({"errors": [{"msg": "Server error"}]}), 500
     finally:
         try:
@@ -933,10 +1652,353 @@ def pay():
             pass
 
 
-# ---------- REGISTER PAYMENT ROUTES ----------
+# ---------- CHECKOUT ROUTES ----------
+
+DEFAULT_PAYMENT_METHOD_SQL = """
+    SELECT id, card_type, cardholder_name, last_four_digits, expiry_date
+    FROM payment_methods
+    WHERE user_id = %s AND is_default = TRUE
+    LIMIT 1
+"""
 
-register_payment_routes(app, pool, JWT_SECRET, PAYMENT_ENCRYPTION_KEY)
+
+def checkout_summary_json(profile, method, items):
+    """
+    Shape GET /api/checkout/summary.
+    
+    Args:
+        profile: Row from PROFILE_SQL
+        method: Row from DEFAULT_PAYMENT_METHOD_SQL, or None
+        items: Cart items in the GET /api/cart shape
+    """
+    # Same arithmetic as the order that checkout will store
+    subtotal, tax, total = order_amounts((item['price'], item['qty']) for item in items)
+    
+    return {
+        'profile': profile,
+        'paymentMethod': DEFAULT_PAYMENT_METHOD_ROW.one(method),
+        'cart': {
+            'items': items,
+            'subtotal': float(subtotal),
+            'tax': float(tax),
+            'total': float(total)
+        }
+    }
+
+
+@api.get("/api/checkout/summary")
+def checkout_summary():
+    """
+    Everything the checkout page needs, in one request.
+    Requires authentication.
+    
+    Replaces the separate /api/account/me, /api/payment-methods/default
+    and /api/cart calls: the token is decoded once and the three reads
+    share one pooled connection.
+    
+    Returns:
+        200: {profile, paymentMethod (or null), cart: {items, subtotal, tax, total}}
+        401: Not authenticated
+        404: User not found
+        500: Server error
+    """
+    user_id = get_user_id_from_token()
+    
+    try:
+        conn = pool.get_connection()
+        cur = conn.cursor(dictionary=True)
+        
+        # Profile and shipping fields (same shape as /api/account/me)
+        cur.execute(
+            PROFILE_SQL,
+            (user_id,),
+        )
+        profile = cur.fetchone()
+        if not profile:
+            abort(404, "User not found")
+        
+        # Default payment method (same shape as /api/payment-methods/default)
+        cur.execute(DEFAULT_PAYMENT_METHOD_SQL, (user_id,))
+        method = cur.fetchone()
+        
+        # Cart lines (same shape as /api/cart)
+        if CART_WRITE_BEHIND:
+            cart = cart_store.get(user_id)
+            items = cart['items']
+        else:
+            items, _ = cart_lines(cur, user_id)
+        
+        return jsonify(checkout_summary_json(profile, method, items))
+        
+    except MySQLError as e:
+        current_app.logger.exception(e)
+        return jsonify({"errors": [{"msg": "Server error"}]}), 500
+    finally:
+        try:
+            cur.close()
+            conn.close()
+        except Exception:
+            pass
+
+
+@api.post("/api/checkout")
+@idempotent(idempotency, get_user_id_from_token)
+def checkout():
+    """
+    Place and pay for an order from the current user's cart in one step.
+    Requires authentication.
+    
+    Does what POST /api/orders followed by POST /api/payments/mock does,
+    in a single transaction: the order is inserted with its payment
+    outcome already applied, the cart is cleared and (on success) the
+    confirmation email is queued in the outbox. The response is built from
+    what was written, so nothing is read back.
+    
+    Optional fields: shippingName, shippingEmail, shippingPhone,
+                     shippingAddress, outcome (success/failure)
+    Honors the Idempotency-Key header (see create_order).
+    
+    Returns:
+        201: Order placed (status 'paid' or 'failed')
+        400: Cart is empty
+        401: Not authenticated
+        500: Server error
+    """
+    user_id = get_user_id_from_token()
+    
+    body = request.get_json(silent=True) or {}
+    shipping = shipping_from_body(body)
+    outcome = "success" if body.get("outcome", "success") == "success" else "failure"
+    
+    def queue_confirmation(cur, order):
+        recipient = order['shipping_email']
+        if not recipient:
+            cur.execute("SELECT email FROM users WHERE id = %s", (user_id,))
+            row = cur.fetchone()
+            recipient = row['email'] if row else None
+        if recipient:
+            enqueue_email(
+                cur,
+                "order_confirmation",
+                recipient,
+                order_confirmation_payload(
+                    order, order['items'], order['tracking_number'], order['estimated_delivery_date']
+                ),
+            )
+    
+    def place_and_pay(cur):
+        record_key(cur)
+        order = place_order_from_cart(cur, user_id, shipping, outcome)
+        if order is None:
+            return order, record_response(cur, (jsonify({"errors": [{"msg": "Cart is empty"}]}), 400))
+        if order['status'] == 'paid':
+            queue_confirmation(cur, order)
+        return order, record_response(cur, (checkout_json(order, user_id), 201))
+    
+    try:
+        with cart_checkout(user_id):
+            order, response = run_transaction(pool, place_and_pay)
+    except MySQLError as e:
+        current_app.logger.exception(e)
+        return jsonify({"errors": [{"msg": "Server error"}]}), 500
+    
+    if order is not None and order['status'] == 'paid':
+        notifier.wake()
+    
+    return response
+
+
+def checkout_json(order, user_id):
+    """Response body of POST /api/checkout for a just-placed order."""
+    delivery_date = order['estimated_delivery_date']
+    return jsonify({
+        "id": order['id'],
+        "userId": user_id,
+        "status": order['status'],
+        "subtotal": order['subtotal'],
+        "tax": order['tax'],
+        "total": order['total'],
+        "createdAt": order['created_at'].isoformat(),
+        "paidAt": order['paid_at'].isoformat() if order['paid_at'] else None,
+        "trackingNumber": order['tracking_number'],
+        "estimatedDeliveryDate": delivery_date.isoformat() if delivery_date else None,
+        "shippingName": order['shipping_name'],
+        "shippingEmail": order['shipping_email'],
+        "shippingPhone": order['shipping_phone'],
+        "shippingAddress": order['shipping_address'],
+        "items": [
+            {
+                "productId": item['product_id'],
+                "productName": item['product_name'],
+                "qty": item['quantity'],
+                "price": item['unit_price']
+            }
+            for item in order['items']
+        ]
+    })
+
+
+# ---------- ADMIN ROUTES ----------
+
+def require_admin():
+    """
+    Check the X-Admin-Token header against ADMIN_TOKEN.
+    
+    Returns:
+        None if the caller is an admin, otherwise the error response:
+        404: Admin routes are disabled (ADMIN_TOKEN not set)
+        403: Token missing or wrong
+    """
+    if not ADMIN_TOKEN:
+        return jsonify({"errors": [{"msg": "Not found"}]}), 404
+    supplied = request.headers.get("X-Admin-Token", "")
+    if not hmac.compare_digest(supplied.encode(), ADMIN_TOKEN.encode()):
+        return jsonify({"errors": [{"msg": "Invalid admin token"}]}), 403
+    return None
+
+
+@api.post("/api/admin/products/import")
+@compress(level=1)
+def import_products():
+    """
+    Bulk import/upsert products from a CSV or NDJSON request body.
+    Requires the X-Admin-Token header.
+    
+    The body is read as a stream and written in chunks (see
+    product_import.py), so feeds of any size use bounded memory. The
+    response streams one NDJSON progress line per chunk; the last line
+    is the full result, with the first invalid rows under "errors".
+    The catalog version is bumped once, after the last chunk. Progress
+    lines are compressed at level 1 and flushed one by one.
+    
+    Query params:
+        format: csv or ndjson (default: from Content-Type, else csv)
+        chunk: Rows per upsert (default IMPORT_CHUNK_SIZE)
+    
+    Returns:
+        200: NDJSON progress stream
+        400: Unknown format or bad chunk size
+        403: Invalid admin token
+        404: Admin routes disabled
+    """
+    denied = require_admin()
+    if denied:
+        return denied
+    
+    fmt = request.args.get("format") or format_for(request.content_type)
+    if fmt not in IMPORT_FORMATS:
+        return jsonify({"errors": [{"msg": f"format must be one of: {', '.join(IMPORT_FORMATS)}"}]}), 400
+    chunk_size = request.args.get("chunk", str(IMPORT_CHUNK_SIZE))
+    if not chunk_size.isdigit() or not 1 <= int(chunk_size) <= 10000:
+        return jsonify({"errors": [{"msg": "chunk must be between 1 and 10000"}]}), 400
+    
+    stream = io.TextIOWrapper(
+        io.BufferedReader(request.stream), encoding="utf-8-sig", newline=""
+    )
+    
+    def generate():
+        result = None
+        try:
+            for result in run_import(pool, stream, fmt, int(chunk_size)):
+                yield json.dumps(result if result["done"] else progress_line(result)) + "\n"
+        except (MySQLError, *FEED_ERRORS) as e:
+            # Headers are already sent: report the failure as the last line
+            current_app.logger.exception(e)
+            yield json.dumps({"errors": [{"msg": "Import stopped: " + type(e).__name__}],
+                              "imported": result["imported"] if result else 0}) + "\n"
+        finally:
+            # Chunks already written stay written, so bump even on failure
+            if result and result["imported"]:
+                catalog.bump()
+    
+    return current_app.response_class(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+
+# ---------- BACKGROUND WORKERS ----------
+
+notifier = NotificationDispatcher(pool)
+
+_background_pid = None
+_background_lock = threading.Lock()
+
+
+def warm_search_index(app):
+    """Build the search index at startup, off the request path."""
+    try:
+        synced_search_index()
+    except MySQLError as e:
+        app.logger.warning("Search index not built at startup: %s", e)
+
+
+def start_background(app):
+    """
+    Start this process's background work: the email dispatcher, the
+    write-behind cart flusher and the search index warm-up.
+    
+    Threads don't survive fork(), so this runs once per process - from
+    the gunicorn post_fork hook (see gunicorn.conf.py), or otherwise on
+    the first request the process serves.
+    """
+    global _background_pid
+    pid = os.getpid()
+    if _background_pid == pid:
+        return
+    with _background_lock:
+        if _background_pid == pid:
+            return
+        _background_pid = pid
+    
+    if NOTIFICATIONS_ENABLED:
+        notifier.start()
+    if CART_WRITE_BEHIND:
+        cart_store.start()
+    threading.Thread(target=warm_search_index, args=(app,), name="search-warmup", daemon=True).start()
+
+
+def stop_background():
+    """Write out pending carts and let in-flight emails finish (worker exit)."""
+    if _background_pid != os.getpid():
+        return
+    if CART_WRITE_BEHIND:
+        cart_store.stop()
+    notifier.stop()
+
+
+# ---------- APP FACTORY ----------
+
+def create_app(config=None):
+    """
+    Build the Flask app.
+    
+    Nothing here touches the database: the pool opens on first use in each
+    process, so the app can be created once in a preforking server's
+    master and shared with its workers (see wsgi.py, gunicorn.conf.py).
+    
+    Args:
+        config: Optional dict merged into app.config. BACKGROUND_WORKERS
+                (default True) starts the background work on each
+                process's first request; set it False to skip it (scripts,
+                one-off tools) or to call start_background() yourself.
+    
+    Returns:
+        Flask: The app with every route registered
+    """
+    app = Flask(__name__)
+    FastJSONProvider.install(app)
+    app.config["BACKGROUND_WORKERS"] = True
+    app.config.update(config or {})
+    
+    CORS(app, expose_headers=[NEXT_CURSOR_HEADER, REPLAYED_HEADER])
+    app.register_blueprint(api)
+    register_payment_routes(app, pool, JWT_SECRET, PAYMENT_VAULT)
+    compressor.init_app(app)
+    
+    if app.config["BACKGROUND_WORKERS"]:
+        app.before_request(lambda: start_background(app))
+    
+    return app
 
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=8000, debug=True)
\ No newline at end of file
+    # Single-process development server; see gunicorn.conf.py for production
+    create_app().run(host="0.0.0.0", port=8000, debug=True)
@@ -0,0 +1,444 @@
+"""
+notifications.py - Background email dispatcher backed by a durable outbox
+
+Handles:
+- Enqueuing emails into the `email_outbox` table inside the caller's
+  transaction (the email exists if and only if the order write committed)
+- A background dispatcher that claims due rows in batches, renders them and
+  hands them to a bounded worker pool for delivery
+- Retries with exponential backoff, giving up after a maximum attempt count
+- Pluggable transports: Resend, a plain HTTP endpoint (e.g. a local stub
+  server), or the application log
+
+Request handlers only ever INSERT into the outbox, so checkout latency does
+not depend on the email provider.
+"""
+
+import datetime
+import json
+import logging
+import os
+import threading
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from mysql.connector import Error as MySQLError
+
+import confirmation
+
+log = logging.getLogger(__name__)
+
+NOTIFICATIONS_ENABLED = os.environ.get("NOTIFICATIONS_ENABLED", "1") == "1"
+NOTIFICATIONS_WORKERS = int(os.environ.get("NOTIFICATIONS_WORKERS", "2"))
+NOTIFICATIONS_BATCH_SIZE = int(os.environ.get("NOTIFICATIONS_BATCH_SIZE", "50"))
+NOTIFICATIONS_POLL_INTERVAL = float(os.environ.get("NOTIFICATIONS_POLL_INTERVAL", "2"))
+NOTIFICATIONS_MAX_ATTEMPTS = int(os.environ.get("NOTIFICATIONS_MAX_ATTEMPTS", "8"))
+NOTIFICATIONS_LEASE_SECONDS = int(os.environ.get("NOTIFICATIONS_LEASE_SECONDS", "120"))
+
+EMAIL_TRANSPORT = os.environ.get("EMAIL_TRANSPORT", "resend")
+EMAIL_TRANSPORT_URL = os.environ.get("EMAIL_TRANSPORT_URL", "http://127.0.0.1:8025/emails/batch")
+
+
+def _utcnow():
+    return datetime.datetime.utcnow().replace(microsecond=0)
+
+
+# ========== RENDERING ==========
+
+def _render_order_confirmation(recipient, payload, buf):
+    order_data = dict(payload)
+    order_data["estimated_delivery_date"] = datetime.date.fromisoformat(
+        payload["estimated_delivery_date"]
+    )
+    if payload.get("created_at"):
+        order_data["created_at"] = datetime.datetime.fromisoformat(payload["created_at"])
+    return confirmation.build_order_confirmation(order_data, recipient, buf=buf)
+
+
+def _render_delivery_update(recipient, payload, buf):
+    return confirmation.build_delivery_update(
+        payload["order_id"], recipient, payload["status"], payload.get("tracking_url")
+    )
+
+
+RENDERERS = {
+    "order_confirmation": _render_order_confirmation,
+    "delivery_update": _render_delivery_update,
+}
+
+
+def order_confirmation_payload(order, items, tracking_number, delivery_date):
+    """
+    Outbox payload for an order confirmation.
+
+    Args:
+        order: Order row (id, subtotal, tax, total, created_at,
+               shipping_name, shipping_address)
+        items: Order item rows (product_name, quantity, unit_price)
+        tracking_number: Tracking number assigned at payment
+        delivery_date: Estimated delivery date
+
+    Returns:
+        dict: JSON-serializable payload for enqueue_email
+    """
+    return {
+        "id": order["id"],
+        "subtotal": float(order["subtotal"]),
+        "tax": float(order["tax"]),
+        "total": float(order["total"]),
+        "items": [
+            {
+                "productName": item["product_name"],
+                "qty": item["quantity"],
+                "price": float(item["unit_price"]),
+            }
+            for item in items
+        ],
+        "shipping_name": order.get("shipping_name") or "",
+        "shipping_address": order.get("shipping_address") or "",
+        "estimated_delivery_date": delivery_date.isoformat(),
+        "tracking_number": tracking_number,
+        "created_at": order["created_at"].isoformat(),
+    }
+
+
+def enqueue_email(cur, kind, recipient, payload):
+    """
+    Add an email to the outbox using the caller's cursor.
+
+    Nothing is sent until the caller commits, and if the caller rolls back
+    the email disappears with the rest of the transaction.
+
+    Args:
+        cur: Cursor inside the caller's open transaction
+        kind: Key of RENDERERS ('order_confirmation', 'delivery_update')
+        recipient: Email address
+        payload: JSON-serializable dict the renderer needs
+    """
+    if kind not in RENDERERS:
+        raise ValueError(f"Unknown email kind: {kind}")
+    cur.execute(
+        """
+        INSERT INTO email_outbox (kind, recipient, payload, status, next_attempt_at)
+        VALUES (%s, %s, %s, 'pending', %s)
+        """,
+        (kind, recipient, json.dumps(payload, default=str), _utcnow()),
+    )
+
+
+# ========== TRANSPORTS ==========
+
+class ResendTransport:
+    """Deliver through Resend, using its batch endpoint when available."""
+
+    def send_batch(self, messages):
+        """
+        Args:
+            messages: List of Resend send params
+
+        Returns:
+            list: One error string (or None on success) per message
+        """
+        client = confirmation.resend_client()
+        batch = getattr(client, "Batch", None)
+        if batch is not None and len(messages) > 1:
+            try:
+                batch.send(messages)
+                return [None] * len(messages)
+            except Exception as e:
+                return [str(e)] * len(messages)
+
+        errors = []
+        for params in messages:
+            try:
+                client.Emails.send(params)
+                errors.append(None)
+            except Exception as e:
+                errors.append(str(e))
+        return errors
+
+
+class HttpTransport:
+    """
+    POST each batch as JSON ({"messages": [...]}) to a plain HTTP endpoint.
+
+    Pointed at email_stub_server.py this exercises the whole outbox path
+    without talking to a real provider. The endpoint may answer with
+    {"errors": [null | "reason", ...]} to fail individual messages.
+    """
+
+    def __init__(self, url=EMAIL_TRANSPORT_URL, timeout=10):
+        self.url = url
+        self.timeout = timeout
+
+    def send_batch(self, messages):
+        body = json.dumps({"messages": messages}).encode()
+        req = urllib.request.Request(
+            self.url, data=body, method="POST",
+            headers={"Content-Type": "application/json"},
+        )
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as res:
+                reply = json.loads(res.read() or b"{}")
+        except Exception as e:
+            return [str(e)] * len(messages)
+        errors = reply.get("errors") or []
+        return [errors[i] if i < len(errors) else None for i in range(len(messages))]
+
+
+class LogTransport:
+    """Write emails to the log instead of sending them (local development)."""
+
+    def send_batch(self, messages):
+        for params in messages:
+            log.info("Email to %s: %s", ", ".join(params["to"]), params["subject"])
+        return [None] * len(messages)
+
+
+def transport_from_env():
+    """Pick the transport named by EMAIL_TRANSPORT (resend, http or log)."""
+    if EMAIL_TRANSPORT == "http":
+        return HttpTransport(EMAIL_TRANSPORT_URL)
+    if EMAIL_TRANSPORT == "log":
+        return LogTransport()
+    return ResendTransport()
+
+
+# ========== DISPATCHER ==========
+
+class NotificationDispatcher:
+    """
+    Drains the email outbox in the background.
+
+    A single poller thread claims due rows in batches (SELECT ... FOR UPDATE
+    SKIP LOCKED, so several processes can run dispatchers side by side) and
+    leases them by marking them 'sending'. Each batch is delivered on a
+    bounded thread pool; the poller stops claiming while every worker is
+    busy. Rows whose lease runs out (e.g. the process died mid-send) become
+    claimable again.
+    """
+
+    def __init__(self, pool, transport=None, workers=NOTIFICATIONS_WORKERS,
+                 batch_size=NOTIFICATIONS_BATCH_SIZE, poll_interval=NOTIFICATIONS_POLL_INTERVAL,
+                 max_attempts=NOTIFICATIONS_MAX_ATTEMPTS, lease_seconds=NOTIFICATIONS_LEASE_SECONDS):
+        self.pool = pool
+        self.transport = transport or transport_from_env()
+        self.workers = workers
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+
+        self._executor = None
+        self._thread = None
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._slots = threading.BoundedSemaphore(workers)
+        self._lock = threading.Lock()
+
+        self.sent = 0
+        self.failed = 0
+        self.dead = 0
+        self.batches = 0
+
+    def start(self):
+        """Start the poller thread and worker pool (idempotent)."""
+        if self._thread is not None:
+            return
+        self._stopping.clear()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="email")
+        self._thread = threading.Thread(target=self._run, name="email-dispatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10):
+        """Stop claiming new work and wait for in-flight batches."""
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._wakeup.set()
+        self._thread.join(timeout)
+        self._executor.shutdown(wait=True)
+        self._thread = None
+        self._executor = None
+
+    def wake(self):
+        """Poll right away instead of waiting for the next interval."""
+        self._wakeup.set()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            claimed = 0
+            if self._slots.acquire(timeout=self.poll_interval):
+                try:
+                    batch = self._claim()
+                except Exception:
+                    log.exception("Failed to claim email outbox batch")
+                    batch = []
+                if batch:
+                    claimed = len(batch)
+                    self._executor.submit(self._deliver, batch)
+                else:
+                    self._slots.release()
+            # A full batch means there is probably more waiting
+            if claimed < self.batch_size:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+    def _claim(self):
+        """
+        Lease up to batch_size due rows. Returns a list of row dicts.
+
+        Each claim counts as an attempt, so a row whose lease ran out (the
+        worker crashed or hung while sending it) still uses one up; once a
+        reclaimed row has none left it goes straight to dead.
+        """
+        conn = self.pool.get_connection()
+        try:
+            cur = conn.cursor(dictionary=True)
+            now = _utcnow()
+            cur.execute(
+                """
+                SELECT id, kind, recipient, payload, attempts
+                FROM email_outbox
+                WHERE (status = 'pending' AND next_attempt_at <= %s)
+                   OR (status = 'sending' AND locked_until < %s)
+                ORDER BY next_attempt_at
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+                """,
+                (now, now, self.batch_size),
+            )
+            rows = cur.fetchall()
+            exhausted = [r for r in rows if r["attempts"] >= self.max_attempts]
+            rows = [r for r in rows if r["attempts"] < self.max_attempts]
+            if exhausted:
+                placeholders = ", ".join(["%s"] * len(exhausted))
+                cur.execute(
+                    f"""
+                    UPDATE email_outbox
+                    SET status = 'dead', locked_until = NULL,
+                        last_error = 'lease expired on the last attempt'
+                    WHERE id IN ({placeholders})
+                    """,
+                    [r["id"] for r in exhausted],
+                )
+            if rows:
+                placeholders = ", ".join(["%s"] * len(rows))
+                cur.execute(
+                    f"""
+                    UPDATE email_outbox
+                    SET status = 'sending', locked_until = %s, attempts = attempts + 1
+                    WHERE id IN ({placeholders})
+                    """,
+                    [now + datetime.timedelta(seconds=self.lease_seconds)] + [r["id"] for r in rows],
+                )
+            conn.commit()
+            cur.close()
+            if exhausted:
+                with self._lock:
+                    self.dead += len(exhausted)
+                log.warning("Gave up on %d email(s) whose last lease expired", len(exhausted))
+            return rows
+        except MySQLError:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def _deliver(self, rows):
+        """Render and send one claimed batch, then record the outcome."""
+        try:
+            messages, sendable, errors = [], [], {}
+            buf = []  # one render buffer for the whole batch
+            for row in rows:
+                try:
+                    payload = row["payload"]
+                    if isinstance(payload, (bytes, str)):
+                        payload = json.loads(payload)
+                    messages.append(RENDERERS[row["kind"]](row["recipient"], payload, buf))
+                    sendable.append(row)
+                except Exception as e:
+                    errors[row["id"]] = f"render failed: {e}"
+
+            if messages:
+                for row, error in zip(sendable, self.transport.send_batch(messages)):
+                    if error:
+                        errors[row["id"]] = error
+
+            self._record(rows, errors)
+        except Exception:
+            log.exception("Email batch delivery failed")
+        finally:
+            self._slots.release()
+
+    def _record(self, rows, errors):
+        now = _utcnow()
+        sent_ids = [r["id"] for r in rows if r["id"] not in errors]
+        retry, dead = [], []
+        for row in rows:
+            if row["id"] not in errors:
+                continue
+            # Same value the claim already stored (row holds the count from before it)
+            attempts = row["attempts"] + 1
+            if attempts >= self.max_attempts:
+                dead.append((attempts, errors[row["id"]], row["id"]))
+            else:
+                # 30s, 60s, 120s ... capped at one hour
+                delay = min(30 * 2 ** (attempts - 1), 3600)
+                retry.append((attempts, errors[row["id"]],
+                              now + datetime.timedelta(seconds=delay), row["id"]))
+
+        conn = self.pool.get_connection()
+        try:
+            cur = conn.cursor()
+            if sent_ids:
+                placeholders = ", ".join(["%s"] * len(sent_ids))
+                cur.execute(
+                    f"""
+                    UPDATE email_outbox
+                    SET status = 'sent', sent_at = %s, locked_until = NULL
+                    WHERE id IN ({placeholders})
+                    """,
+                    [now] + sent_ids,
+                )
+            if retry:
+                cur.executemany(
+                    """
+                    UPDATE email_outbox
+                    SET status = 'pending', attempts = %s, last_error = %s,
+                        next_attempt_at = %s, locked_until = NULL
+                    WHERE id = %s
+                    """,
+                    retry,
+                )
+            if dead:
+                cur.executemany(
+                    """
+                    UPDATE email_outbox
+                    SET status = 'dead', attempts = %s, last_error = %s, locked_until = NULL
+                    WHERE id = %s
+                    """,
+                    dead,
+                )
+            conn.commit()
+            cur.close()
+        finally:
+            conn.close()
+
+        with self._lock:
+            self.batches += 1
+            self.sent += len(sent_ids)
+            self.failed += len(retry)
+            self.dead += len(dead)
+        for attempts, error, *_ in retry + dead:
+            log.warning("Email delivery failed (attempt %s): %s", attempts, error)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "running": self._thread is not None,
+                "batches": self.batches,
+                "sent": self.sent,
+                "failed": self.failed,
+                "dead": self.dead,
+            }
@@ -0,0 +1,121 @@
+"""
+pagination.py - Keyset (cursor) pagination helpers
+
+Cursors are opaque to the client: a URL-safe base64 encoding of the sort
+key values of the last row on the page. The next page is requested with
+`?after=<cursor>` and continues strictly after that row, so every page is
+an index range scan no matter how deep the client has paged.
+"""
+
+import base64
+import datetime
+import json
+import math
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+
+class InvalidQuery(ValueError):
+    """Raised when a query-string parameter (limit, filter, ...) cannot be used."""
+
+
+class InvalidCursor(InvalidQuery):
+    """Raised when an `after` cursor is malformed or doesn't fit the listing."""
+
+
+def parse_limit(raw, default=DEFAULT_LIMIT, maximum=MAX_LIMIT):
+    """
+    Parse a `?limit=` value.
+
+    Args:
+        raw: Raw query-string value (may be None)
+        default: Limit used when none is given
+        maximum: Upper bound applied to any requested limit
+
+    Returns:
+        int: Page size between 1 and maximum
+
+    Raises:
+        InvalidQuery: If the value is not a positive integer
+    """
+    if raw in (None, ""):
+        return default
+    try:
+        limit = int(raw)
+    except (TypeError, ValueError):
+        raise InvalidQuery("limit must be an integer")
+    if limit < 1:
+        raise InvalidQuery("limit must be at least 1")
+    return min(limit, maximum)
+
+
+def _encode_value(value):
+    if isinstance(value, datetime.datetime):
+        return {"dt": value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    """
+    Inverse of _encode_value. Anything encode_cursor can't have produced
+    (objects, lists, null, booleans, NaN) is rejected, so a crafted cursor
+    can only ever put a str, number or datetime into a query.
+    """
+    if isinstance(value, dict):
+        if value.keys() != {"dt"} or not isinstance(value["dt"], str):
+            raise ValueError("Invalid cursor value")
+        return datetime.datetime.fromisoformat(value["dt"])
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        raise ValueError("Invalid cursor value")
+    if isinstance(value, float) and not math.isfinite(value):
+        raise ValueError("Invalid cursor value")
+    return value
+
+
+def encode_cursor(*values):
+    """
+    Build an opaque cursor from the sort key of the last row on a page.
+
+    Args:
+        *values: Sort key values (str, int, float or datetime)
+
+    Returns:
+        str: URL-safe cursor
+    """
+    raw = json.dumps([_encode_value(v) for v in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor, arity, types=None):
+    """
+    Decode a cursor produced by encode_cursor.
+
+    Args:
+        cursor: Cursor string from `?after=`
+        arity: Number of sort key values expected
+        types: Optional type (or tuple of types) per position; a value of
+               another type makes the cursor invalid (booleans never count
+               as numbers)
+
+    Returns:
+        list: Sort key values
+
+    Raises:
+        InvalidCursor: If the cursor is malformed
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(values, list) or len(values) != arity:
+            raise InvalidCursor("Invalid cursor")
+        values = [_decode_value(v) for v in values]
+    except (ValueError, TypeError, RecursionError):
+        raise InvalidCursor("Invalid cursor")
+    if types is not None:
+        for value, expected in zip(values, types):
+            if isinstance(value, bool) or not isinstance(value, expected):
+                raise InvalidCursor("Invalid cursor")
+    return values
@@ -0,0 +1,206 @@
+"""
+payloads.py - Pre-encoded, precompressed response bodies
+
+Handles:
+- Keeping rarely changing responses as ready-to-send bytes, with gzip and
+  (when the brotli package is installed) brotli variants built once per
+  payload and reused for every request
+- Strong ETags, and 304 Not Modified when If-None-Match matches, so a
+  repeat visit costs a header comparison
+- Choosing the variant from Accept-Encoding
+- A small versioned cache for payloads derived from the catalog (pages of
+  the product listing), dropped when the catalog version changes
+"""
+
+import gzip
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, request
+
+from versions import etag_matches
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+# Bodies smaller than this are not worth compressing
+MIN_COMPRESS_SIZE = int(os.environ.get("MIN_COMPRESS_SIZE", "1024"))
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 9
+
+PAYLOAD_CACHE_SIZE = int(os.environ.get("PAYLOAD_CACHE_SIZE", "256"))
+
+
+def _compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def accepted_encodings(header):
+    """
+    Encodings a client accepts, from an Accept-Encoding header.
+
+    Returns:
+        set: Encoding names with a non-zero q-value
+    """
+    accepted = set()
+    for part in (header or "").split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if name and q > 0:
+            accepted.add(name)
+    return accepted
+
+
+class EncodedPayload:
+    """
+    One response body plus its compressed variants.
+
+    Variants are built the first time a client asks for them and then
+    kept, so each encoding of a payload is compressed exactly once.
+    """
+
+    def __init__(self, body, mimetype="application/json", headers=None):
+        """
+        Args:
+            body: Encoded response body (bytes)
+            mimetype: Content type
+            headers: Extra headers sent with every variant (e.g. a cursor)
+        """
+        self.body = body
+        self.mimetype = mimetype
+        self.headers = headers or {}
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        self.etags = {"identity": f'"{digest}"', "gzip": f'"{digest}-gz"', "br": f'"{digest}-br"'}
+        self._variants = {"identity": body}
+        self._lock = threading.Lock()
+
+    def variant(self, encoding):
+        """Body bytes for an encoding ('identity', 'gzip' or 'br')."""
+        data = self._variants.get(encoding)
+        if data is None:
+            with self._lock:
+                data = self._variants.get(encoding)
+                if data is None:
+                    data = self._variants[encoding] = _compress(self.body, encoding)
+        return data
+
+    def choose_encoding(self, accept_encoding):
+        """Best encoding for a request's Accept-Encoding header."""
+        if len(self.body) < MIN_COMPRESS_SIZE:
+            return "identity"
+        accepted = accepted_encodings(accept_encoding)
+        if brotli is not None and "br" in accepted:
+            return "br"
+        if "gzip" in accepted:
+            return "gzip"
+        return "identity"
+
+    def matches(self, if_none_match):
+        """
+        True if an If-None-Match header names any variant of this payload
+        (exact tags after the usual weak comparison, or `*`).
+
+        Args:
+            if_none_match: Raw header value (may be None)
+        """
+        return any(etag_matches(tag, if_none_match) for tag in self.etags.values())
+
+
+def send_payload(payload, cache_control="public, no-cache"):
+    """
+    Build the response for a pre-encoded payload in the current request.
+
+    Returns:
+        Response: 304 if the client's copy is current, otherwise 200 with
+                  the best variant, its ETag and Content-Encoding
+    """
+    encoding = payload.choose_encoding(request.headers.get("Accept-Encoding"))
+    headers = {
+        **payload.headers,
+        "ETag": payload.etags[encoding],
+        "Vary": "Accept-Encoding",
+        "Cache-Control": cache_control,
+    }
+
+    if payload.matches(request.headers.get("If-None-Match")):
+        return current_app.response_class(status=304, headers=headers)
+
+    response = current_app.response_class(
+        payload.variant(encoding), mimetype=payload.mimetype, headers=headers
+    )
+    # Already negotiated: the compression hook leaves it alone
+    response.precompressed = True
+    if encoding != "identity":
+        response.headers["Content-Encoding"] = encoding
+    return response
+
+
+class PayloadCache:
+    """
+    LRU of key -> EncodedPayload, valid for one version and TTL.
+
+    Used for responses derived from data that changes rarely and has a
+    version counter (the catalog): a version change makes every entry
+    stale at once.
+    """
+
+    def __init__(self, ttl, max_size=PAYLOAD_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version, build):
+        """
+        Cached payload for `key` at `version`, building it on a miss.
+
+        Args:
+            key: Hashable cache key (e.g. the request's query string)
+            version: Current version token of the underlying data
+            build: Callable returning (EncodedPayload, cacheable). Errors
+                   propagate and nothing is cached.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                payload, entry_version, built_at = entry
+                if entry_version == version and now - built_at < self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return payload
+            self.misses += 1
+
+        payload, cacheable = build()
+        if cacheable:
+            with self._lock:
+                self._entries[key] = (payload, version, now)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+        return payload
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "maxSize": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
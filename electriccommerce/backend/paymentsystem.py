@@ -1,36 +1,34 @@
-from flask import request, jsonify, abort
-import jwt
+from flask import request, jsonify
 import base64
+import functools
 from mysql.connector import Error as MySQLError
 
+from auth import authenticator_for
+from jsonprovider import RowMapper
+import versions
+from vault import CardVault, XorCipher
+
 
 # ========== ENCRYPTION HELPERS ==========
-# NOTE: This is a simple XOR encryption for DEMO purposes only.
-# In production, use proper encryption like cryptography.fernet or a payment API like Stripe.
+# NOTE: XOR is for DEMO purposes only. Routes encrypt through a CardVault
+# (vault.py), which uses AES-GCM when the cryptography package is installed
+# and can still read values written by these legacy helpers.
+
+@functools.lru_cache(maxsize=8)
+def _xor_engine(key):
+    return XorCipher(key)
+
 
 def simple_encrypt(data, key):
     """Simple XOR encryption - for demo only"""
-    key_bytes = key.encode()
-    data_bytes = data.encode()
-    encrypted = bytearray()
-    
-    for i, byte in enumerate(data_bytes):
-        encrypted.append(byte ^ key_bytes[i % len(key_bytes)])
-    
-    return base64.b64encode(encrypted).decode()
+    return base64.b64encode(_xor_engine(key).encrypt_bytes(data.encode())).decode()
 
 
 def simple_decrypt(encrypted_data, key):
     """Simple XOR decryption - for demo only"""
     try:
-        key_bytes = key.encode()
         encrypted_bytes = base64.b64decode(encrypted_data.encode())
-        decrypted = bytearray()
-        
-        for i, byte in enumerate(encrypted_bytes):
-            decrypted.append(byte ^ key_bytes[i % len(key_bytes)])
-        
-        return decrypted.decode()
+        return _xor_engine(key).decrypt_bytes(encrypted_bytes).decode()
     except Exception as e:
         print(f"Decryption error: {e}")
         return None
@@ -39,7 +37,7 @@ def simple_decrypt(encrypted_data, key):
 def get_user_from_token(jwt_secret):
     """
     Extract and validate user ID from JWT token in Authorization header.
-    ✅ Authenticates user from database
+    ✅ Shares the per-request / cross-request claims cache with main.py
     
     Args:
         jwt_secret: Secret key for JWT validation
@@ -50,16 +48,31 @@ def get_user_from_token(jwt_secret):
     Raises:
         401: If token is missing, invalid, or expired
     """
-    auth_header = request.headers.get('Authorization')
-    if not auth_header or not auth_header.startswith('Bearer '):
-        abort(401, "Missing or invalid Authorization header")
-    
-    token = auth_header.split(' ')[1]
-    try:
-        payload = jwt.decode(token, jwt_secret, algorithms=["HS256"])
-        return payload['id']
-    except jwt.InvalidTokenError:
-        abort(401, "Invalid or expired token")
+    return authenticator_for(jwt_secret).claims()['id']
+
+
+# ========== RESPONSE SHAPES ==========
+# camelCase keys for the frontend; Decimal / datetime values are encoded
+# by the app's JSON provider (jsonprovider.py)
+
+PAYMENT_METHOD_ROW = RowMapper({
+    'id': 'id',
+    'cardType': 'card_type',
+    'cardholderName': 'cardholder_name',
+    'lastFourDigits': 'last_four_digits',
+    'expiryDate': 'expiry_date',
+    'billingZip': 'billing_zip',
+    'isDefault': ('is_default', bool),
+    'createdAt': 'created_at',
+})
+
+DEFAULT_PAYMENT_METHOD_ROW = RowMapper({
+    'id': 'id',
+    'cardType': 'card_type',
+    'cardholderName': 'cardholder_name',
+    'lastFourDigits': 'last_four_digits',
+    'expiryDate': 'expiry_date',
+})
 
 
 # ========== ROUTE REGISTRATION ==========
@@ -73,17 +86,24 @@ def register_payment_routes(app, pool, jwt_secret, encryption_key):
         app: Flask application instance
         pool: MySQL connection pool
         jwt_secret: JWT secret key for token validation
-        encryption_key: Key for encrypting payment data
+        encryption_key: Key for encrypting payment data, or a CardVault
     """
+    if isinstance(encryption_key, CardVault):
+        vault = encryption_key
+    else:
+        vault = CardVault.from_key(encryption_key)
     
     @app.get("/api/payment-methods")
     def get_payment_methods():
         """
         ✅ Get all payment methods for authenticated user FROM DATABASE
         Returns camelCase keys for frontend
+        Conditional: If-None-Match is answered from the payment methods
+        version alone (see versions.py)
         
         Returns:
-            200: List of payment methods
+            200: List of payment methods (ETag, Cache-Control: private, no-cache)
+            304: Client's copy is current
             401: Not authenticated
             500: Server error
         """
@@ -93,6 +113,11 @@ def register_payment_routes(app, pool, jwt_secret, encryption_key):
             conn = pool.get_connection()
             cur = conn.cursor(dictionary=True)
             
+            etag = versions.etag_for(cur, versions.PAYMENT_METHODS, user_id)
+            cached = versions.not_modified(etag)
+            if cached:
+                return cached
+            
             # ✅ Query user's payment methods from database
             cur.execute("""
                 SELECT id, card_type, cardholder_name, last_four_digits, 
@@ -102,23 +127,8 @@ def register_payment_routes(app, pool, jwt_secret, encryption_key):
                 ORDER BY is_default DESC, created_at DESC
             """, (user_id,))
             
-            methods = cur.fetchall()
-            
-            # ✅ Convert to camelCase for frontend
-            result = []
-            for method in methods:
-                result.append({
-                    'id': method['id'],
-                    'cardType': method['card_type'],
-                    'cardholderName': method['cardholder_name'],
-                    'lastFourDigits': method['last_four_digits'],
-                    'expiryDate': method['expiry_date'],
-                    'billingZip': method['billing_zip'],
-                    'isDefault': bool(method['is_default']),
-                    'createdAt': method['created_at'].isoformat() if method['created_at'] else None
-                })
-            
-            return jsonify(result)
+            # ✅ camelCase for frontend, straight from the rows
+            return versions.stamp(jsonify(PAYMENT_METHOD_ROW.many(cur.fetchall())), etag)
             
         except MySQLError as e:
             app.logger.exception(e)
@@ -166,7 +176,7 @@ def register_payment_routes(app, pool, jwt_secret, encryption_key):
                 return jsonify({"errors": [{"msg": "Payment method not found"}]}), 404
             
             # Decrypt and mask card number for security
-            decrypted_card = simple_decrypt(method['card_number'], encryption_key)
+            decrypted_card = vault.decrypt(method['card_number'])
             if decrypted_card and len(decrypted_card) >= 4:
                 masked_card = '*' * (len(decrypted_card) - 4) + decrypted_card[-4:]
                 masked_card_formatted = ' '.join([masked_card[i:i+4] for i in range(0, len(masked_card), 4)])
@@ -232,8 +242,7 @@ def register_payment_routes(app, pool, jwt_secret, encryption_key):
         last_four = card_number[-4:]
         
         # Encrypt sensitive data
-        encrypted_card = simple_encrypt(card_number, encryption_key)
-        encrypted_cvv = simple_encrypt(data['cvv'], encryption_key)
+        encrypted_card, encrypted_cvv = vault.encrypt_many([card_number, data['cvv']])
         
         is_default = data.get('isDefault', False)
         
@@ -266,9 +275,10 @@ def register_payment_routes(app, pool, jwt_secret, encryption_key):
                 data['billingZip'],
                 is_default
             ))
+            payment_id = cur.lastrowid
             
+            versions.bump(cur, user_id, versions.PAYMENT_METHODS)
             conn.commit()
-            payment_id = cur.lastrowid
             
             return jsonify({
                 'message': 'Payment method added successfully',
@@ -334,7 +344,7 @@ def register_payment_routes(app, pool, jwt_secret, encryption_key):
             if 'cardNumber' in data and '*' not in data['cardNumber']:
                 card_number = data['cardNumber'].replace(' ', '').replace('-', '')
                 last_four = card_number[-4:]
-                encrypted_card = simple_encrypt(card_number, encryption_key)
+                encrypted_card = vault.encrypt(card_number)
                 
                 update_fields.append("card_number = %s")
                 update_fields.append("last_four_digits = %s")
@@ -345,7 +355,7 @@ def register_payment_routes(app, pool, jwt_secret, encryption_key):
                 update_values.append(data['expiryDate'])
             
             if 'cvv' in data:
-                encrypted_cvv = simple_encrypt(data['cvv'], encryption_key)
+                encrypted_cvv = vault.encrypt(data['cvv'])
                 update_fields.append("cvv = %s")
                 update_values.append(encrypted_cvv)
             
@@ -378,6 +388,7 @@ def register_payment_routes(app, pool, jwt_secret, encryption_key):
             """
             
             cur.execute(query, update_values)
+            versions.bump(cur, user_id, versions.PAYMENT_METHODS)
             conn.commit()
             
             return jsonify({'message': 'Payment method updated successfully'})
@@ -422,6 +433,7 @@ def register_payment_routes(app, pool, jwt_secret, encryption_key):
             if cur.rowcount == 0:
                 return jsonify({"errors": [{"msg": "Payment method not found"}]}), 404
             
+            versions.bump(cur, user_id, versions.PAYMENT_METHODS)
             conn.commit()
             
             return jsonify({'message': 'Payment method deleted successfully'})
@@ -469,13 +481,7 @@ def register_payment_routes(app, pool, jwt_secret, encryption_key):
                 return jsonify({"errors": [{"msg": "No default payment method set"}]}), 404
             
             # ✅ Return camelCase keys
-            return jsonify({
-                'id': method['id'],
-                'cardType': method['card_type'],
-                'cardholderName': method['cardholder_name'],
-                'lastFourDigits': method['last_four_digits'],
-                'expiryDate': method['expiry_date']
-            })
+            return jsonify(DEFAULT_PAYMENT_METHOD_ROW.one(method))
             
         except MySQLError as e:
             app.logger.exception(e)
@@ -531,6 +537,7 @@ def register_payment_routes(app, pool, jwt_secret, encryption_key):
                 WHERE id = %s AND user_id = %s
             """, (payment_id, user_id))
             
+            versions.bump(cur, user_id, versions.PAYMENT_METHODS)
             conn.commit()
             
             return jsonify({'message': 'Default payment method updated successfully'})
@@ -0,0 +1,37 @@
+"""
+pricing.py - Order amounts
+
+Handles:
+- The sales tax rate
+- Computing subtotal, tax and total once, in Decimal cents, so the orders
+  row, the order history, the checkout summary and the confirmation email
+  all show the same numbers
+"""
+
+from decimal import ROUND_HALF_UP, Decimal
+
+# Sales tax applied at checkout
+TAX_RATE = Decimal("0.08")
+
+CENT = Decimal("0.01")
+
+
+def to_cents(value):
+    """A price (Decimal, float, int or str) as a Decimal rounded to cents."""
+    return Decimal(str(value)).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def order_amounts(lines):
+    """
+    Subtotal, tax and total for a set of order lines.
+
+    Args:
+        lines: Iterable of (unit_price, quantity)
+
+    Returns:
+        tuple: (subtotal, tax, total) as Decimals rounded to cents, with
+               total == subtotal + tax exactly
+    """
+    subtotal = sum((to_cents(price) * quantity for price, quantity in lines), Decimal("0.00"))
+    tax = to_cents(subtotal * TAX_RATE)
+    return subtotal, tax, subtotal + tax
@@ -0,0 +1,256 @@
+"""
+product_import.py - Streaming bulk product import/upsert
+
+Handles:
+- Reading a supplier feed as CSV or NDJSON one row at a time
+- Validating rows as they stream in (bad rows are counted and reported,
+  good rows keep going)
+- Writing in chunked multi-row INSERT ... ON DUPLICATE KEY UPDATE
+  statements, one short transaction per chunk, so memory stays bounded
+  by the chunk size and the shared pool is never held for long
+- Progress reporting per chunk, and a single catalog version bump at the
+  end so caches and the search index rebuild once, not per row
+
+Feed columns: id, name, price (required); description, image_url
+(optional - when absent, the stored value is kept).
+
+Usage (run from backend/):
+    python product_import.py feed.csv
+    python product_import.py feed.ndjson --chunk 2000
+    curl -X POST -H "X-Admin-Token: $ADMIN_TOKEN" -H "Content-Type: text/csv" \\
+         --data-binary @feed.csv http://127.0.0.1:8000/api/admin/products/import
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import time
+from decimal import Decimal, InvalidOperation
+
+from mysql.connector import Error as MySQLError
+
+from catalog import CatalogVersion
+from db import BlockingPool, db_config_from_env, run_transaction
+
+IMPORT_CHUNK_SIZE = int(os.environ.get("IMPORT_CHUNK_SIZE", "1000"))
+# Errors kept in the result (all invalid rows are still counted)
+MAX_REPORTED_ERRORS = 100
+
+FORMATS = ("csv", "ndjson")
+
+MAX_ID_LENGTH = 64
+MAX_NAME_LENGTH = 120
+MAX_PRICE = Decimal("99999999.99")  # DECIMAL(10,2)
+CENT = Decimal("0.01")
+
+# Errors that leave the rest of a feed unreadable (bad encoding, or CSV
+# the csv module can't parse, e.g. NUL bytes): the import stops there
+FEED_ERRORS = (UnicodeDecodeError, csv.Error)
+
+
+class RowError(ValueError):
+    """A feed row failed validation."""
+
+
+def format_for(content_type, filename=None):
+    """Guess the feed format from a Content-Type or file name ('csv' default)."""
+    content_type = (content_type or "").lower()
+    if "ndjson" in content_type or "jsonl" in content_type or "json" in content_type:
+        return "ndjson"
+    if filename and filename.lower().endswith((".ndjson", ".jsonl", ".json")):
+        return "ndjson"
+    return "csv"
+
+
+def iter_records(stream, fmt):
+    """
+    Yield (line number, dict) for each record of a text stream.
+
+    Malformed NDJSON lines come back as (line number, RowError) so the
+    caller can count them without stopping the import.
+    """
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record
+        return
+
+    for line_no, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield line_no, RowError(f"invalid JSON: {e}")
+            continue
+        if not isinstance(record, dict):
+            yield line_no, RowError("expected a JSON object")
+            continue
+        yield line_no, record
+
+
+def _text(record, field, max_length=None, required=False):
+    value = record.get(field)
+    if value is None:
+        if required:
+            raise RowError(f"{field} is required")
+        return None
+    value = str(value).strip()
+    if not value:
+        if required:
+            raise RowError(f"{field} is required")
+        return None
+    if max_length and len(value) > max_length:
+        raise RowError(f"{field} is longer than {max_length} characters")
+    return value
+
+
+def validate_record(record):
+    """
+    Check one feed record.
+
+    Returns:
+        tuple: (id, name, description, price, image_url) ready to insert
+
+    Raises:
+        RowError: The record can't be imported
+    """
+    product_id = _text(record, "id", MAX_ID_LENGTH, required=True)
+    name = _text(record, "name", MAX_NAME_LENGTH, required=True)
+    try:
+        price = Decimal(str(record.get("price", "")).strip())
+    except InvalidOperation:
+        raise RowError("price must be a number")
+    if not price.is_finite() or price < 0 or price > MAX_PRICE:
+        raise RowError(f"price must be between 0 and {MAX_PRICE}")
+    return (
+        product_id,
+        name,
+        _text(record, "description"),
+        price.quantize(CENT),
+        _text(record, "image_url"),
+    )
+
+
+def upsert_chunk(cur, rows):
+    """Write one chunk with a single multi-row upsert."""
+    values = ", ".join(["(%s, %s, %s, %s, %s)"] * len(rows))
+    cur.execute(
+        f"""
+        INSERT INTO products (id, name, description, price, image_url)
+        VALUES {values}
+        ON DUPLICATE KEY UPDATE
+            name = VALUES(name),
+            description = COALESCE(VALUES(description), description),
+            price = VALUES(price),
+            image_url = COALESCE(VALUES(image_url), image_url)
+        """,
+        [value for row in rows for value in row],
+    )
+
+
+def run_import(pool, stream, fmt, chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Stream a feed into the products table, yielding progress.
+
+    Each chunk is committed on its own, so an interrupted import leaves
+    the chunks before it in place; re-running the feed is safe because
+    every write is an upsert. The catalog version is NOT bumped here:
+    callers bump once when the generator is finished.
+
+    Args:
+        pool: Connection pool
+        stream: Text stream of the feed
+        fmt: 'csv' or 'ndjson'
+        chunk_size: Rows per upsert statement / transaction
+
+    Yields:
+        dict: The running result {read, imported, invalid, chunks,
+              seconds, errors, done} after each chunk, and once more
+              with done=True at the end (the same dict each time)
+
+    Raises:
+        MySQLError: A chunk failed to write (earlier chunks stay committed)
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown import format: {fmt}")
+
+    started = time.monotonic()
+    result = {"read": 0, "imported": 0, "invalid": 0, "chunks": 0,
+              "seconds": 0.0, "errors": [], "done": False}
+    chunk = []
+
+    def flush():
+        run_transaction(pool, lambda cur: upsert_chunk(cur, chunk))
+        result["imported"] += len(chunk)
+        result["chunks"] += 1
+        result["seconds"] = round(time.monotonic() - started, 3)
+        chunk.clear()
+
+    for line_no, record in iter_records(stream, fmt):
+        result["read"] += 1
+        try:
+            if isinstance(record, RowError):
+                raise record
+            chunk.append(validate_record(record))
+        except RowError as e:
+            result["invalid"] += 1
+            if len(result["errors"]) < MAX_REPORTED_ERRORS:
+                result["errors"].append({"line": line_no, "msg": str(e)})
+            continue
+        if len(chunk) >= chunk_size:
+            flush()
+            yield result
+
+    if chunk:
+        flush()
+    result["seconds"] = round(time.monotonic() - started, 3)
+    result["done"] = True
+    yield result
+
+
+def progress_line(result):
+    """Counters of a running import, without the error list."""
+    return {key: value for key, value in result.items() if key != "errors"}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("feed", help="CSV or NDJSON file ('-' for stdin)")
+    parser.add_argument("--format", choices=FORMATS, help="default: from the file extension")
+    parser.add_argument("--chunk", type=int, default=IMPORT_CHUNK_SIZE, help="rows per upsert")
+    args = parser.parse_args()
+
+    fmt = args.format or format_for(None, args.feed)
+    pool = BlockingPool(db_config_from_env(), size=1, name="product_import")
+
+    if args.feed == "-":
+        stream = io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8-sig", newline="")
+    else:
+        stream = open(args.feed, encoding="utf-8-sig", newline="")
+    result = None
+    try:
+        with stream:
+            for result in run_import(pool, stream, fmt, args.chunk):
+                print(f"  {result['imported']:,} imported, {result['invalid']:,} invalid "
+                      f"({result['imported'] / max(result['seconds'], 1e-9):,.0f} rows/s)", file=sys.stderr)
+    except (MySQLError, *FEED_ERRORS) as e:
+        imported = result["imported"] if result else 0
+        print(f"Import stopped after {imported:,} rows: {type(e).__name__}: {e}", file=sys.stderr)
+        sys.exit(2)
+    finally:
+        # One bump for the whole feed (also after a failure part-way)
+        if result and result["imported"]:
+            version = CatalogVersion().bump()
+            print(f"Catalog version bumped to {version}", file=sys.stderr)
+
+    print(json.dumps(result, indent=2))
+    sys.exit(1 if result["invalid"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+"""
+rotate_payment_keys.py - Re-encrypt stored card data under the current key
+
+Handles:
+- Streaming payment_methods in primary-key chunks with an unbuffered
+  (server-side) cursor, so the table is never held in memory
+- Re-encrypting chunks in a process pool while the next chunk is read
+- Writing each chunk back with one multi-row UPDATE that skips rows the
+  live app changed since they were read
+- Committing every few chunks and recording the last id in a checkpoint
+  file, so an interrupted run resumes where it stopped
+- Throttling to a row rate and using its own connections, so the live pool
+  is never touched
+
+Rotation steps:
+    1. Deploy with the new key as PAYMENT_KEY / PAYMENT_KEY_ID and the old one
+       in PAYMENT_PREVIOUS_KEYS (reads accept both while rows are rewritten)
+    2. Run this command with the same environment
+    3. Once it reports 0 failed rows, drop the old key from PAYMENT_PREVIOUS_KEYS
+
+Usage (run from backend/):
+    python rotate_payment_keys.py --chunk 500 --workers 4 --max-rows-per-sec 2000
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import mysql.connector
+from mysql.connector import Error as MySQLError
+
+from db import db_config_from_env, is_retryable
+from vault import vault_from_env
+
+DEFAULT_CHECKPOINT = "rotate_payment_keys.checkpoint.json"
+WRITE_ATTEMPTS = 5
+
+# Set in each worker process by _init_worker
+_vault = None
+
+
+def _init_worker():
+    global _vault
+    _vault = vault_from_env()
+
+
+def reencrypt_chunk(rows):
+    """
+    Re-encrypt one chunk in a worker process.
+
+    Args:
+        rows: List of (id, card_number, cvv) as stored
+
+    Returns:
+        tuple: (updates, failed ids) where updates are
+               (id, old card, old cvv, new card, new cvv)
+    """
+    updates = []
+    failed = []
+    for row_id, card_number, cvv in rows:
+        if not (_vault.needs_reencrypt(card_number) or _vault.needs_reencrypt(cvv)):
+            continue
+        plain_card, plain_cvv = _vault.decrypt_many([card_number, cvv])
+        if plain_card is None or plain_cvv is None:
+            failed.append(row_id)
+            continue
+        new_card, new_cvv = _vault.encrypt_many([plain_card, plain_cvv])
+        updates.append((row_id, card_number, cvv, new_card, new_cvv))
+    return updates, failed
+
+
+def read_chunks(conn, after_id, chunk_size):
+    """
+    Yield (last id, rows) chunks in primary-key order, starting after `after_id`.
+
+    Each chunk is its own short keyset query streamed through an unbuffered
+    cursor, so no long-running read view is kept open between chunks.
+    """
+    while True:
+        cur = conn.cursor(buffered=False)
+        try:
+            cur.execute(
+                """
+                SELECT id, card_number, cvv
+                FROM payment_methods
+                WHERE id > %s
+                ORDER BY id
+                LIMIT %s
+                """,
+                (after_id, chunk_size),
+            )
+            rows = []
+            while True:
+                batch = cur.fetchmany(256)
+                if not batch:
+                    break
+                rows.extend(batch)
+        finally:
+            cur.close()
+        conn.commit()  # end the read snapshot
+        if not rows:
+            return
+        after_id = rows[-1][0]
+        yield after_id, rows
+
+
+def write_chunk(cur, updates):
+    """
+    Write re-encrypted values back with one UPDATE.
+
+    A row is only updated if its stored values still match what was read;
+    anything the app rewrote in the meantime already uses the current key.
+
+    Returns:
+        int: Rows updated
+    """
+    if not updates:
+        return 0
+    derived = " UNION ALL ".join(
+        ["SELECT %s AS id, %s AS old_card, %s AS old_cvv, %s AS new_card, %s AS new_cvv"] * len(updates)
+    )
+    params = [value for row in updates for value in row]
+    cur.execute(
+        f"""
+        UPDATE payment_methods pm
+        JOIN ({derived}) r ON pm.id = r.id
+        SET pm.card_number = r.new_card, pm.cvv = r.new_cvv
+        WHERE pm.card_number = r.old_card AND pm.cvv = r.old_cvv
+        """,
+        params,
+    )
+    return cur.rowcount
+
+
+def load_checkpoint(path, key_tag):
+    """Last id from a checkpoint written for the same target key (else 0)."""
+    try:
+        with open(path) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return 0
+    if state.get("key") != key_tag:
+        print(f"Ignoring checkpoint for key {state.get('key')!r}; target is {key_tag!r}")
+        return 0
+    return int(state.get("lastId", 0))
+
+
+def save_checkpoint(path, key_tag, last_id, totals):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(dict(totals, key=key_tag, lastId=last_id), f)
+    os.replace(tmp, path)
+
+
+class Throttle:
+    """Sleeps so that processed rows stay under `rate` per second."""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.started = time.monotonic()
+        self.rows = 0
+
+    def add(self, rows):
+        self.rows += rows
+        if self.rate <= 0:
+            return
+        ahead = self.rows / self.rate - (time.monotonic() - self.started)
+        if ahead > 0:
+            time.sleep(ahead)
+
+
+def commit_with_retry(writer, pending):
+    """
+    Write and commit the pending chunks as one transaction.
+
+    Deadlocks and lock-wait timeouts with live traffic roll back and retry.
+
+    Returns:
+        int: Rows updated
+    """
+    for attempt in range(1, WRITE_ATTEMPTS + 1):
+        cur = writer.cursor()
+        try:
+            updated = sum(write_chunk(cur, updates) for updates in pending)
+            writer.commit()
+            return updated
+        except MySQLError as e:
+            writer.rollback()
+            if not is_retryable(e) or attempt == WRITE_ATTEMPTS:
+                raise
+            time.sleep(0.1 * 2 ** attempt)
+        finally:
+            cur.close()
+
+
+def rotate(args):
+    vault = vault_from_env()
+    key_tag = f"{vault.primary.scheme}:{vault.primary.key_id}"
+    after_id = 0 if args.restart else load_checkpoint(args.checkpoint, key_tag)
+    print(f"Re-encrypting payment_methods under {key_tag}, starting after id {after_id}")
+
+    config = db_config_from_env()
+    reader = mysql.connector.connect(**config)
+    writer = mysql.connector.connect(**config)
+    writer.autocommit = False
+    wcur = writer.cursor()
+    # Give up on contended rows quickly instead of holding live requests up
+    wcur.execute("SET SESSION innodb_lock_wait_timeout = %s", (args.lock_wait_timeout,))
+    wcur.close()
+
+    totals = {"scanned": 0, "updated": 0, "failed": 0}
+    failed_ids = []
+    throttle = Throttle(args.max_rows_per_sec)
+    pending, pending_last_id = [], after_id
+    in_flight = deque()
+
+    def drain_one():
+        nonlocal pending_last_id
+        last_id, count, future = in_flight.popleft()
+        updates, failed = future.result()
+        totals["scanned"] += count
+        totals["failed"] += len(failed)
+        failed_ids.extend(failed)
+        pending.append(updates)
+        pending_last_id = last_id
+        if len(pending) >= args.commit_every:
+            flush()
+        throttle.add(count)
+
+    def flush():
+        nonlocal pending
+        if not args.dry_run:
+            totals["updated"] += commit_with_retry(writer, pending)
+            save_checkpoint(args.checkpoint, key_tag, pending_last_id, totals)
+        else:
+            totals["updated"] += sum(len(updates) for updates in pending)
+        pending = []
+        print(f"  up to id {pending_last_id}: scanned {totals['scanned']}, "
+              f"updated {totals['updated']}, failed {totals['failed']}")
+        if args.pause:
+            time.sleep(args.pause)
+
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker) as executor:
+            for last_id, rows in read_chunks(reader, after_id, args.chunk):
+                in_flight.append((last_id, len(rows), executor.submit(reencrypt_chunk, rows)))
+                # Keep the pool busy while bounding how much is held in memory
+                if len(in_flight) > args.workers:
+                    drain_one()
+            while in_flight:
+                drain_one()
+            if pending:
+                flush()
+    finally:
+        reader.close()
+        writer.close()
+
+    print(f"Done: scanned {totals['scanned']}, updated {totals['updated']}, failed {totals['failed']}")
+    if failed_ids:
+        print(f"Could not decrypt ids (missing key?): {failed_ids[:50]}"
+              f"{' ...' if len(failed_ids) > 50 else ''}")
+    return 1 if failed_ids else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunk", type=int, default=500, help="rows per keyset chunk")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="re-encryption processes")
+    parser.add_argument("--commit-every", type=int, default=1, help="chunks per transaction")
+    parser.add_argument("--max-rows-per-sec", type=float, default=2000, help="0 disables the limit")
+    parser.add_argument("--pause", type=float, default=0.0, help="seconds to sleep after each commit")
+    parser.add_argument("--lock-wait-timeout", type=int, default=5, help="seconds, for the writer session")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT)
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint and start from id 0")
+    parser.add_argument("--dry-run", action="store_true", help="count rows to rotate without writing")
+    sys.exit(rotate(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
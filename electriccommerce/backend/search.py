@@ -0,0 +1,260 @@
+"""
+search.py - In-memory product search and autocomplete
+
+Handles:
+- An inverted index of name/description tokens -> product weights
+- A sorted token list for prefix lookups (bisect), used both for
+  search-as-you-type on the last query word and for suggestions
+- Keeping the index in step with the catalog cache: when the snapshot
+  changes only added, changed and removed products are re-indexed
+- Ranking (name hits outweigh description hits, exact words outweigh
+  prefixes) with keyset pagination over (score, name, id)
+"""
+
+import bisect
+import heapq
+import re
+import threading
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+NAME_WEIGHT = 3
+DESCRIPTION_WEIGHT = 1
+# Prefix matches score this fraction of an exact word match
+PREFIX_FACTOR = 0.5
+# Shorter trailing words only match exactly (a 1-letter prefix matches
+# most of the catalog and is no use for ranking)
+MIN_PREFIX_LENGTH = 2
+# Types of the (score, name, id) key search() pages on, for decoding cursors
+CURSOR_TYPES = ((int, float), str, str)
+# A sync touching more than this fraction of the catalog rebuilds the
+# sorted token list in one sort instead of one insort/del per token
+BULK_REINDEX_FRACTION = 0.25
+
+
+def tokenize(text):
+    """Lowercase alphanumeric words of `text`, in order."""
+    return TOKEN_RE.findall((text or "").lower())
+
+
+def _doc_terms(product):
+    """token -> weight for one product (best field wins)."""
+    terms = {}
+    for token in tokenize(product.get("description")):
+        terms[token] = DESCRIPTION_WEIGHT
+    for token in tokenize(product.get("name")):
+        terms[token] = NAME_WEIGHT
+    return terms
+
+
+def _indexed_fields(product):
+    return (product.get("name"), product.get("description"))
+
+
+class SearchIndex:
+    """
+    Thread-safe inverted + prefix index over the product catalog.
+
+    sync() is cheap when the catalog snapshot hasn't changed, so callers
+    can run it before every query.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._products = {}    # product id -> product dict (from the snapshot)
+        self._doc_terms = {}   # product id -> {token: weight}
+        self._postings = {}    # token -> {product id: weight}
+        self._tokens = []      # sorted keys of _postings
+        self.syncs = 0
+        self.reindexed = 0
+
+    # ---------- maintenance ----------
+
+    def _add_doc(self, product_id, terms, bulk=False):
+        """
+        Index one product. With bulk=True the sorted token list is left
+        alone (the caller rebuilds it once at the end).
+        """
+        for token, weight in terms.items():
+            posting = self._postings.get(token)
+            if posting is None:
+                posting = self._postings[token] = {}
+                if not bulk:
+                    bisect.insort(self._tokens, token)
+            posting[product_id] = weight
+        self._doc_terms[product_id] = terms
+
+    def _remove_doc(self, product_id, bulk=False):
+        for token in self._doc_terms.pop(product_id, ()):
+            posting = self._postings[token]
+            posting.pop(product_id, None)
+            if not posting:
+                del self._postings[token]
+                if not bulk:
+                    del self._tokens[bisect.bisect_left(self._tokens, token)]
+
+    def sync(self, snapshot):
+        """
+        Bring the index up to date with a catalog snapshot.
+
+        Only products whose name or description changed (or that were
+        added/removed) are re-indexed; others just pick up the new dict.
+        A first load (or any sync touching a large part of the catalog)
+        sorts the token list once at the end; small syncs keep it sorted
+        token by token.
+
+        Returns:
+            int: Number of products re-indexed
+        """
+        with self._lock:
+            if snapshot is self._snapshot:
+                return 0
+
+            new_products = snapshot.by_id
+            removed = self._products.keys() - new_products.keys()
+            updated = [
+                (product_id, product)
+                for product_id, product in new_products.items()
+                if product_id not in self._products
+                or _indexed_fields(self._products[product_id]) != _indexed_fields(product)
+            ]
+            changed = len(removed) + len(updated)
+            bulk = changed > BULK_REINDEX_FRACTION * max(len(self._products), 1)
+
+            for product_id in removed:
+                self._remove_doc(product_id, bulk)
+            for product_id, product in updated:
+                self._remove_doc(product_id, bulk)
+                self._add_doc(product_id, _doc_terms(product), bulk)
+            if bulk:
+                self._tokens = sorted(self._postings)
+
+            self._products = new_products
+            self._snapshot = snapshot
+            self.syncs += 1
+            self.reindexed += changed
+            return changed
+
+    # ---------- queries ----------
+
+    def _prefix_range(self, prefix):
+        start = bisect.bisect_left(self._tokens, prefix)
+        end = bisect.bisect_left(self._tokens, prefix + "\uffff", start)
+        return self._tokens[start:end]
+
+    def _term_scores(self, token, allow_prefix):
+        """
+        product id -> score for one query word.
+
+        Exact words return the posting itself (read-only, no copy); only
+        prefix expansion builds a new dict.
+        """
+        exact = self._postings.get(token, {})
+        if not allow_prefix or len(token) < MIN_PREFIX_LENGTH:
+            return exact
+        expansions = [t for t in self._prefix_range(token) if t != token]
+        if not expansions:
+            return exact
+        scores = dict(exact)
+        for expansion in expansions:
+            for product_id, weight in self._postings[expansion].items():
+                score = weight * PREFIX_FACTOR
+                if score > scores.get(product_id, 0):
+                    scores[product_id] = score
+        return scores
+
+    def search(self, query, limit, after=None):
+        """
+        Products matching every word of `query`, best first.
+
+        The last word also matches as a prefix, so partial input works.
+
+        Args:
+            query: Free text
+            limit: Page size
+            after: (score, name, id) of the last row of the previous page
+
+        Returns:
+            tuple: (list of (score, product), (score, name, id) cursor key
+                    for the next page or None)
+        """
+        words = list(dict.fromkeys(tokenize(query)))
+        if not words:
+            return [], None
+
+        with self._lock:
+            terms = [
+                self._term_scores(word, allow_prefix=(i == len(words) - 1))
+                for i, word in enumerate(words)
+            ]
+            # Walk the rarest word's products and probe the others
+            terms.sort(key=len)
+            rarest, others = terms[0], terms[1:]
+            products = self._products
+
+            keys = []
+            for product_id, score in rarest.items():
+                for term in others:
+                    weight = term.get(product_id)
+                    if weight is None:
+                        break
+                    score += weight
+                else:
+                    keys.append((-score, products[product_id]["name"], product_id))
+
+        if after is not None:
+            after_score, after_name, after_id = after
+            bound = (-after_score, after_name, after_id)
+            keys = [key for key in keys if key > bound]
+
+        # Only the page is ever sorted, not every match
+        top = heapq.nsmallest(limit + 1, keys)
+        page = top[:limit]
+        next_key = None
+        if len(top) > limit:
+            neg_score, name, product_id = page[-1]
+            next_key = (-neg_score, name, product_id)
+        return [(-neg_score, products[product_id]) for neg_score, _, product_id in page], next_key
+
+    def suggest(self, prefix, limit):
+        """
+        Completions for a partial word, most common first, plus products
+        whose name has a word starting with it.
+
+        Returns:
+            tuple: (list of words, list of products)
+        """
+        words = tokenize(prefix)
+        if not words:
+            return [], []
+        # Complete the last word; earlier words narrow the products
+        stem = words[-1]
+        with self._lock:
+            completions = self._prefix_range(stem)
+            ranked = sorted(completions, key=lambda t: (-len(self._postings[t]), t))[:limit]
+
+            candidates = None
+            for word in words[:-1]:
+                ids = set(self._postings.get(word, ()))
+                candidates = ids if candidates is None else candidates & ids
+            hits = {}
+            for token in completions:
+                for product_id, weight in self._postings[token].items():
+                    if weight == NAME_WEIGHT and (candidates is None or product_id in candidates):
+                        hits[product_id] = self._products[product_id]
+            products = sorted(hits.values(), key=lambda p: (p["name"], p["id"]))[:limit]
+
+        if words[:-1]:
+            lead = " ".join(words[:-1])
+            ranked = [f"{lead} {token}" for token in ranked]
+        return ranked, products
+
+    def stats(self):
+        with self._lock:
+            return {
+                "products": len(self._products),
+                "tokens": len(self._tokens),
+                "syncs": self.syncs,
+                "reindexed": self.reindexed,
+            }
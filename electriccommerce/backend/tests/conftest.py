@@ -0,0 +1,10 @@
+"""
+Shared pytest setup: the backend modules are flat files in backend/, so
+put that directory on sys.path (run the tests from backend/ with
+`python -m pytest -q tests`).
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,45 @@
+import pytest
+
+from payloads import EncodedPayload
+from versions import etag_matches, make_etag
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, False),
+    ("", False),
+    ('"abc"', True),
+    ('W/"abc"', True),
+    ('"x", W/"abc"', True),
+    ("*", True),
+    ('"abcd"', False),
+    ('"ab"', False),
+])
+def test_etag_matches(header, expected):
+    assert etag_matches('W/"abc"', header) is expected
+
+
+def test_make_etag_depends_on_every_part():
+    tag = make_etag("orders", 1, 3, "q=1")
+    assert tag.startswith('W/"orders-')
+    assert tag == make_etag("orders", 1, 3, "q=1")
+    assert tag != make_etag("orders", 1, 4, "q=1")
+    assert tag != make_etag("orders", 2, 3, "q=1")
+    assert tag != make_etag("orders", 1, 3, "q=2")
+
+
+def test_payload_matches_any_variant():
+    payload = EncodedPayload(b'{"a": 1}')
+    identity, gzip = payload.etags["identity"], payload.etags["gzip"]
+    assert payload.matches(identity)
+    assert payload.matches(f"W/{gzip}")
+    assert payload.matches(f'"other", {gzip}')
+    assert payload.matches("*")
+
+
+def test_payload_ignores_partial_tags():
+    payload = EncodedPayload(b'{"a": 1}')
+    digest = payload.etags["identity"].strip('"')
+    assert not payload.matches(None)
+    assert not payload.matches(f'"{digest[:8]}"')
+    assert not payload.matches(digest)  # unquoted
+    assert not EncodedPayload(b"{}").matches(payload.etags["identity"])
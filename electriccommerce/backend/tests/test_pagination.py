@@ -0,0 +1,70 @@
+import base64
+import datetime
+import json
+
+import pytest
+
+from pagination import InvalidCursor, InvalidQuery, decode_cursor, encode_cursor, parse_limit
+
+
+def raw_cursor(value):
+    """A cursor with arbitrary JSON inside, as a client could craft one."""
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode().rstrip("=")
+
+
+def test_round_trip_keeps_types():
+    placed = datetime.datetime(2024, 5, 1, 12, 30, 15)
+    cursor = encode_cursor(19.99, "Desk lamp", 42, placed)
+    assert "=" not in cursor
+    assert decode_cursor(cursor, 4) == [19.99, "Desk lamp", 42, placed]
+
+
+def test_round_trip_with_types():
+    cursor = encode_cursor(4.5, "Mouse", "p-7")
+    assert decode_cursor(cursor, 3, ((int, float), str, str)) == [4.5, "Mouse", "p-7"]
+
+
+@pytest.mark.parametrize("cursor", [
+    "",
+    "not base64!",
+    raw_cursor({"a": 1}),
+    raw_cursor([1]),
+    raw_cursor([1, 2, 3]),
+    raw_cursor([None, "x"]),
+    raw_cursor([[1], "x"]),
+    raw_cursor([{"dt": 5}, "x"]),
+    raw_cursor([{"dt": "2024-01-01", "x": 1}, "x"]),
+    raw_cursor([{"dt": "yesterday"}, "x"]),
+    raw_cursor([True, "x"]),
+    base64.urlsafe_b64encode(b'[NaN, "x"]').decode(),
+    base64.urlsafe_b64encode(b'[Infinity, "x"]').decode(),
+])
+def test_malformed_cursors_are_rejected(cursor):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor, 2)
+
+
+@pytest.mark.parametrize("values", [
+    ["a", "b", "c"],
+    [1, 2, "c"],
+    [1, "b", 3],
+])
+def test_wrong_types_are_rejected(values):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(raw_cursor(values), 3, ((int, float), str, str))
+
+
+def test_invalid_cursor_is_an_invalid_query():
+    with pytest.raises(InvalidQuery):
+        decode_cursor("", 1)
+
+
+@pytest.mark.parametrize("raw, expected", [(None, 50), ("", 50), ("10", 10), ("100000", 200)])
+def test_parse_limit(raw, expected):
+    assert parse_limit(raw) == expected
+
+
+@pytest.mark.parametrize("raw", ["abc", "0", "-3", "1.5"])
+def test_parse_limit_rejects(raw):
+    with pytest.raises(InvalidQuery):
+        parse_limit(raw)
@@ -0,0 +1,41 @@
+from decimal import Decimal
+
+import pytest
+
+from pricing import order_amounts, to_cents
+
+
+@pytest.mark.parametrize("value, expected", [
+    (0.1 + 0.2, "0.30"),
+    ("2.675", "2.68"),
+    (Decimal("1.005"), "1.01"),
+    (3, "3.00"),
+])
+def test_to_cents_rounds_half_up(value, expected):
+    assert to_cents(value) == Decimal(expected)
+
+
+def test_order_amounts():
+    subtotal, tax, total = order_amounts([(Decimal("19.99"), 3), ("0.10", 1)])
+    assert subtotal == Decimal("60.07")
+    assert tax == Decimal("4.81")  # 4.8056
+    assert total == Decimal("64.88")
+
+
+def test_tax_rounds_half_up():
+    # 8% of 0.0625 rounds from a half cent
+    _, tax, _ = order_amounts([("6.25", 1)])
+    assert tax == Decimal("0.50")
+    _, tax, _ = order_amounts([("0.06", 1)])
+    assert tax == Decimal("0.00")  # 0.0048
+
+
+def test_total_is_subtotal_plus_tax():
+    lines = [(0.1, 7), (19.995, 2), ("1234.565", 1)]
+    subtotal, tax, total = order_amounts(lines)
+    assert total == subtotal + tax
+    assert all(value == value.quantize(Decimal("0.01")) for value in (subtotal, tax, total))
+
+
+def test_empty_order():
+    assert order_amounts([]) == (Decimal("0.00"), Decimal("0.00"), Decimal("0.00"))
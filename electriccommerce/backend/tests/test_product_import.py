@@ -0,0 +1,48 @@
+import io
+from decimal import Decimal
+
+import pytest
+
+from product_import import RowError, iter_records, validate_record
+
+
+def test_valid_record():
+    record = {"id": " p1 ", "name": "Lamp", "price": "19.999", "description": "", "image_url": "x.png"}
+    assert validate_record(record) == ("p1", "Lamp", None, Decimal("20.00"), "x.png")
+
+
+def test_optional_fields_may_be_missing():
+    assert validate_record({"id": 7, "name": "Cable", "price": 3}) == (
+        "7", "Cable", None, Decimal("3.00"), None,
+    )
+
+
+@pytest.mark.parametrize("record, message", [
+    ({"name": "Lamp", "price": "1"}, "id is required"),
+    ({"id": "  ", "name": "Lamp", "price": "1"}, "id is required"),
+    ({"id": "p1", "name": None, "price": "1"}, "name is required"),
+    ({"id": "x" * 65, "name": "Lamp", "price": "1"}, "id is longer than 64"),
+    ({"id": "p1", "name": "n" * 121, "price": "1"}, "name is longer than 120"),
+    ({"id": "p1", "name": "Lamp"}, "price must be a number"),
+    ({"id": "p1", "name": "Lamp", "price": "cheap"}, "price must be a number"),
+    ({"id": "p1", "name": "Lamp", "price": "-0.01"}, "price must be between"),
+    ({"id": "p1", "name": "Lamp", "price": "NaN"}, "price must be between"),
+    ({"id": "p1", "name": "Lamp", "price": "Infinity"}, "price must be between"),
+    ({"id": "p1", "name": "Lamp", "price": "100000000"}, "price must be between"),
+])
+def test_invalid_records(record, message):
+    with pytest.raises(RowError, match=message):
+        validate_record(record)
+
+
+def test_ndjson_bad_lines_are_reported_not_raised():
+    stream = io.StringIO('{"id": "p1"}\n\nnot json\n[1]\n')
+    records = list(iter_records(stream, "ndjson"))
+    assert records[0] == (1, {"id": "p1"})
+    assert [line for line, _ in records[1:]] == [3, 4]
+    assert all(isinstance(error, RowError) for _, error in records[1:])
+
+
+def test_csv_records():
+    stream = io.StringIO("id,name,price\np1,Lamp,1.50\n")
+    assert list(iter_records(stream, "csv")) == [(2, {"id": "p1", "name": "Lamp", "price": "1.50"})]
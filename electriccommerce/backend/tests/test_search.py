@@ -0,0 +1,83 @@
+import time
+
+import pytest
+
+from catalog import CatalogSnapshot
+from search import NAME_WEIGHT, PREFIX_FACTOR, SearchIndex
+
+
+def snapshot(*products):
+    return CatalogSnapshot(list(products), b"[]", 1, time.monotonic())
+
+
+def product(product_id, name, description=""):
+    return {"id": product_id, "name": name, "description": description, "price": "1.00"}
+
+
+@pytest.fixture
+def index():
+    index = SearchIndex()
+    index.sync(snapshot(
+        product("p1", "Wireless Mouse", "Compact mouse for laptops"),
+        product("p2", "Mouse Pad", "Large desk mat"),
+        product("p3", "Laptop Stand", "Aluminium stand, fits a wireless keyboard"),
+        product("p4", "Keyboard", "Wireless keyboard with mouse"),
+    ))
+    return index
+
+
+def ids(results):
+    return [p["id"] for _, p in results]
+
+
+def test_name_hits_outrank_description_hits(index):
+    results, next_key = index.search("wireless", 10)
+    # p1 (name) first, then the description matches by name
+    assert ids(results) == ["p1", "p4", "p3"]
+    assert next_key is None
+
+
+def test_all_words_must_match(index):
+    results, _ = index.search("wireless mouse", 10)
+    assert ids(results) == ["p1", "p4"]
+
+
+def test_last_word_matches_as_prefix(index):
+    results, _ = index.search("lap", 10)
+    assert set(ids(results)) == {"p1", "p3"}
+    scores = dict((p["id"], score) for score, p in results)
+    assert scores["p3"] == NAME_WEIGHT * PREFIX_FACTOR
+
+
+def test_only_last_word_is_a_prefix(index):
+    assert index.search("lap stand", 10)[0] == []
+    assert ids(index.search("stand lap", 10)[0]) == ["p3"]
+
+
+def test_one_letter_prefix_matches_exactly(index):
+    assert index.search("m", 10) == ([], None)
+
+
+def test_pages_continue_after_the_cursor(index):
+    first, next_key = index.search("wireless", 2)
+    assert ids(first) == ["p1", "p4"]
+    second, last_key = index.search("wireless", 2, after=next_key)
+    assert ids(second) == ["p3"]
+    assert last_key is None
+
+
+def test_sync_reindexes_only_changes(index):
+    changed = index.sync(snapshot(
+        product("p1", "Wireless Mouse", "Compact mouse for laptops"),
+        product("p2", "Gaming Mouse Pad", "Large desk mat"),
+        product("p4", "Keyboard", "Wireless keyboard with mouse"),
+    ))
+    assert changed == 2  # p2 changed, p3 removed
+    assert ids(index.search("gaming", 10)[0]) == ["p2"]
+    assert index.search("stand", 10)[0] == []
+
+
+def test_suggest_completes_the_last_word(index):
+    words, products = index.suggest("wireless ke", 5)
+    assert words == ["wireless keyboard"]
+    assert [p["id"] for p in products] == ["p4"]
@@ -0,0 +1,101 @@
+import base64
+
+import pytest
+
+import vault
+from vault import CardVault, XorCipher, make_engine, parse_keyring, vault_from_env
+
+needs_aes = pytest.mark.skipif(vault.AESGCM is None, reason="needs the cryptography package")
+
+
+def legacy_encrypt(plaintext, key):
+    """The old per-byte loop from paymentsystem.simple_encrypt."""
+    key_bytes = key.encode()
+    data = plaintext.encode()
+    return bytes(b ^ key_bytes[i % len(key_bytes)] for i, b in enumerate(data))
+
+
+@pytest.mark.parametrize("plaintext", ["", "4", "4111111111111111", "x" * 500])
+def test_xor_matches_the_legacy_loop(plaintext):
+    cipher = XorCipher("k3y")
+    encrypted = cipher.encrypt_bytes(plaintext.encode())
+    assert encrypted == legacy_encrypt(plaintext, "k3y")
+    assert cipher.decrypt_bytes(encrypted) == plaintext.encode()
+
+
+def test_xor_rejects_empty_key():
+    with pytest.raises(ValueError):
+        XorCipher("")
+
+
+def test_xor_vault_round_trip():
+    card_vault = CardVault.from_key("secret", "1", "xor")
+    stored = card_vault.encrypt("4111111111111111")
+    assert stored.startswith("xor:1:")
+    assert card_vault.decrypt(stored) == "4111111111111111"
+    assert card_vault.decrypt_many([stored, None]) == ["4111111111111111", None]
+
+
+def test_legacy_values_still_decrypt():
+    legacy = base64.b64encode(legacy_encrypt("123", "secret")).decode()
+    card_vault = CardVault.from_key("secret", "1", "xor")
+    assert card_vault.decrypt(legacy) == "123"
+    assert card_vault.needs_reencrypt(legacy)
+
+
+@needs_aes
+def test_aes_vault_round_trip():
+    card_vault = CardVault.from_key("secret", "1", "gcm")
+    stored = card_vault.encrypt("4111111111111111")
+    assert stored.startswith("gcm:1:")
+    assert stored != card_vault.encrypt("4111111111111111")  # fresh nonce
+    assert card_vault.decrypt(stored) == "4111111111111111"
+    assert not card_vault.needs_reencrypt(stored)
+
+
+@needs_aes
+def test_aes_value_cannot_move_to_another_key_id():
+    card_vault = CardVault(make_engine("secret", "1", "gcm"), [make_engine("secret", "2", "gcm")])
+    stored = card_vault.encrypt("123")
+    assert card_vault.decrypt("gcm:2:" + stored.split(":", 2)[2]) is None
+
+
+def test_unknown_prefix_decrypts_to_none():
+    card_vault = CardVault.from_key("secret", "1", "xor")
+    assert card_vault.decrypt("xor:9:AAAA") is None
+
+
+def test_keyring_rotation():
+    old_vault = vault_from_env({"PAYMENT_KEY": "old", "PAYMENT_KEY_ID": "1", "PAYMENT_CIPHER": "xor"})
+    stored = old_vault.encrypt("4111111111111111")
+
+    new_vault = vault_from_env({
+        "PAYMENT_KEY": "new",
+        "PAYMENT_KEY_ID": "2",
+        "PAYMENT_CIPHER": "xor",
+        "PAYMENT_PREVIOUS_KEYS": "1=old",
+    })
+    assert new_vault.decrypt(stored) == "4111111111111111"
+    assert new_vault.needs_reencrypt(stored)
+    rotated = new_vault.encrypt(new_vault.decrypt(stored))
+    assert rotated.startswith("xor:2:")
+    assert not new_vault.needs_reencrypt(rotated)
+    # Without the previous key the old value is unreadable
+    assert vault_from_env({"PAYMENT_KEY": "new", "PAYMENT_KEY_ID": "2"}).decrypt(stored) is None
+
+
+def test_previous_key_id_must_differ():
+    with pytest.raises(ValueError):
+        vault_from_env({"PAYMENT_KEY": "new", "PAYMENT_KEY_ID": "2", "PAYMENT_PREVIOUS_KEYS": "2=old"})
+
+
+def test_parse_keyring():
+    assert parse_keyring(" 1=a, 2=b=c ,") == [("1", "a"), ("2", "b=c")]
+    assert parse_keyring(None) == []
+    with pytest.raises(ValueError):
+        parse_keyring("1")
+
+
+def test_unknown_cipher():
+    with pytest.raises(ValueError):
+        make_engine("k", "1", "rot13")
@@ -0,0 +1,257 @@
+"""
+vault.py - Pluggable cipher engines for stored card data
+
+Handles:
+- Cipher engines that work on whole buffers with key material derived once
+  per engine (no per-byte Python loops, no re-encoding the key per call)
+- An authenticated AES-GCM engine (needs the `cryptography` package)
+- The legacy XOR engine, byte-compatible with paymentsystem.simple_encrypt
+- CardVault: encrypts with the primary engine, decrypts whatever engine and
+  key wrote a value, and offers batch APIs for many rows at once
+- A keyring read from the environment, so old and new keys both decrypt
+  while rotate_payment_keys.py re-encrypts stored rows
+
+Stored format:
+    <scheme>:<key id>:<base64>   values written by a CardVault
+    <base64>                     legacy values from simple_encrypt (XOR)
+"""
+
+import base64
+import hashlib
+import logging
+import os
+
+try:
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+except ImportError:  # optional dependency
+    AESGCM = None
+
+log = logging.getLogger(__name__)
+
+PAYMENT_CIPHER = os.environ.get("PAYMENT_CIPHER", "auto")
+PAYMENT_KEY_ID = os.environ.get("PAYMENT_KEY_ID", "1")
+DEFAULT_PAYMENT_KEY = "dev_payment_key_change_in_production"
+
+
+class XorCipher:
+    """
+    Repeating-key XOR, done as one big-integer XOR per buffer.
+
+    For DEMO purposes only - it is not real encryption. Kept so existing
+    rows written by simple_encrypt stay readable.
+    """
+
+    scheme = "xor"
+
+    def __init__(self, key, key_id=PAYMENT_KEY_ID):
+        self.key_id = key_id
+        self._key = key.encode()
+        if not self._key:
+            raise ValueError("Encryption key must not be empty")
+        # Keystream cached as a little-endian int; grown on demand
+        self._stream_len = 0
+        self._stream = 0
+        self._grow(64)
+
+    def _grow(self, length):
+        reps = -(-length // len(self._key))
+        stream = self._key * reps
+        self._stream_len = len(stream)
+        self._stream = int.from_bytes(stream, "little")
+
+    def _xor(self, data):
+        n = len(data)
+        if n > self._stream_len:
+            self._grow(max(n, self._stream_len * 2))
+        # Little-endian: masking the low n bytes keeps key offset 0 aligned
+        # with the first data byte, exactly like the old per-byte loop
+        mask = (1 << (8 * n)) - 1
+        return (int.from_bytes(data, "little") ^ (self._stream & mask)).to_bytes(n, "little")
+
+    def encrypt_bytes(self, data):
+        return self._xor(data)
+
+    def decrypt_bytes(self, data):
+        return self._xor(data)
+
+
+class AesGcmCipher:
+    """
+    AES-256-GCM with a random 96-bit nonce per value.
+
+    The AES key is derived from the configured secret once, and the
+    scheme/key id are bound in as associated data, so a value cannot be
+    replayed under a different key id without failing authentication.
+    """
+
+    scheme = "gcm"
+    NONCE_SIZE = 12
+
+    def __init__(self, key, key_id=PAYMENT_KEY_ID):
+        if AESGCM is None:
+            raise RuntimeError("AES-GCM needs the 'cryptography' package")
+        self.key_id = key_id
+        derived = hashlib.sha256(b"ebuy-card-vault:" + key.encode()).digest()
+        self._aead = AESGCM(derived)
+        self._aad = f"{self.scheme}:{key_id}".encode()
+
+    def encrypt_bytes(self, data):
+        nonce = os.urandom(self.NONCE_SIZE)
+        return nonce + self._aead.encrypt(nonce, data, self._aad)
+
+    def decrypt_bytes(self, data):
+        nonce, ciphertext = data[:self.NONCE_SIZE], data[self.NONCE_SIZE:]
+        return self._aead.decrypt(nonce, ciphertext, self._aad)
+
+
+ENGINES = {
+    XorCipher.scheme: XorCipher,
+    AesGcmCipher.scheme: AesGcmCipher,
+}
+
+
+def make_engine(key, key_id=PAYMENT_KEY_ID, cipher=PAYMENT_CIPHER):
+    """
+    Build a cipher engine.
+
+    Args:
+        key: Secret string
+        key_id: Identifier stored alongside every value it encrypts
+        cipher: 'gcm', 'xor', or 'auto' (gcm when cryptography is installed)
+    """
+    if cipher == "auto":
+        cipher = AesGcmCipher.scheme if AESGCM is not None else XorCipher.scheme
+    if cipher not in ENGINES:
+        raise ValueError(f"Unknown payment cipher: {cipher}")
+    return ENGINES[cipher](key, key_id)
+
+
+class CardVault:
+    """
+    Encrypts card fields with one primary engine and decrypts values written
+    by any engine it knows about.
+    """
+
+    def __init__(self, primary, others=(), legacy_key=None):
+        """
+        Args:
+            primary: Engine used for all new values
+            others: Extra engines that may have written stored values
+            legacy_key: Key for unprefixed values from simple_encrypt
+        """
+        self.primary = primary
+        self._engines = {}
+        for engine in (primary, *others):
+            self._engines[(engine.scheme, engine.key_id)] = engine
+        self._legacy = XorCipher(legacy_key) if legacy_key else None
+
+    @classmethod
+    def from_key(cls, key, key_id=PAYMENT_KEY_ID, cipher=PAYMENT_CIPHER):
+        """Vault with a single key that can also read legacy XOR values."""
+        return cls(make_engine(key, key_id, cipher), legacy_key=key)
+
+    def encrypt(self, plaintext):
+        """
+        Encrypt a string with the primary engine.
+
+        Returns:
+            str: '<scheme>:<key id>:<base64>'
+        """
+        engine = self.primary
+        payload = base64.b64encode(engine.encrypt_bytes(plaintext.encode())).decode()
+        return f"{engine.scheme}:{engine.key_id}:{payload}"
+
+    def engine_for(self, stored):
+        """
+        Engine that wrote a stored value (None if unknown).
+
+        Returns:
+            tuple: (engine, base64 payload)
+        """
+        parts = stored.split(":", 2)
+        if len(parts) == 1:
+            return self._legacy, stored
+        if len(parts) != 3:
+            return None, stored
+        scheme, key_id, payload = parts
+        return self._engines.get((scheme, key_id)), payload
+
+    def decrypt(self, stored):
+        """
+        Decrypt a stored value.
+
+        Returns:
+            str or None: Plaintext, or None if it can't be decrypted
+        """
+        try:
+            engine, payload = self.engine_for(stored)
+            if engine is None:
+                log.warning("No cipher engine for stored value prefix %r", stored.split(":", 2)[:2])
+                return None
+            return engine.decrypt_bytes(base64.b64decode(payload.encode())).decode()
+        except Exception as e:
+            log.warning("Decryption error: %s", e)
+            return None
+
+    def needs_reencrypt(self, stored):
+        """True if a stored value was not written by the primary engine."""
+        engine, _ = self.engine_for(stored)
+        return engine is not self.primary
+
+    def encrypt_many(self, plaintexts):
+        """Encrypt a batch of strings (one engine lookup for the batch)."""
+        engine = self.primary
+        prefix = f"{engine.scheme}:{engine.key_id}:"
+        b64 = base64.b64encode
+        enc = engine.encrypt_bytes
+        return [prefix + b64(enc(p.encode())).decode() for p in plaintexts]
+
+    def decrypt_many(self, stored_values):
+        """Decrypt a batch of stored values; failures come back as None."""
+        return [self.decrypt(v) if v is not None else None for v in stored_values]
+
+
+def parse_keyring(spec):
+    """
+    Parse 'id=key,id=key' into a list of (key_id, key) pairs.
+
+    Raises:
+        ValueError: On an entry without '='
+    """
+    keys = []
+    for entry in filter(None, (part.strip() for part in (spec or "").split(","))):
+        key_id, sep, key = entry.partition("=")
+        if not sep or not key_id or not key:
+            raise ValueError(f"Bad key entry {entry!r}: expected id=key")
+        keys.append((key_id, key))
+    return keys
+
+
+def _engines_for(key, key_id):
+    engines = [XorCipher(key, key_id)]
+    if AESGCM is not None:
+        engines.append(AesGcmCipher(key, key_id))
+    return engines
+
+
+def vault_from_env(environ=os.environ):
+    """
+    Build the CardVault from the environment.
+
+    PAYMENT_KEY / PAYMENT_KEY_ID   current key, used for all new writes
+    PAYMENT_CIPHER                 gcm, xor or auto (see make_engine)
+    PAYMENT_PREVIOUS_KEYS          'id=key,...' still accepted for reads
+    PAYMENT_LEGACY_KEY             key of unprefixed simple_encrypt values
+                                   (defaults to PAYMENT_KEY)
+    """
+    key = environ.get("PAYMENT_KEY", DEFAULT_PAYMENT_KEY)
+    key_id = environ.get("PAYMENT_KEY_ID", PAYMENT_KEY_ID)
+    primary = make_engine(key, key_id, environ.get("PAYMENT_CIPHER", PAYMENT_CIPHER))
+
+    others = [e for e in _engines_for(key, key_id) if e.scheme != primary.scheme]
+    for old_id, old_key in parse_keyring(environ.get("PAYMENT_PREVIOUS_KEYS")):
+        if old_id == key_id:
+            raise ValueError(f"Previous key id {old_id!r} clashes with PAYMENT_KEY_ID")
+        others.extend(_engines_for(old_key, old_id))
+
+    return CardVault(primary, others, legacy_key=environ.get("PAYMENT_LEGACY_KEY", key))
@@ -0,0 +1,148 @@
+"""
+versions.py - Per-user resource version stamps for conditional GETs
+
+Handles:
+- A version counter per (user, resource) in user_resource_versions,
+  bumped by every write path inside its own transaction, so the stamp
+  commits (or rolls back) together with the change it describes
+- ETags built from that counter (plus anything else the response depends
+  on, e.g. the catalog version for product names and prices)
+- Answering If-None-Match with 304 Not Modified after reading only the
+  version row - the resource's own queries never run
+
+Resources:
+    account          GET /api/account/me
+    cart             GET /api/cart
+    orders           GET /api/orders
+    payment_methods  GET /api/payment-methods
+
+ETags are weak: a representation is the same whether or not it was
+compressed on the way out (see compression.py).
+"""
+
+import hashlib
+
+from flask import current_app, request
+
+ACCOUNT = "account"
+CART = "cart"
+ORDERS = "orders"
+PAYMENT_METHODS = "payment_methods"
+
+# Per-user responses: browsers may keep them, but must revalidate first
+PRIVATE_CACHE_CONTROL = "private, no-cache"
+
+VERSION_SQL = """
+    SELECT version FROM user_resource_versions
+    WHERE user_id = %s AND resource = %s
+"""
+
+
+def _bump(cur, pairs):
+    pairs = sorted(set(pairs))
+    if not pairs:
+        return
+    values = ", ".join(["(%s, %s, 1)"] * len(pairs))
+    cur.execute(
+        f"""
+        INSERT INTO user_resource_versions (user_id, resource, version)
+        VALUES {values}
+        ON DUPLICATE KEY UPDATE version = version + 1
+        """,
+        [value for pair in pairs for value in pair],
+    )
+
+
+def bump(cur, user_id, *resources):
+    """
+    Bump the user's version of each resource, in the caller's transaction.
+
+    Args:
+        cur: Cursor inside the write's open transaction
+        user_id: Owner of the resources
+        resources: ACCOUNT, CART, ORDERS and/or PAYMENT_METHODS
+    """
+    _bump(cur, [(user_id, resource) for resource in resources])
+
+
+def bump_many(cur, user_ids, resource):
+    """Bump one resource for several users at once (e.g. a cart flush)."""
+    _bump(cur, [(user_id, resource) for user_id in user_ids])
+
+
+def version_from(row):
+    """Version from a VERSION_SQL row (0 if the resource was never written)."""
+    if row is None:
+        return 0
+    return row["version"] if isinstance(row, dict) else row[0]
+
+
+def read_version(cur, user_id, resource):
+    """The user's current version of a resource."""
+    cur.execute(VERSION_SQL, (user_id, resource))
+    return version_from(cur.fetchone())
+
+
+def make_etag(resource, user_id, version, *parts):
+    """
+    Weak ETag for one user's view of a resource.
+
+    Args:
+        resource: Resource name
+        user_id: Owner
+        version: Current version of the resource
+        parts: Anything else the body depends on (catalog version, query
+               string, ...)
+
+    Returns:
+        str: Quoted weak ETag, e.g. W/"orders-3f9c0a1b2c4d5e6f"
+    """
+    key = repr((user_id, version) + parts).encode()
+    return f'W/"{resource}-{hashlib.blake2b(key, digest_size=8).hexdigest()}"'
+
+
+def etag_for(cur, resource, user_id, *parts):
+    """Read the resource's version and build its ETag (see make_etag)."""
+    return make_etag(resource, user_id, read_version(cur, user_id, resource), *parts)
+
+
+def etag_matches(etag, if_none_match):
+    """
+    Weak comparison of an ETag against an If-None-Match header.
+
+    Args:
+        etag: Our quoted ETag
+        if_none_match: Raw header value (may be None)
+    """
+    if not if_none_match:
+        return False
+    ours = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == ours:
+            return True
+    return False
+
+
+def not_modified(etag):
+    """
+    304 response if the client's copy is current, else None.
+
+    Used right after the version read, before the resource's own queries.
+    """
+    if not etag_matches(etag, request.headers.get("If-None-Match")):
+        return None
+    return current_app.response_class(
+        status=304, headers={"ETag": etag, "Cache-Control": PRIVATE_CACHE_CONTROL}
+    )
+
+
+def stamp(response, etag):
+    """Attach the ETag and private revalidation policy to a 200 response."""
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = PRIVATE_CACHE_CONTROL
+    return response
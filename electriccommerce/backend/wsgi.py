@@ -0,0 +1,13 @@
+"""
+wsgi.py - WSGI entry point for production servers
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+The app is built once at import. Under gunicorn's preload_app that happens
+in the master before it forks, so workers share the loaded code; each one
+opens its own DB pool and starts its own background work after the fork.
+"""
+
+from main import create_app
+
+app = create_app()
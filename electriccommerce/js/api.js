@@ -8,7 +8,13 @@ const headers = {
 };
 
 
-async function api(path, opts = {}) {
+/**
+ * Send a request and apply the shared status / network error handling.
+ * Returns the Response once it is OK (use api() for the parsed body).
+ * Errors thrown for an HTTP response carry its code in `error.status`
+ * (network errors have none).
+ */
+async function apiResponse(path, opts = {}) {
   const url = API_BASE + path;
   const config = {
     ...opts,
@@ -18,8 +24,10 @@ async function api(path, opts = {}) {
     },
   };
 
+  let status;
   try {
     const res = await fetch(url, config);
+    status = res.status;
 
     // ✅ Handle 401 Unauthorized - token is invalid or expired
     if (res.status === 401) {
@@ -81,7 +89,7 @@ async function api(path, opts = {}) {
       throw new Error(text || `HTTP ${res.status}`);
     }
 
-    return res.json();
+    return res;
 
   } catch (error) {
     // ✅ Handle network errors (server down, no internet)
@@ -91,10 +99,16 @@ async function api(path, opts = {}) {
     }
     
     // Re-throw other errors
+    if (status !== undefined && error.status === undefined) error.status = status;
     throw error;
   }
 }
 
+async function api(path, opts = {}) {
+  const res = await apiResponse(path, opts);
+  return res.json();
+}
+
 /**
  * Authenticated API call - automatically includes JWT token
  */
@@ -114,6 +128,32 @@ async function authedApi(path, opts = {}) {
   return api(path, { ...opts, headers: authedHeaders });
 }
 
+/**
+ * One page of an authenticated, keyset-paginated GET.
+ * Pass the previous page's nextCursor (or null for the first page).
+ * Errors go through the same handling as authedApi() and are thrown.
+ */
+async function authedApiPage(path, cursor = null, pageSize = 20) {
+  const token = localStorage.getItem("token");
+  if (!token) {
+    showError("Please log in to continue");
+    throw new Error("Not authenticated");
+  }
+
+  const sep = path.includes("?") ? "&" : "?";
+  let pagePath = `${path}${sep}limit=${pageSize}`;
+  if (cursor) pagePath += `&after=${encodeURIComponent(cursor)}`;
+
+  const res = await apiResponse(pagePath, {
+    headers: { Authorization: `Bearer ${token}` },
+  });
+
+  return {
+    rows: await res.json(),
+    nextCursor: res.headers.get("X-Next-Cursor"),
+  };
+}
+
 /**
  * Check if user is authenticated by validating token with backend
  * ✅ Validates against database, not just localStorage
@@ -1,25 +1,15 @@
 /**
  * cart.js - FIXED VERSION
  * Uses authedApi() for authentication
- * Uses cart_item_id (item.id) for PATCH/DELETE operations
+ * Uses cart_item_id (item.id) for cart operations
+ * Quantity changes are batched into one POST /cart/batch request
  */
 
 // Update cart badge in header
 async function updateCartBadge() {
   try {
     // ✅ FIX: Use authedApi instead of api
-    const cart = await authedApi("/cart");
-    const itemCount = cart.items.length;
-    const badge = document.getElementById("cartBadge");
-
-    if (!badge) return;
-
-    if (itemCount > 0) {
-      badge.textContent = itemCount;
-      badge.classList.add("show");
-    } else {
-      badge.classList.remove("show");
-    }
+    renderCartBadge(await authedApi("/cart"));
   } catch (e) {
     console.error("Badge update failed:", e);
   }
@@ -34,26 +24,45 @@ async function loadCart() {
 
   try {
     // ✅ FIX: Use authedApi instead of api
-    const cart = await authedApi("/cart");
-
-    if (!cart.items.length) {
-      container.innerHTML = '<div class="empty-message">Your cart is empty.</div>';
-      updateSummary(0);
-      return;
-    }
-
-    container.innerHTML = "";
-    cart.items.forEach(item => {
-      container.appendChild(createProductRow(item));
-    });
-
-    updateSummary(cart.subtotal);
+    renderCart(await authedApi("/cart"));
   } catch (e) {
     console.error("Error loading cart:", e);
     container.innerHTML = '<div class="empty-message">Error loading cart.</div>';
   }
 }
 
+// Draw the cart rows and summary from a cart response
+function renderCart(cart) {
+  const container = document.getElementById("cartProducts");
+  if (!container) return;
+
+  if (!cart.items.length) {
+    container.innerHTML = '<div class="empty-message">Your cart is empty.</div>';
+    updateSummary(0);
+    return;
+  }
+
+  container.innerHTML = "";
+  cart.items.forEach(item => {
+    container.appendChild(createProductRow(item));
+  });
+
+  updateSummary(cart.subtotal);
+}
+
+// Show the item count from a cart response in the header badge
+function renderCartBadge(cart) {
+  const badge = document.getElementById("cartBadge");
+  if (!badge) return;
+
+  if (cart.items.length > 0) {
+    badge.textContent = cart.items.length;
+    badge.classList.add("show");
+  } else {
+    badge.classList.remove("show");
+  }
+}
+
 function createProductRow(item) {
   // ✅ FIX: Extract cart_item_id from item.id (NOT productId)
   const cartItemId = item.id;  // This is the cart_items.id from database
@@ -132,7 +141,43 @@ function createProductRow(item) {
   return row;
 }
 
-// ✅ FIX: Use cartItemId and authedApi
+// Pending quantity changes by cart item id (0 = remove), sent together
+const pendingQty = new Map();
+let pendingTimer = null;
+const BATCH_DELAY_MS = 250;
+
+// Send every pending change as one batch and redraw from the result
+async function flushCartChanges() {
+  clearTimeout(pendingTimer);
+  pendingTimer = null;
+  if (!pendingQty.size) return;
+
+  const ops = [...pendingQty].map(([id, qty]) =>
+    qty > 0 ? { op: "set", id, qty } : { op: "remove", id }
+  );
+  pendingQty.clear();
+
+  try {
+    const cart = await authedApi("/cart/batch", {
+      method: "POST",
+      body: JSON.stringify({ ops })
+    });
+    renderCart(cart);
+    renderCartBadge(cart);
+  } catch (e) {
+    console.error("Failed to update cart:", e);
+    alert("Failed to update cart");
+    await loadCart();
+  }
+}
+
+function queueCartChange(cartItemId, qty) {
+  pendingQty.set(cartItemId, qty);
+  clearTimeout(pendingTimer);
+  pendingTimer = setTimeout(flushCartChanges, BATCH_DELAY_MS);
+}
+
+// ✅ FIX: Use cartItemId (quick +/- clicks are coalesced into one request)
 async function changeQty(cartItemId, newQty) {
   if (newQty <= 0) {
     if (confirm("Remove this item from cart?")) {
@@ -140,33 +185,16 @@ async function changeQty(cartItemId, newQty) {
     }
     return;
   }
-  try {
-    // ✅ FIX: Use authedApi and cartItemId in URL
-    await authedApi(`/cart/items/${cartItemId}`, {
-      method: "PATCH",
-      body: JSON.stringify({ qty: newQty })
-    });
-    await loadCart();
-    await updateCartBadge();
-  } catch (e) {
-    console.error("Failed to update quantity:", e);
-    alert("Failed to update quantity");
-  }
+  const row = document.querySelector(`.cart-product-row[data-cart-item-id="${cartItemId}"]`);
+  const input = row && row.querySelector(".quantity-input");
+  if (input) input.value = newQty;
+  queueCartChange(cartItemId, newQty);
 }
 
-// ✅ FIX: Use cartItemId and authedApi
+// ✅ FIX: Use cartItemId
 async function removeItem(cartItemId) {
-  try {
-    // ✅ FIX: Use authedApi and cartItemId in URL
-    await authedApi(`/cart/items/${cartItemId}`, {
-      method: "DELETE"
-    });
-    await loadCart();
-    await updateCartBadge();
-  } catch (e) {
-    console.error("Failed to remove item:", e);
-    alert("Failed to remove item");
-  }
+  pendingQty.set(cartItemId, 0);
+  await flushCartChanges();
 }
 
 function updateSummary(subtotal) {
@@ -200,6 +228,7 @@ function closeCart() {
 
 // Checkout
 async function checkout() {
+  await flushCartChanges();
   closeCart();
   window.location.href = "checkout.html";
 }
\ No newline at end of file
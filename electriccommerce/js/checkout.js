@@ -40,9 +40,17 @@ document.addEventListener("DOMContentLoaded", async () => {
   if (expEl) expEl.addEventListener("input", () => (touched.exp = true));
   if (cvvEl) cvvEl.addEventListener("input", () => (touched.cvv = true));
 
+  // ✅ ONE REQUEST FOR PROFILE, DEFAULT CARD AND CART
+  let summary = null;
+  try {
+    summary = await authedApi("/checkout/summary");
+  } catch (err) {
+    console.error("Failed to load checkout summary:", err);
+  }
+
   // ✅ AUTOFILL NAME, EMAIL, PHONE, ADDRESS FROM DATABASE
   try {
-    const account = await authedApi("/account/me");
+    const account = summary.profile;
     console.log("✓ Loaded account for checkout:", account);
 
     // First name
@@ -102,9 +110,11 @@ document.addEventListener("DOMContentLoaded", async () => {
 
   // ✅ AUTOFILL PAYMENT FROM DEFAULT CARD (INCLUDING CVV)
   try {
-    const defaultMethod = await authedApi("/payment-methods/default");
+    const defaultMethod = summary.paymentMethod;
 
-    if (defaultMethod) {
+    if (!defaultMethod) {
+      console.warn("No default payment method found");
+    } else {
       console.log("✓ Loaded default payment method");
 
       // Card number (masked)
@@ -136,7 +146,7 @@ document.addEventListener("DOMContentLoaded", async () => {
 
   // ✅ LOAD CART
   try {
-    const cart = await authedApi("/cart");
+    const cart = summary.cart;
     console.log("✓ Loaded cart:", cart);
 
     if (!cart.items || cart.items.length === 0) {
@@ -145,26 +155,21 @@ document.addEventListener("DOMContentLoaded", async () => {
       return;
     }
 
-    let subtotal = 0;
     summaryEl.innerHTML = "";
 
     cart.items.forEach((item) => {
       const lineTotal = item.price * item.qty;
-      subtotal += lineTotal;
 
       const div = document.createElement("div");
       div.textContent = `${item.productName || item.productId} x${item.qty}: $${lineTotal.toFixed(2)}`;
       summaryEl.appendChild(div);
     });
 
-    const taxRate = 0.08;
-    const tax = Math.round(subtotal * taxRate * 100) / 100;
-    const total = subtotal + tax;
-
+    // Totals come from the server so they match what the order will charge
     calcEl.innerHTML =
-      `Subtotal: $${subtotal.toFixed(2)}<br>` +
-      `Tax: $${tax.toFixed(2)}<br>` +
-      `Total: $${total.toFixed(2)}`;
+      `Subtotal: $${cart.subtotal.toFixed(2)}<br>` +
+      `Tax: $${cart.tax.toFixed(2)}<br>` +
+      `Total: $${cart.total.toFixed(2)}`;
   } catch (e) {
     console.error("Failed to load cart:", e);
     summaryEl.textContent = "Failed to load order.";
@@ -175,6 +180,14 @@ document.addEventListener("DOMContentLoaded", async () => {
   const btn = document.getElementById("place-order");
   if (!btn) return;
 
+  // Idempotency key for the current purchase attempt. It is reused whenever
+  // the same order is resubmitted after an answer that doesn't say the order
+  // was rejected, so a retry can never place a second order.
+  let pendingAttempt = null;
+
+  const isRejection = (status) =>
+    status >= 400 && status < 500 && ![408, 409, 425, 429].includes(status);
+
   btn.addEventListener("click", async () => {
     const first = firstInput.value.trim();
     const last = lastInput.value.trim();
@@ -190,27 +203,26 @@ document.addEventListener("DOMContentLoaded", async () => {
       return;
     }
 
-    try {
-      // Create order
-      const order = await authedApi("/orders", {
-        method: "POST",
-        body: JSON.stringify({
-          shippingName: `${first} ${last}`,
-          shippingEmail: email,
-          shippingPhone: phone,
-          shippingAddress: address,
-        }),
-      });
-
-      console.log("✓ Order created:", order);
+    const body = JSON.stringify({
+      shippingName: `${first} ${last}`,
+      shippingEmail: email,
+      shippingPhone: phone,
+      shippingAddress: address,
+    });
+    if (!pendingAttempt || pendingAttempt.body !== body) {
+      pendingAttempt = { key: crypto.randomUUID(), body };
+    }
 
-      // Process payment
-      await authedApi("/payments/mock", {
+    try {
+      // Create and pay for the order in one request
+      const order = await authedApi("/checkout", {
         method: "POST",
-        body: JSON.stringify({ orderId: order.id }),
+        headers: { "Idempotency-Key": pendingAttempt.key },
+        body,
       });
 
-      console.log("✓ Payment processed for order:", order.id);
+      console.log("✓ Order placed and paid:", order);
+      pendingAttempt = null;
 
       alert(
         `✓ Order placed successfully!\nOrder ID: ${order.id}\nTotal: $${order.total.toFixed(2)}`
@@ -218,6 +230,11 @@ document.addEventListener("DOMContentLoaded", async () => {
       window.location.href = "main.html";
     } catch (e) {
       console.error("Failed to place order:", e);
+      // Drop the key only when the server rejected the order (a 4xx other
+      // than 409 "still in progress" and the try-again-later codes). With no
+      // response, a 409 or a 5xx the order may exist, so the next click must
+      // resend the same key to get that order back instead of a second one.
+      if (isRejection(e.status)) pendingAttempt = null;
       alert("Failed to place order: " + e.message);
     }
   });
@@ -93,10 +93,28 @@ document.addEventListener("DOMContentLoaded", async () => {
   const searchInput = document.getElementById("search-input");
 
   if (searchForm && searchInput) {
-    searchForm.addEventListener("submit", (e) => {
+    // Autocomplete suggestions from /products/suggest
+    const suggestions = document.createElement("datalist");
+    suggestions.id = "search-suggestions";
+    searchForm.appendChild(suggestions);
+    searchInput.setAttribute("list", suggestions.id);
+    let suggestTimer = null;
+
+    searchForm.addEventListener("submit", async (e) => {
       e.preventDefault();
       const query = searchInput.value.trim().toLowerCase();
       const cards = document.querySelectorAll(".product-card");
+
+      // Ask the server which products match (name and description)
+      let matches = null;
+      if (query) {
+        try {
+          const results = await api(`/products/search?q=${encodeURIComponent(query)}&limit=200`);
+          matches = new Set(results.map((product) => product.id));
+        } catch (err) {
+          console.warn("Search failed, filtering by name:", err);
+        }
+      }
       
       cards.forEach((card) => {
         const nameAttr = (card.dataset.name || "").toLowerCase();
@@ -104,11 +122,8 @@ document.addEventListener("DOMContentLoaded", async () => {
         const overlayName = overlayNameEl ? overlayNameEl.textContent.toLowerCase() : "";
         const name = nameAttr || overlayName;
 
-        if (!query || name.includes(query)) {
-          card.style.display = "";
-        } else {
-          card.style.display = "none";
-        }
+        const visible = !query || (matches ? matches.has(card.dataset.id) : name.includes(query));
+        card.style.display = visible ? "" : "none";
       });
     });
 
@@ -118,6 +133,23 @@ document.addEventListener("DOMContentLoaded", async () => {
           card.style.display = "";
         });
       }
+
+      clearTimeout(suggestTimer);
+      const prefix = e.target.value.trim();
+      if (!prefix) return;
+      suggestTimer = setTimeout(async () => {
+        try {
+          const result = await api(`/products/suggest?prefix=${encodeURIComponent(prefix)}&limit=8`);
+          suggestions.innerHTML = "";
+          result.products.forEach((product) => {
+            const option = document.createElement("option");
+            option.value = product.name;
+            suggestions.appendChild(option);
+          });
+        } catch (err) {
+          console.warn("Suggestions unavailable:", err);
+        }
+      }, 150);
     });
   }
 });
\ No newline at end of file
@@ -1,4 +1,5 @@
 let allOrders = [];
+let nextCursor = null;    // X-Next-Cursor of the last page loaded
 let currentFilter = "30"; // default = last 30 days
 
 document.addEventListener("DOMContentLoaded", async () => {
@@ -10,6 +11,7 @@ document.addEventListener("DOMContentLoaded", async () => {
     }
 
     setupFilterButtons();
+    setupLoadMore();
     await loadOrders();
     applyFilterAndRender();
 });
@@ -29,44 +31,75 @@ function setupFilterButtons() {
     });
 }
 
-// Load orders from backend
+// "Load more" button: fetches the next page on demand
+function setupLoadMore() {
+    const btn = document.getElementById("load-more");
+    if (!btn) return;
+
+    btn.addEventListener("click", async () => {
+        btn.disabled = true;
+        const loaded = await loadOrders();
+        btn.disabled = false;
+        // On failure keep the error message in place of the list
+        if (loaded) applyFilterAndRender();
+    });
+}
+
+// Load the next page of orders from backend (newest first).
+// Returns false if the page could not be loaded.
 async function loadOrders() {
     const listEl = document.getElementById("orders-list");
 
     try {
-        // ✅ Use authedApi() instead of api()
-        const data = await authedApi("/orders");
+        // ✅ Orders are paginated - one page per call, more on demand
+        const page = await authedApiPage("/orders", nextCursor);
 
-        // Sort newest → oldest
-        data.sort((a, b) => new Date(b.createdAt) - new Date(a.createdAt));
-        allOrders = data;
+        allOrders = allOrders.concat(page.rows);
+        nextCursor = page.nextCursor;
+        return true;
     } catch (err) {
         console.error("Error loading orders:", err);
         if (listEl) {
             listEl.innerHTML = "<p>Failed to load your orders.</p>";
         }
+        return false;
     }
 }
 
+// Oldest order date the current filter shows (null = all time)
+function filterCutoff() {
+    const now = new Date();
+
+    if (currentFilter === "30" || currentFilter === "180") {
+        const cutoff = new Date(now);
+        cutoff.setDate(cutoff.getDate() - Number(currentFilter));
+        return cutoff;
+    }
+    if (currentFilter === "year") {
+        return new Date(now.getFullYear(), 0, 1);
+    }
+    return null;
+}
+
 // Apply current filter and re-render
 function applyFilterAndRender() {
-    const now = new Date();
+    const cutoff = filterCutoff();
     let filtered = allOrders.slice();
 
-    if (currentFilter === "30") {
-        const cutoff = new Date(now);
-        cutoff.setDate(cutoff.getDate() - 30);
-        filtered = filtered.filter(o => new Date(o.createdAt) >= cutoff);
-    } else if (currentFilter === "180") {
-        const cutoff = new Date(now);
-        cutoff.setDate(cutoff.getDate() - 180);
+    if (cutoff) {
         filtered = filtered.filter(o => new Date(o.createdAt) >= cutoff);
-    } else if (currentFilter === "year") {
-        const yearStart = new Date(now.getFullYear(), 0, 1);
-        filtered = filtered.filter(o => new Date(o.createdAt) >= yearStart);
     }
 
     renderOrders(filtered);
+
+    // Pages come newest first: once the oldest loaded order is past the
+    // cutoff, later pages can't add anything to this filter
+    const btn = document.getElementById("load-more");
+    if (btn) {
+        const oldest = allOrders[allOrders.length - 1];
+        const more = nextCursor && (!cutoff || !oldest || new Date(oldest.createdAt) >= cutoff);
+        btn.classList.toggle("hidden", !more);
+    }
 }
 
 // Rendering helpers
@@ -97,12 +130,10 @@ function orderToHtml(order) {
 
     const items = order.items || [];
 
-    // ✅ FIX: Use subtotal and tax from backend, then calculate correct total
+    // ✅ Subtotal, tax and total are stored on the order by the backend
     const subtotal = Number(order.subtotal || 0);
     const tax = Number(order.tax || 0);
-    
-    // ✅ FIXED: Total should be subtotal + tax
-    const total = subtotal + tax;
+    const total = Number(order.total || 0);
 
     const itemsHtml = items.map(itemToHtml).join("");
 
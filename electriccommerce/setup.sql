@@ -29,6 +29,13 @@ CREATE TABLE IF NOT EXISTS products (
   created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
+-- Indexes for keyset-paginated product listing (sort key, then id)
+CREATE INDEX idx_products_name
+  ON products (name, id);
+
+CREATE INDEX idx_products_price
+  ON products (price, id);
+
 -- Products
 INSERT INTO products (id, name, price) VALUES
  ('Refrigerator', 'Refrigerator', 500.00),
@@ -87,6 +94,9 @@ CREATE TABLE IF NOT EXISTS orders (
   id CHAR(12) NOT NULL PRIMARY KEY,  
   demo_token VARCHAR(64) NOT NULL,   
   user_id INT NULL,
+  -- Amounts computed once at checkout (total = subtotal + tax)
+  subtotal DECIMAL(10,2) NOT NULL,
+  tax DECIMAL(10,2) NOT NULL,
   total DECIMAL(10,2) NOT NULL,
   status ENUM('pending','paid','failed','cancelled') NOT NULL DEFAULT 'pending',
   created_at DATETIME NOT NULL,
@@ -143,3 +153,52 @@ CREATE TABLE IF NOT EXISTS payment_methods (
 
 CREATE INDEX idx_payment_methods_user
   ON payment_methods (user_id, is_default DESC, created_at DESC);
+
+
+-- Per-user resource versions (bumped in the same transaction as every
+-- write to the resource; conditional GETs read only this row, see versions.py)
+CREATE TABLE IF NOT EXISTS user_resource_versions (
+  user_id INT NOT NULL,
+  resource VARCHAR(32) NOT NULL,
+  version BIGINT UNSIGNED NOT NULL DEFAULT 1,
+  PRIMARY KEY (user_id, resource),
+  FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+
+-- Email Outbox (rows written in the same transaction as the order;
+-- drained by the background dispatcher in notifications.py)
+CREATE TABLE IF NOT EXISTS email_outbox (
+  id BIGINT AUTO_INCREMENT PRIMARY KEY,
+  kind VARCHAR(40) NOT NULL,
+  recipient VARCHAR(190) NOT NULL,
+  payload JSON NOT NULL,
+  status ENUM('pending','sending','sent','dead') NOT NULL DEFAULT 'pending',
+  attempts INT NOT NULL DEFAULT 0,
+  next_attempt_at DATETIME NOT NULL,
+  locked_until DATETIME NULL,
+  last_error TEXT NULL,
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  sent_at DATETIME NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE INDEX idx_email_outbox_due
+  ON email_outbox (status, next_attempt_at);
+
+
+-- Idempotency keys (inserted in the same transaction as the order or
+-- payment they guard; the response is stored once the request finishes,
+-- see idempotency.py)
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+  id BIGINT AUTO_INCREMENT PRIMARY KEY,
+  user_id INT NOT NULL,
+  route VARCHAR(100) NOT NULL,
+  idem_key VARCHAR(255) NOT NULL,
+  fingerprint BINARY(32) NOT NULL,
+  status_code SMALLINT NULL,
+  response_headers JSON NULL,
+  response_body MEDIUMBLOB NULL,
+  created_at DATETIME NOT NULL,
+  UNIQUE KEY uniq_idempotency_key (user_id, route, idem_key),
+  KEY idx_idempotency_created (created_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;